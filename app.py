@@ -1,20 +1,149 @@
 import gradio as gr
 import sqlite3
 import pandas as pd
+import numpy as np
 from datetime import datetime, time, timedelta, date
 import plotly.express as px
 import plotly.graph_objects as go
+import plotly.io as pio
 from plotly.subplots import make_subplots
 import calendar
 import random
 import json
+import os
+import glob
+import logging
+import threading
+import pickle
+import re
+import sys
+import tempfile
+import difflib
+import bisect
+import itertools
+import multiprocessing
+from time import perf_counter
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor, ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
 
 DB_FILE = "life_tracker.db"
 
+# Database maintenance
+BACKUP_DIR = "backups"
+BACKUP_KEEP = 7
+BACKUP_PAGES_PER_STEP = 256
+MAINTENANCE_INTERVAL_HOURS = 24
+RETENTION_MONTHS = 12
+CHANGE_LOG_RETENTION_DAYS = 90
+CHANGE_LOG_PAGE_SIZE = 1000
+
+SEARCH_PAGE_SIZE = 20
+TABLE_PAGE_SIZE = 25
+
+# Precomputed weekly and monthly reports
+REPORT_PERIODS = ["Weekly", "Monthly"]
+REPORT_SCHEDULE_TIMES = ["03:00"]
+REPORT_IDLE_MINUTES = 15
+REPORT_WORKERS = max(1, (os.cpu_count() or 2) - 1)
+# Workers must not be forked from the threaded app: a fork can copy a lock another thread holds
+REPORT_START_METHOD = "forkserver" if "forkserver" in multiprocessing.get_all_start_methods() else "spawn"
+REPORT_TIMEOUT_SECONDS = 600
+
+# Derived results kept on disk across restarts, and the startup warm-up of recent users
+WARM_CACHE_FILE = "life_tracker_cache.db"
+WARM_CACHE_FORMAT = 1  # bump when a cached payload changes shape; older entries are dropped
+WARM_START_USERS = 20
+WARM_START_SECONDS = 120
+
+# Routine every new profile starts from: (label, category, start, minutes)
+DEFAULT_ROUTINE = [
+    ("Wake up & Mindfulness", "Health", "05:00", 30),
+    ("Exercise", "Health", "05:30", 45),
+    ("Meditation", "Health", "06:15", 20),
+    ("Morning Walk with Nala", "Life", "06:35", 75),
+    ("Active Learning with Breakfast", "Life", "07:50", 60),
+    ("Work", "Work", "08:50", 210),
+    ("Lunch Break", "Life", "12:20", 30),
+    ("Work", "Work", "12:50", 240),
+]
+
+# Query-plan checks (python app.py --check-query-plans) and slow-statement logging
+QUERY_PLAN_BASELINE = os.path.join(os.path.dirname(os.path.abspath(__file__)), "query_plans.txt")
+QUERY_PLAN_USERS = 200
+QUERY_PLAN_DAYS = 365
+SQL_DEBUG = os.environ.get("LIFE_TRACKER_SQL_DEBUG") == "1"
+SLOW_QUERY_MS = float(os.environ.get("LIFE_TRACKER_SLOW_QUERY_MS", "50"))
+
+# Rows per chunk when streaming long activity histories
+HISTORY_CHUNK_SIZE = 50000
+
+# Drivers analysis: habits and hours on one day against scores up to this many days later
+DRIVER_MAX_LAG = 2
+DRIVER_MIN_DAYS = 5
+SCORE_COLUMNS = ['life_score', 'work_score', 'health_score']
+
+# Per-metric running statistics and anomaly flags
+STATS_EWM_ALPHA = 0.1
+ANOMALY_Z_THRESHOLD = 2.5
+ANOMALY_MIN_DAYS = 7
+
+# Sleep analytics: Sleep activities less than SLEEP_EPISODE_GAP_MINUTES apart form one episode
+SLEEP_CATEGORY = "Sleep"
+SLEEP_EPISODE_GAP_MINUTES = 60
+SLEEP_TARGET_HOURS = 8
+SLEEP_WINDOW_NIGHTS = 7  # nights in the rolling sleep debt and regularity windows
+SLEEP_SRI_EPOCH_MINUTES = 5
+SLEEP_WAKE_TOLERANCE_MINUTES = 30
+SLEEP_PANEL_NIGHTS = 30
+
+# Tables holding per-user rows, cleaned up when a profile is deleted
+USER_TABLES = [
+    "daily_activities",
+    "activity_summaries",
+    "activity_daily_summaries",
+    "qualitative_metrics",
+    "quantitative_metrics",
+    "goals",
+    "user_settings",
+    "subcategories",
+    "categories",
+    "daily_checklist",
+    "day_versions",
+    "metric_stats",
+    "report_store",
+    "routine_templates",
+    "routine_blocks",
+    "routine_adherence",
+    "sleep_nights",
+]
+
+logger = logging.getLogger("life_tracker")
+
 def create_tables():
     conn = create_connection()
     cursor = conn.cursor()
     
+    # WAL lets readers and online backups run alongside writers, and
+    # incremental auto-vacuum lets maintenance hand freed pages back to the OS.
+    # Switching an existing database to incremental mode needs a one-time VACUUM.
+    cursor.execute("PRAGMA journal_mode = WAL")
+    cursor.execute("PRAGMA auto_vacuum")
+    if cursor.fetchone()[0] != 2:
+        cursor.execute("PRAGMA auto_vacuum = INCREMENTAL")
+        cursor.execute("VACUUM")
+    
+    # Run the schema setup and any migrations as a single transaction
+    cursor.execute("BEGIN")
+    
+    # Older databases stored category names on every activity row; move those
+    # tables aside so they can be copied into the normalized schema below.
+    legacy_categories = "category" in _table_columns(cursor, "daily_activities")
+    if legacy_categories:
+        cursor.execute("ALTER TABLE daily_activities RENAME TO legacy_daily_activities")
+        if _table_columns(cursor, "activity_summaries"):
+            cursor.execute("ALTER TABLE activity_summaries RENAME TO legacy_activity_summaries")
+    
     cursor.execute('''
     CREATE TABLE IF NOT EXISTS users (
         id INTEGER PRIMARY KEY AUTOINCREMENT,
@@ -22,16 +151,83 @@ def create_tables():
     )
     ''')
     
+    # position orders the user's configured categories; it is NULL for
+    # categories that only exist because an activity was logged under them.
+    cursor.execute('''
+    CREATE TABLE IF NOT EXISTS categories (
+        id INTEGER PRIMARY KEY AUTOINCREMENT,
+        user_id INTEGER,
+        name TEXT,
+        position INTEGER,
+        UNIQUE (user_id, name),
+        FOREIGN KEY (user_id) REFERENCES users (id)
+    )
+    ''')
+    
+    cursor.execute('''
+    CREATE TABLE IF NOT EXISTS subcategories (
+        id INTEGER PRIMARY KEY AUTOINCREMENT,
+        user_id INTEGER,
+        category_id INTEGER,
+        name TEXT,
+        position INTEGER,
+        UNIQUE (category_id, name),
+        FOREIGN KEY (user_id) REFERENCES users (id),
+        FOREIGN KEY (category_id) REFERENCES categories (id)
+    )
+    ''')
+    cursor.execute("CREATE INDEX IF NOT EXISTS idx_subcategories_user ON subcategories (user_id, category_id)")
+    
     cursor.execute('''
     CREATE TABLE IF NOT EXISTS daily_activities (
         id INTEGER PRIMARY KEY AUTOINCREMENT,
         user_id INTEGER,
         date TEXT,
-        category TEXT,
-        subcategory TEXT,
+        category_id INTEGER,
+        subcategory_id INTEGER,
         start_time TEXT,
         end_time TEXT,
-        FOREIGN KEY (user_id) REFERENCES users (id)
+        FOREIGN KEY (user_id) REFERENCES users (id),
+        FOREIGN KEY (category_id) REFERENCES categories (id),
+        FOREIGN KEY (subcategory_id) REFERENCES subcategories (id)
+    )
+    ''')
+    cursor.execute("CREATE INDEX IF NOT EXISTS idx_daily_activities_user_date ON daily_activities (user_id, date)")
+    cursor.execute("CREATE INDEX IF NOT EXISTS idx_daily_activities_date ON daily_activities (date)")
+    cursor.execute("CREATE INDEX IF NOT EXISTS idx_daily_activities_subcategory ON daily_activities (subcategory_id, date)")
+    
+    # Monthly per-subcategory rollups of raw activities past the retention window
+    cursor.execute('''
+    CREATE TABLE IF NOT EXISTS activity_summaries (
+        id INTEGER PRIMARY KEY AUTOINCREMENT,
+        user_id INTEGER,
+        month TEXT,
+        category_id INTEGER,
+        subcategory_id INTEGER,
+        total_hours REAL,
+        activity_count INTEGER,
+        UNIQUE (user_id, month, category_id, subcategory_id),
+        FOREIGN KEY (user_id) REFERENCES users (id),
+        FOREIGN KEY (category_id) REFERENCES categories (id),
+        FOREIGN KEY (subcategory_id) REFERENCES subcategories (id)
+    )
+    ''')
+    cursor.execute("CREATE INDEX IF NOT EXISTS idx_activity_summaries_month ON activity_summaries (month)")
+    
+    # Per-day per-subcategory rollups of the same compacted activities, for the per-day analytics
+    cursor.execute('''
+    CREATE TABLE IF NOT EXISTS activity_daily_summaries (
+        id INTEGER PRIMARY KEY AUTOINCREMENT,
+        user_id INTEGER,
+        date TEXT,
+        category_id INTEGER,
+        subcategory_id INTEGER,
+        total_hours REAL,
+        activity_count INTEGER,
+        UNIQUE (user_id, date, category_id, subcategory_id),
+        FOREIGN KEY (user_id) REFERENCES users (id),
+        FOREIGN KEY (category_id) REFERENCES categories (id),
+        FOREIGN KEY (subcategory_id) REFERENCES subcategories (id)
     )
     ''')
     
@@ -73,6 +269,7 @@ def create_tables():
         FOREIGN KEY (user_id) REFERENCES users (id)
     )
     ''')
+    cursor.execute("CREATE INDEX IF NOT EXISTS idx_goals_user ON goals (user_id)")
     
     cursor.execute('''
     CREATE TABLE IF NOT EXISTS user_settings (
@@ -86,45 +283,839 @@ def create_tables():
     ''')
     
     cursor.execute('''
-    CREATE TABLE IF NOT EXISTS custom_categories (
+    CREATE TABLE IF NOT EXISTS daily_checklist (
         id INTEGER PRIMARY KEY AUTOINCREMENT,
         user_id INTEGER,
-        category_name TEXT,
-        subcategories TEXT,
+        date TEXT,
+        checklist_data TEXT,
+        notes TEXT,
+        FOREIGN KEY (user_id) REFERENCES users (id)
+    )
+    ''')
+    
+    cursor.execute("CREATE INDEX IF NOT EXISTS idx_qualitative_metrics_date ON qualitative_metrics (date)")
+    
+    # Running statistics of each daily metric. n/mean/m2 are Welford accumulators over all days;
+    # ewm_* is the exponentially weighted state after last_date and prev_ewm_* the state before it.
+    cursor.execute('''
+    CREATE TABLE IF NOT EXISTS metric_stats (
+        user_id INTEGER,
+        metric TEXT,
+        n INTEGER NOT NULL DEFAULT 0,
+        mean REAL NOT NULL DEFAULT 0,
+        m2 REAL NOT NULL DEFAULT 0,
+        ewm_mean REAL,
+        ewm_var REAL,
+        prev_ewm_mean REAL,
+        prev_ewm_var REAL,
+        last_date TEXT,
+        stale INTEGER NOT NULL DEFAULT 0,
+        PRIMARY KEY (user_id, metric),
         FOREIGN KEY (user_id) REFERENCES users (id)
     )
     ''')
     
+    # Bumped in the same transaction as every write; user_id 0 counts writes to the whole database
     cursor.execute('''
-    CREATE TABLE IF NOT EXISTS daily_checklist (
-        id INTEGER PRIMARY KEY AUTOINCREMENT,
+    CREATE TABLE IF NOT EXISTS data_versions (
+        user_id INTEGER PRIMARY KEY,
+        version INTEGER NOT NULL DEFAULT 0
+    )
+    ''')
+    
+    # Append-only record of every write: which user, table and day changed and how.
+    # AUTOINCREMENT keeps sequence numbers from being reused after old entries are pruned.
+    cursor.execute('''
+    CREATE TABLE IF NOT EXISTS change_log (
+        seq INTEGER PRIMARY KEY AUTOINCREMENT,
         user_id INTEGER,
+        table_name TEXT NOT NULL,
         date TEXT,
-        checklist_data TEXT,
-        notes TEXT,
+        op TEXT NOT NULL,
+        changed_at TEXT NOT NULL DEFAULT CURRENT_TIMESTAMP
+    )
+    ''')
+    cursor.execute("CREATE INDEX IF NOT EXISTS idx_change_log_user_seq ON change_log (user_id, seq)")
+    
+    # The user's data version at the last write touching each day, so consumers can
+    # find the days that changed since they last looked
+    cursor.execute('''
+    CREATE TABLE IF NOT EXISTS day_versions (
+        user_id INTEGER,
+        date TEXT,
+        version INTEGER NOT NULL,
+        PRIMARY KEY (user_id, date)
+    )
+    ''')
+    cursor.execute("CREATE INDEX IF NOT EXISTS idx_day_versions_user_version ON day_versions (user_id, version)")
+    
+    # Latest weekly and monthly report per user, as JSON with per-day data and figure specs
+    cursor.execute('''
+    CREATE TABLE IF NOT EXISTS report_store (
+        user_id INTEGER,
+        period TEXT,
+        data_version INTEGER NOT NULL,
+        computed_at TEXT,
+        payload TEXT,
+        PRIMARY KEY (user_id, period),
+        FOREIGN KEY (user_id) REFERENCES users (id)
+    )
+    ''')
+    
+    # Planned daily routines; each user follows one active template at a time
+    cursor.execute('''
+    CREATE TABLE IF NOT EXISTS routine_templates (
+        id INTEGER PRIMARY KEY,
+        user_id INTEGER,
+        name TEXT,
+        active INTEGER NOT NULL DEFAULT 0,
+        UNIQUE (user_id, name),
         FOREIGN KEY (user_id) REFERENCES users (id)
     )
     ''')
+    cursor.execute('''
+    CREATE TABLE IF NOT EXISTS routine_blocks (
+        id INTEGER PRIMARY KEY,
+        user_id INTEGER,
+        template_id INTEGER,
+        position INTEGER,
+        label TEXT,
+        category_id INTEGER,
+        start_time TEXT,
+        duration_minutes INTEGER,
+        FOREIGN KEY (template_id) REFERENCES routine_templates (id),
+        FOREIGN KEY (category_id) REFERENCES categories (id)
+    )
+    ''')
+    cursor.execute("CREATE INDEX IF NOT EXISTS idx_routine_blocks_template ON routine_blocks (template_id, position)")
+    
+    # Plan-vs-actual results for finalized days, valid while day_version matches day_versions
+    cursor.execute('''
+    CREATE TABLE IF NOT EXISTS routine_adherence (
+        user_id INTEGER,
+        date TEXT,
+        block_id INTEGER,
+        planned_minutes REAL,
+        covered_minutes REAL,
+        drift_minutes REAL,
+        missed INTEGER,
+        day_version INTEGER NOT NULL,
+        PRIMARY KEY (user_id, date, block_id)
+    )
+    ''')
+    
+    # One row per user and night, keyed by the date of waking up. day_version is the
+    # newer of the versions of that day and the day before.
+    cursor.execute('''
+    CREATE TABLE IF NOT EXISTS sleep_nights (
+        user_id INTEGER,
+        night TEXT,
+        sleep_start TEXT,
+        sleep_end TEXT,
+        asleep_minutes REAL,
+        in_bed_minutes REAL,
+        midpoint_minutes REAL,
+        nap_minutes REAL,
+        wake_up_minutes REAL,
+        wake_diff_minutes REAL,
+        day_version INTEGER NOT NULL,
+        PRIMARY KEY (user_id, night)
+    )
+    ''')
+    
+    # One metrics and checklist row per user and day. Older versions appended a row
+    # on every "Log Metrics" or "Save Daily Checklist" click; each click wrote the whole
+    # form, so the most recently written row (highest id) wins and earlier duplicates are dropped.
+    for table in ("qualitative_metrics", "quantitative_metrics", "daily_checklist"):
+        index_name = f"idx_{table}_user_date"
+        cursor.execute("SELECT 1 FROM sqlite_master WHERE type = 'index' AND name = ?", (index_name,))
+        if cursor.fetchone() is None:
+            cursor.execute(f'''
+            DELETE FROM {table}
+            WHERE id NOT IN (SELECT MAX(id) FROM {table} GROUP BY user_id, date)
+            ''')
+            cursor.execute(f"CREATE UNIQUE INDEX {index_name} ON {table} (user_id, date)")
+    
+    if _table_columns(cursor, "custom_categories"):
+        _migrate_custom_categories(cursor)
+    if legacy_categories:
+        _migrate_legacy_activities(cursor)
+    
+    _create_search_index(cursor)
+    
+    # Users created before routines were seeded with the profile start from the default plan
+    cursor.execute('''
+    SELECT u.id, u.name FROM users u
+    WHERE NOT EXISTS (SELECT 1 FROM routine_templates t WHERE t.user_id = u.id)
+    ''')
+    for user_id, user_name in cursor.fetchall():
+        _write_routine_template(cursor, user_id, _NEW_USER_CATALOG, "Default", DEFAULT_ROUTINE)
+        _record_change(cursor, user_name, "routine_blocks", "insert")
+    
+    conn.commit()
+    
+    # Users with history but no running statistics (databases from before metric_stats
+    # existed) get a one-time rebuild, so anomaly flags cover their existing days
+    cursor.execute('''
+    SELECT u.name FROM users u
+    WHERE NOT EXISTS (SELECT 1 FROM metric_stats s WHERE s.user_id = u.id)
+      AND (EXISTS (SELECT 1 FROM daily_activities a WHERE a.user_id = u.id)
+           OR EXISTS (SELECT 1 FROM qualitative_metrics q WHERE q.user_id = u.id)
+           OR EXISTS (SELECT 1 FROM quantitative_metrics m WHERE m.user_id = u.id))
+    ''')
+    missing_stats = [row[0] for row in cursor.fetchall()]
+    conn.close()
+    for user_name in missing_stats:
+        rebuild_metric_stats(user_name)
+
+def _create_search_index(cursor):
+    # External-content FTS5 indexes over daily notes and subcategory names, kept in sync by triggers
+    fts_tables = {
+        "daily_notes_fts": ("daily_checklist", "notes"),
+        "subcategories_fts": ("subcategories", "name"),
+    }
+    for fts_table, (source, column) in fts_tables.items():
+        cursor.execute("SELECT 1 FROM sqlite_master WHERE name = ?", (fts_table,))
+        exists = cursor.fetchone() is not None
+        cursor.execute(f"""
+        CREATE VIRTUAL TABLE IF NOT EXISTS {fts_table}
+        USING fts5({column}, content='{source}', content_rowid='id')
+        """)
+        cursor.execute(f"""
+        CREATE TRIGGER IF NOT EXISTS {source}_fts_insert AFTER INSERT ON {source} BEGIN
+            INSERT INTO {fts_table} (rowid, {column}) VALUES (new.id, new.{column});
+        END
+        """)
+        cursor.execute(f"""
+        CREATE TRIGGER IF NOT EXISTS {source}_fts_delete AFTER DELETE ON {source} BEGIN
+            INSERT INTO {fts_table} ({fts_table}, rowid, {column}) VALUES ('delete', old.id, old.{column});
+        END
+        """)
+        cursor.execute(f"""
+        CREATE TRIGGER IF NOT EXISTS {source}_fts_update AFTER UPDATE OF {column} ON {source} BEGIN
+            INSERT INTO {fts_table} ({fts_table}, rowid, {column}) VALUES ('delete', old.id, old.{column});
+            INSERT INTO {fts_table} (rowid, {column}) VALUES (new.id, new.{column});
+        END
+        """)
+        # One-time backfill of rows written before the index existed
+        if not exists:
+            cursor.execute(f"INSERT INTO {fts_table} ({fts_table}) VALUES ('rebuild')")
+
+def _table_columns(cursor, table):
+    cursor.execute(f"PRAGMA table_info({table})")
+    return [row[1] for row in cursor.fetchall()]
+
+def _migrate_custom_categories(cursor):
+    # Split the comma-joined subcategory lists into rows, keeping their order
+    cursor.execute("SELECT user_id, category_name, subcategories FROM custom_categories ORDER BY id")
+    positions = {}
+    for user_id, category_name, subcategories in cursor.fetchall():
+        position = positions.get(user_id, 0)
+        positions[user_id] = position + 1
+        cursor.execute('''
+        INSERT INTO categories (user_id, name, position) VALUES (?, ?, ?)
+        ON CONFLICT (user_id, name) DO UPDATE SET position = excluded.position
+        ''', (user_id, category_name, position))
+        cursor.execute("SELECT id FROM categories WHERE user_id = ? AND name = ?", (user_id, category_name))
+        category_id = cursor.fetchone()[0]
+        names = [name for name in (subcategories or "").split(',') if name]
+        for sub_position, name in enumerate(names):
+            cursor.execute('''
+            INSERT INTO subcategories (user_id, category_id, name, position) VALUES (?, ?, ?, ?)
+            ON CONFLICT (category_id, name) DO UPDATE SET position = excluded.position
+            ''', (user_id, category_id, name, sub_position))
+    cursor.execute("DROP TABLE custom_categories")
+
+def _migrate_legacy_activities(cursor):
+    legacy_tables = ["legacy_daily_activities"]
+    if _table_columns(cursor, "legacy_activity_summaries"):
+        legacy_tables.append("legacy_activity_summaries")
+    
+    for table in legacy_tables:
+        cursor.execute(f'''
+        INSERT OR IGNORE INTO categories (user_id, name)
+        SELECT DISTINCT user_id, category FROM {table}
+        WHERE user_id IS NOT NULL AND category IS NOT NULL
+        ''')
+        cursor.execute(f'''
+        INSERT OR IGNORE INTO subcategories (user_id, category_id, name)
+        SELECT DISTINCT l.user_id, c.id, l.subcategory
+        FROM {table} l
+        JOIN categories c ON c.user_id = l.user_id AND c.name = l.category
+        WHERE l.subcategory IS NOT NULL
+        ''')
+    
+    cursor.execute('''
+    INSERT INTO daily_activities (id, user_id, date, category_id, subcategory_id, start_time, end_time)
+    SELECT l.id, l.user_id, l.date, c.id, s.id, l.start_time, l.end_time
+    FROM legacy_daily_activities l
+    LEFT JOIN categories c ON c.user_id = l.user_id AND c.name = l.category
+    LEFT JOIN subcategories s ON s.category_id = c.id AND s.name = l.subcategory
+    ''')
+    cursor.execute("DROP TABLE legacy_daily_activities")
+    
+    if "legacy_activity_summaries" in legacy_tables:
+        cursor.execute('''
+        INSERT INTO activity_summaries (id, user_id, month, category_id, subcategory_id, total_hours, activity_count)
+        SELECT l.id, l.user_id, l.month, c.id, s.id, l.total_hours, l.activity_count
+        FROM legacy_activity_summaries l
+        LEFT JOIN categories c ON c.user_id = l.user_id AND c.name = l.category
+        LEFT JOIN subcategories s ON s.category_id = c.id AND s.name = l.subcategory
+        ''')
+        cursor.execute("DROP TABLE legacy_activity_summaries")
+
+# Named data-layer statements with the indexes their plans must use and sample parameters
+# to EXPLAIN them with against the seeded plan-check database
+SQL_STATEMENTS = {}
+
+def register_statement(name, sql, indexes, params):
+    SQL_STATEMENTS[name] = {"sql": sql, "indexes": indexes, "params": params}
+    return sql
+
+def _render_plan(rows):
+    # EXPLAIN QUERY PLAN rows as indented lines, children under their parent step
+    depth = {0: -1}
+    lines = []
+    for step_id, parent, _, detail in rows:
+        depth[step_id] = depth.get(parent, -1) + 1
+        lines.append('  ' * depth[step_id] + detail)
+    return lines
+
+class _TimedCursor(sqlite3.Cursor):
+    # Logs statements slower than SLOW_QUERY_MS together with their query plan
+    def execute(self, sql, parameters=()):
+        started = perf_counter()
+        result = super().execute(sql, parameters)
+        elapsed_ms = (perf_counter() - started) * 1000
+        if elapsed_ms >= SLOW_QUERY_MS:
+            plan = []
+            if (sql.split(None, 1) or [""])[0].upper() in ("SELECT", "WITH", "INSERT", "UPDATE", "DELETE", "REPLACE"):
+                explain = sqlite3.Connection.cursor(self.connection)
+                plan = _render_plan(explain.execute("EXPLAIN QUERY PLAN " + sql, parameters).fetchall())
+            logger.warning("Slow statement (%.1f ms):\n%s\nPlan:\n%s", elapsed_ms, sql.strip(), '\n'.join(plan))
+        return result
+
+class _TimedConnection(sqlite3.Connection):
+    def cursor(self, factory=None):
+        return super().cursor(factory or _TimedCursor)
+    
+    def execute(self, sql, parameters=()):
+        return self.cursor().execute(sql, parameters)
+
+# Set in report worker processes, which only ever read
+_read_only_connections = False
+
+def create_connection(read_only=False):
+    factory = _TimedConnection if SQL_DEBUG else sqlite3.Connection
+    if read_only or _read_only_connections:
+        return sqlite3.connect(f"file:{DB_FILE}?mode=ro", uri=True, factory=factory)
+    return sqlite3.connect(DB_FILE, factory=factory)
+
+def _bump_data_version(cursor, user_name=None, dates=()):
+    # A user's first version continues from the global one, so a profile deleted and recreated
+    # under the same name never repeats a version that caches keyed by name may still hold
+    note_interaction()
+    cursor.execute('''
+    INSERT INTO data_versions (user_id, version)
+    SELECT id, COALESCE((SELECT version FROM data_versions WHERE user_id = 0), 0) + 1 FROM users WHERE name = ?
+    UNION ALL
+    SELECT 0, 1
+    ON CONFLICT (user_id) DO UPDATE SET version = version + 1
+    ''', (user_name,))
+    cursor.executemany('''
+    INSERT INTO day_versions (user_id, date, version)
+    SELECT u.id, ?, v.version
+    FROM users u JOIN data_versions v ON v.user_id = u.id
+    WHERE u.name = ?
+    ON CONFLICT (user_id, date) DO UPDATE SET version = excluded.version
+    ''', [(str(day), user_name) for day in dates])
+
+def _log_changes(cursor, user_name, table, op, dates=()):
+    # One change_log entry per affected day, or a single undated entry
+    rows = [(user_name, table, str(day), op) for day in dates] or [(user_name, table, None, op)]
+    cursor.executemany('''
+    INSERT INTO change_log (user_id, table_name, date, op)
+    VALUES ((SELECT id FROM users WHERE name = ?), ?, ?, ?)
+    ''', rows)
+
+def _record_change(cursor, user_name, table, op, dates=()):
+    # Log a write and bump the data versions in the caller's transaction
+    _log_changes(cursor, user_name, table, op, dates)
+    _bump_data_version(cursor, user_name, dates)
+
+def _changes_since_sql(by_user=False, table_count=0):
+    conditions = ["l.seq > ?"]
+    if by_user:
+        conditions.append("l.user_id = (SELECT id FROM users WHERE name = ?)")
+    if table_count:
+        conditions.append(f"l.table_name IN ({', '.join('?' * table_count)})")
+    return f'''
+    SELECT l.seq, l.user_id, u.name AS user_name, l.table_name, l.date, l.op, l.changed_at
+    FROM change_log l
+    LEFT JOIN users u ON u.id = l.user_id
+    WHERE {' AND '.join(conditions)}
+    ORDER BY l.seq
+    LIMIT ?
+    '''
+
+register_statement("changes_since", _changes_since_sql(), [], (0, 100))
+register_statement("changes_since_user", _changes_since_sql(by_user=True), ["idx_change_log_user_seq"], (0, "plan-user-0000", 100))
+
+def get_changes_since(seq=0, user_name=None, tables=None, limit=CHANGE_LOG_PAGE_SIZE):
+    # Returns (changes after seq in order, cursor to pass next time). Raises ValueError when
+    # entries after seq were already pruned, in which case the consumer has to rescan.
+    conn = create_connection()
+    cursor = conn.cursor()
+    cursor.execute('''
+    SELECT COALESCE((SELECT MIN(seq) FROM change_log),
+                    (SELECT seq + 1 FROM sqlite_sequence WHERE name = 'change_log'), 1)
+    ''')
+    oldest = cursor.fetchone()[0]
+    if seq + 1 < oldest:
+        conn.close()
+        raise ValueError(f"Changes after {seq} were pruned; the oldest retained change is {oldest}")
     
+    params = [seq]
+    if user_name is not None:
+        params.append(user_name)
+    if tables:
+        params.extend(tables)
+    query = _changes_since_sql(user_name is not None, len(tables or ()))
+    changes = pd.read_sql_query(query, conn, params=(*params, limit))
+    conn.close()
+    next_seq = int(changes['seq'].iloc[-1]) if not changes.empty else seq
+    return changes, next_seq
+
+def prune_change_log(retention_days=CHANGE_LOG_RETENTION_DAYS):
+    conn = create_connection()
+    cursor = conn.cursor()
+    cursor.execute("DELETE FROM change_log WHERE changed_at < datetime('now', ?)", (f"-{int(retention_days)} days",))
+    pruned = cursor.rowcount
     conn.commit()
     conn.close()
+    return pruned
+
+DATA_VERSION_SQL = register_statement("data_version", '''
+    SELECT version FROM data_versions WHERE user_id = (SELECT id FROM users WHERE name = ?)
+    ''', ["sqlite_autoindex_users_1"], ("plan-user-0000",))
+
+def get_data_version(user_name=None):
+    # Version of one user's data, or of the whole database when no user is given
+    conn = create_connection()
+    cursor = conn.cursor()
+    if user_name is None:
+        cursor.execute("SELECT version FROM data_versions WHERE user_id = 0")
+    else:
+        cursor.execute(DATA_VERSION_SQL, (user_name,))
+    row = cursor.fetchone()
+    conn.close()
+    return row[0] if row else 0
+
+def _wake_up_minutes(wake_up_time):
+    try:
+        hours, minutes = str(wake_up_time).split(':')[:2]
+        return int(hours) * 60 + int(minutes)
+    except ValueError:
+        return None
+
+def _duration_hours_sql(alias=""):
+    # Hours from start to end; an end time earlier than the start is on the next day
+    return (f"((julianday({alias}date || ' ' || {alias}end_time) - julianday({alias}date || ' ' || {alias}start_time)) * 24"
+            f" + CASE WHEN {alias}end_time < {alias}start_time THEN 24 ELSE 0 END)")
+
+CATEGORY_HOURS_FOR_DAY_SQL = register_statement("category_hours_for_day", f'''
+    SELECT c.name, SUM(h.hours)
+    FROM (
+        SELECT category_id, {_duration_hours_sql()} AS hours
+        FROM daily_activities
+        WHERE user_id = (SELECT id FROM users WHERE name = :user_name) AND date = :date
+        UNION ALL
+        SELECT category_id, total_hours
+        FROM activity_daily_summaries
+        WHERE user_id = (SELECT id FROM users WHERE name = :user_name) AND date = :date
+    ) h
+    JOIN categories c ON c.id = h.category_id
+    GROUP BY c.name
+    ''', ["idx_daily_activities_user_date", "sqlite_autoindex_activity_daily_summaries_1"],
+    {"user_name": "plan-user-0000", "date": "2025-03-01"})
+
+def _daily_metric_values(cursor, user_name, date):
+    # Every tracked metric's value for one user and day, read inside the caller's transaction
+    cursor.execute(CATEGORY_HOURS_FOR_DAY_SQL, {"user_name": user_name, "date": date})
+    values = {f"{name} hours": hours for name, hours in cursor.fetchall()}
+    
+    cursor.execute(QUALITATIVE_FOR_DAY_SQL, (user_name, date))
+    row = cursor.fetchone()
+    if row:
+        values.update(zip(SCORE_COLUMNS, row))
+    
+    cursor.execute(QUANTITATIVE_FOR_DAY_SQL, (user_name, date))
+    row = cursor.fetchone()
+    if row:
+        values.update(zip(['workouts', 'meditation_minutes', 'brain_training_minutes'], row[1:]))
+        values['wake_up_minutes'] = _wake_up_minutes(row[0])
+    return {metric: float(value) for metric, value in values.items() if value is not None}
+
+def _ewm_step(mean, var, value):
+    if mean is None:
+        return value, 0.0
+    diff = value - mean
+    increment = STATS_EWM_ALPHA * diff
+    return mean + increment, (1 - STATS_EWM_ALPHA) * (var + diff * increment)
+
+METRIC_STATS_FOR_METRIC_SQL = register_statement("metric_stats_for_metric", '''
+    SELECT n, mean, m2, ewm_mean, ewm_var, prev_ewm_mean, prev_ewm_var, last_date, stale
+    FROM metric_stats WHERE user_id = (SELECT id FROM users WHERE name = ?) AND metric = ?
+    ''', ["sqlite_autoindex_metric_stats_1"], ("plan-user-0000", "Work hours"))
+
+def _update_metric_stats(cursor, user_name, date, before, after):
+    # Fold one day's change (old value out, new value in) into each metric's running statistics
+    for metric in set(before) | set(after):
+        old, new = before.get(metric), after.get(metric)
+        if old == new:
+            continue
+        cursor.execute(METRIC_STATS_FOR_METRIC_SQL, (user_name, metric))
+        n, mean, m2, ewm_mean, ewm_var, prev_ewm_mean, prev_ewm_var, last_date, stale = \
+            cursor.fetchone() or (0, 0.0, 0.0, None, None, None, None, None, 0)
+        
+        if old is not None:
+            if n <= 1:
+                n, mean, m2 = 0, 0.0, 0.0
+            else:
+                old_mean = mean
+                mean = (n * mean - old) / (n - 1)
+                m2 = max(0.0, m2 - (old - mean) * (old - old_mean))
+                n -= 1
+        if new is not None:
+            n += 1
+            delta = new - mean
+            mean += delta / n
+            m2 += delta * (new - mean)
+        
+        # The weighted state only moves forward in time; edits to earlier days mark it for rebuild
+        if stale:
+            pass
+        elif last_date is None or date > last_date:
+            if new is not None:
+                prev_ewm_mean, prev_ewm_var = ewm_mean, ewm_var
+                ewm_mean, ewm_var = _ewm_step(ewm_mean, ewm_var, new)
+                last_date = date
+        elif date == last_date and new is not None:
+            ewm_mean, ewm_var = _ewm_step(prev_ewm_mean, prev_ewm_var, new)
+        else:
+            stale = 1
+        
+        cursor.execute('''
+        INSERT OR REPLACE INTO metric_stats
+            (user_id, metric, n, mean, m2, ewm_mean, ewm_var, prev_ewm_mean, prev_ewm_var, last_date, stale)
+        VALUES ((SELECT id FROM users WHERE name = ?), ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
+        ''', (user_name, metric, n, mean, m2, ewm_mean, ewm_var, prev_ewm_mean, prev_ewm_var, last_date, stale))
+
+# Per-user category catalogs, loaded once and dropped whenever categories change
+_category_catalogs = {}
+_category_catalog_lock = threading.Lock()
+# Bumped per user, and for everyone, on invalidation so a load that raced with a change is never stored
+_category_catalog_generations = {}
+_category_catalog_epoch = 0
+
+CATALOG_CATEGORIES_SQL = register_statement("catalog_categories", '''
+    SELECT id, name, position FROM categories WHERE user_id = ? ORDER BY position, id
+    ''', ["sqlite_autoindex_categories_1"], (1,))
+
+CATALOG_SUBCATEGORIES_SQL = register_statement("catalog_subcategories", '''
+    SELECT id, category_id, name, position FROM subcategories
+    WHERE user_id = ? ORDER BY position, id
+    ''', ["idx_subcategories_user"], (1,))
+
+def _load_category_catalog(user_name):
+    conn = create_connection()
+    cursor = conn.cursor()
+    cursor.execute("SELECT id FROM users WHERE name = ?", (user_name,))
+    row = cursor.fetchone()
+    user_id = row[0] if row else None
+    
+    cursor.execute(CATALOG_CATEGORIES_SQL, (user_id,))
+    category_rows = cursor.fetchall()
+    cursor.execute(CATALOG_SUBCATEGORIES_SQL, (user_id,))
+    subcategory_rows = cursor.fetchall()
+    conn.close()
+    
+    category_names = {category_id: name for category_id, name, _ in category_rows}
+    custom_categories = [name for _, name, position in category_rows if position is not None]
+    custom_subcategories = {name: [] for name in custom_categories}
+    for _, category_id, name, position in subcategory_rows:
+        category_name = category_names.get(category_id)
+        if position is not None and category_name in custom_subcategories:
+            custom_subcategories[category_name].append(name)
+    
+    return {
+        "user_id": user_id,
+        "category_ids": {name: category_id for category_id, name in category_names.items()},
+        "category_names": category_names,
+        "custom_category_ids": [category_id for category_id, _, position in category_rows if position is not None],
+        "subcategory_ids": {(category_id, name): sub_id for sub_id, category_id, name, _ in subcategory_rows},
+        "subcategory_names": {sub_id: name for sub_id, _, name, _ in subcategory_rows},
+        "custom_categories": custom_categories,
+        "custom_subcategories": custom_subcategories,
+    }
+
+def get_category_catalog(user_name):
+    with _category_catalog_lock:
+        catalog = _category_catalogs.get(user_name)
+        generation = (_category_catalog_epoch, _category_catalog_generations.get(user_name, 0))
+    if catalog is None:
+        catalog = _load_category_catalog(user_name)
+        with _category_catalog_lock:
+            if (_category_catalog_epoch, _category_catalog_generations.get(user_name, 0)) == generation:
+                _category_catalogs[user_name] = catalog
+    return catalog
+
+def invalidate_category_catalog(user_name=None):
+    global _category_catalog_epoch
+    with _category_catalog_lock:
+        if user_name is None:
+            _category_catalogs.clear()
+            _category_catalog_epoch += 1
+        else:
+            _category_catalogs.pop(user_name, None)
+            _category_catalog_generations[user_name] = _category_catalog_generations.get(user_name, 0) + 1
+
+def _resolve_category_ids(cursor, user_id, catalog, category, subcategory):
+    # Returns (category_id, subcategory_id, created), creating missing rows in the caller's transaction
+    if user_id is None or category is None:
+        return None, None, False
+    created = False
+    category_id = catalog["category_ids"].get(category)
+    if category_id is None:
+        cursor.execute("INSERT OR IGNORE INTO categories (user_id, name) VALUES (?, ?)", (user_id, category))
+        cursor.execute("SELECT id FROM categories WHERE user_id = ? AND name = ?", (user_id, category))
+        category_id = cursor.fetchone()[0]
+        created = True
+    if subcategory is None:
+        return category_id, None, created
+    subcategory_id = catalog["subcategory_ids"].get((category_id, subcategory))
+    if subcategory_id is None:
+        cursor.execute('''
+        INSERT OR IGNORE INTO subcategories (user_id, category_id, name) VALUES (?, ?, ?)
+        ''', (user_id, category_id, subcategory))
+        cursor.execute("SELECT id FROM subcategories WHERE category_id = ? AND name = ?", (category_id, subcategory))
+        subcategory_id = cursor.fetchone()[0]
+        created = True
+    return category_id, subcategory_id, created
 
-def create_connection():
-    return sqlite3.connect(DB_FILE)
+def _attach_category_names(df, user_name):
+    # Replace category_id/subcategory_id with their names from the catalog
+    catalog = get_category_catalog(user_name)
+    known = df['category_id'].dropna().isin(catalog["category_names"].keys()).all() and \
+        df['subcategory_id'].dropna().isin(catalog["subcategory_names"].keys()).all()
+    if not known:
+        invalidate_category_catalog(user_name)
+        catalog = get_category_catalog(user_name)
+    position = df.columns.get_loc('category_id')
+    df.insert(position, 'category', df['category_id'].map(catalog["category_names"]))
+    df.insert(position + 1, 'subcategory', df['subcategory_id'].map(catalog["subcategory_names"]))
+    return df.drop(columns=['category_id', 'subcategory_id'])
 
 def add_user_profile(name):
     conn = create_connection()
     cursor = conn.cursor()
     cursor.execute("INSERT INTO users (name) VALUES (?)", (name,))
+    _write_routine_template(cursor, cursor.lastrowid, _NEW_USER_CATALOG, "Default", DEFAULT_ROUTINE)
+    _record_change(cursor, name, "users", "insert")
     conn.commit()
     conn.close()
+    invalidate_category_catalog(name)
 
 def delete_user_profile(name):
     conn = create_connection()
     cursor = conn.cursor()
-    cursor.execute("DELETE FROM users WHERE name = ?", (name,))
+    cursor.execute("SELECT id FROM users WHERE name = ?", (name,))
+    row = cursor.fetchone()
+    if row is None:
+        conn.close()
+        return
+    
+    # Remove the user's rows from every child table in the same transaction
+    user_id = row[0]
+    _log_changes(cursor, name, "users", "delete")
+    for table in USER_TABLES:
+        cursor.execute(f"DELETE FROM {table} WHERE user_id = ?", (user_id,))
+    cursor.execute("DELETE FROM data_versions WHERE user_id = ?", (user_id,))
+    cursor.execute("DELETE FROM users WHERE id = ?", (user_id,))
+    _bump_data_version(cursor)
+    conn.commit()
+    conn.close()
+    invalidate_category_catalog(name)
+    invalidate_calendar(name)
+    invalidate_interval_index(name)
+    discard_warm_cache(name)
+
+def purge_orphaned_rows():
+    conn = create_connection()
+    cursor = conn.cursor()
+    deleted = 0
+    for table in USER_TABLES:
+        cursor.execute(f'''
+        DELETE FROM {table}
+        WHERE user_id IS NULL OR user_id NOT IN (SELECT id FROM users)
+        ''')
+        if cursor.rowcount:
+            _log_changes(cursor, None, table, "purge")
+        deleted += cursor.rowcount
+    # Row 0 holds the database-wide version and must never be swept
+    cursor.execute('''
+    DELETE FROM data_versions
+    WHERE user_id <> 0 AND (user_id IS NULL OR user_id NOT IN (SELECT id FROM users))
+    ''')
+    if deleted:
+        _bump_data_version(cursor)
+    conn.commit()
+    conn.close()
+    return deleted
+
+def backup_database(backup_dir=BACKUP_DIR, keep=BACKUP_KEEP):
+    os.makedirs(backup_dir, exist_ok=True)
+    stamp = datetime.now().strftime("%Y%m%d-%H%M%S")
+    target = os.path.join(backup_dir, f"life_tracker-{stamp}.db")
+    partial = target + ".partial"
+    
+    # Copy a few pages at a time so writers are never blocked for long
+    source = create_connection()
+    dest = sqlite3.connect(partial)
+    try:
+        source.backup(dest, pages=BACKUP_PAGES_PER_STEP, sleep=0.05)
+    except Exception:
+        dest.close()
+        os.remove(partial)
+        raise
+    finally:
+        source.close()
+    dest.close()
+    os.replace(partial, target)
+    
+    # Keep only the newest backups
+    if keep > 0:
+        backups = sorted(glob.glob(os.path.join(backup_dir, "life_tracker-*.db")))
+        for old_backup in backups[:-keep]:
+            os.remove(old_backup)
+    return target
+
+def compact_old_activities(retention_months=RETENTION_MONTHS):
+    # Never compact the current or previous month, the weekly and monthly views read them raw
+    retention_months = max(1, int(retention_months))
+    today = datetime.now().date()
+    month_index = today.year * 12 + today.month - 1 - retention_months
+    cutoff = datetime(month_index // 12, month_index % 12 + 1, 1).date().isoformat()
+    
+    conn = create_connection()
+    cursor = conn.cursor()
+    
+    # Sleep nights and routine adherence are computed from raw intervals, so fill their caches
+    # for the compacted days, and the night that wakes up on the cutoff day, before the rows go
+    cursor.execute('''
+    SELECT u.name, MIN(a.date) FROM daily_activities a
+    JOIN users u ON u.id = a.user_id
+    WHERE a.date < ?
+    GROUP BY a.user_id
+    ''', (cutoff,))
+    for user_name, first_day in cursor.fetchall():
+        get_sleep_nights(user_name, first_day, cutoff)
+        get_routine_adherence(user_name, first_day, cutoff)
+    
+    # Durations are computed the same way as the analysis views (end - start)
+    cursor.execute(f'''
+    INSERT INTO activity_summaries (user_id, month, category_id, subcategory_id, total_hours, activity_count)
+    SELECT user_id, substr(date, 1, 7), category_id, subcategory_id,
+           COALESCE(SUM({_duration_hours_sql()}), 0),
+           COUNT(*)
+    FROM daily_activities
+    WHERE date < ?
+    GROUP BY user_id, substr(date, 1, 7), category_id, subcategory_id
+    ON CONFLICT (user_id, month, category_id, subcategory_id) DO UPDATE SET
+        total_hours = total_hours + excluded.total_hours,
+        activity_count = activity_count + excluded.activity_count
+    ''', (cutoff,))
+    cursor.execute(f'''
+    INSERT INTO activity_daily_summaries (user_id, date, category_id, subcategory_id, total_hours, activity_count)
+    SELECT user_id, date, category_id, subcategory_id,
+           COALESCE(SUM({_duration_hours_sql()}), 0),
+           COUNT(*)
+    FROM daily_activities
+    WHERE date < ?
+    GROUP BY user_id, date, category_id, subcategory_id
+    ON CONFLICT (user_id, date, category_id, subcategory_id) DO UPDATE SET
+        total_hours = total_hours + excluded.total_hours,
+        activity_count = activity_count + excluded.activity_count
+    ''', (cutoff,))
+    cursor.execute('''
+    INSERT INTO change_log (user_id, table_name, date, op)
+    SELECT DISTINCT user_id, 'daily_activities', date, 'compact' FROM daily_activities WHERE date < ?
+    ''', (cutoff,))
+    cursor.execute("DELETE FROM daily_activities WHERE date < ?", (cutoff,))
+    compacted = cursor.rowcount
+    if compacted:
+        cursor.execute("UPDATE data_versions SET version = version + 1")
     conn.commit()
     conn.close()
+    if compacted:
+        invalidate_calendar()
+        invalidate_interval_index()
+    return compacted
+
+ACTIVITY_TOTALS_SQL = register_statement("activity_totals", f'''
+    SELECT month, category_id, subcategory_id, SUM(hours) AS hours, SUM(activity_count) AS activity_count
+    FROM (
+        SELECT substr(date, 1, 7) AS month, category_id, subcategory_id,
+               {_duration_hours_sql()} AS hours,
+               1 AS activity_count
+        FROM daily_activities
+        WHERE user_id = (SELECT id FROM users WHERE name = ?) AND date BETWEEN ? AND ?
+        UNION ALL
+        SELECT month, category_id, subcategory_id, total_hours, activity_count
+        FROM activity_summaries
+        WHERE user_id = (SELECT id FROM users WHERE name = ?) AND month BETWEEN ? AND ?
+    )
+    GROUP BY month, category_id, subcategory_id
+    ORDER BY month, category_id, subcategory_id
+    ''', ["idx_daily_activities_user_date", "sqlite_autoindex_activity_summaries_1"],
+    ("plan-user-0000", "2025-03-01", "2025-03-31", "plan-user-0000", "2025-03", "2025-03"))
+
+def get_activity_totals(user_name, start_month, end_month):
+    # Per-month category/subcategory hours, reading compacted months from the summaries
+    conn = create_connection()
+    df = pd.read_sql_query(ACTIVITY_TOTALS_SQL, conn, params=(user_name, f"{start_month}-01", f"{end_month}-31",
+                                                              user_name, start_month, end_month))
+    conn.close()
+    return _attach_category_names(df, user_name)
+
+def run_maintenance():
+    backup_path = backup_database()
+    compacted = compact_old_activities()
+    orphans = purge_orphaned_rows()
+    pruned = prune_change_log()
+    prune_warm_cache()
+    
+    # Release the pages freed by compaction and cleanup
+    conn = create_connection()
+    conn.execute("PRAGMA incremental_vacuum")
+    conn.execute("PRAGMA wal_checkpoint(TRUNCATE)")
+    conn.close()
+    logger.info("Maintenance finished: backup=%s compacted=%d orphans=%d changes_pruned=%d",
+                backup_path, compacted, orphans, pruned)
+
+def start_maintenance_thread(interval_hours=MAINTENANCE_INTERVAL_HOURS):
+    stop_event = threading.Event()
+    
+    def maintenance_loop():
+        while not stop_event.is_set():
+            try:
+                run_maintenance()
+            except Exception:
+                logger.exception("Database maintenance failed")
+            stop_event.wait(interval_hours * 3600)
+    
+    threading.Thread(target=maintenance_loop, name="db-maintenance", daemon=True).start()
+    return stop_event
 
 def generate_placeholder_data(user_name):
     conn = create_connection()
@@ -134,6 +1125,13 @@ def generate_placeholder_data(user_name):
     cursor.execute("SELECT id FROM users WHERE name = ?", (user_name,))
     user_id = cursor.fetchone()[0]
     
+    # Local copy of the catalog so ids created below are only reused within this transaction
+    catalog = get_category_catalog(user_name)
+    known_ids = {
+        "category_ids": dict(catalog["category_ids"]),
+        "subcategory_ids": dict(catalog["subcategory_ids"]),
+    }
+    
     # Generate placeholder data for the last 30 days
     end_date = datetime.now().date()
     start_date = end_date - timedelta(days=30)
@@ -149,18 +1147,25 @@ def generate_placeholder_data(user_name):
     for day in range(31):
         current_date = start_date + timedelta(days=day)
         
-        # Daily activities
-        for category in categories:
-            for _ in range(random.randint(1, 3)):
-                subcategory = random.choice(subcategories[category])
-                start_time = time(hour=random.randint(0, 23), minute=random.randint(0, 59))
-                duration = timedelta(hours=random.randint(1, 4))
-                end_time = (datetime.combine(current_date, start_time) + duration).time()
-                
-                cursor.execute('''
-                INSERT INTO daily_activities (user_id, date, category, subcategory, start_time, end_time)
-                VALUES (?, ?, ?, ?, ?, ?)
-                ''', (user_id, current_date.isoformat(), category, subcategory, start_time.isoformat(), end_time.isoformat()))
+        # Daily activities, in random order along the day so they neither overlap nor run past midnight
+        day_activities = [(category, random.choice(subcategories[category]))
+                          for category in categories for _ in range(random.randint(1, 3))]
+        random.shuffle(day_activities)
+        minute = 0
+        for category, subcategory in day_activities:
+            start_minute = minute + random.randint(0, 30)
+            end_minute = min(start_minute + random.randint(1, 4) * 60, 24 * 60 - 1)
+            if end_minute - start_minute < 15:
+                break
+            minute = end_minute
+            category_id, subcategory_id, _ = _resolve_category_ids(cursor, user_id, known_ids, category, subcategory)
+            known_ids["category_ids"][category] = category_id
+            known_ids["subcategory_ids"][(category_id, subcategory)] = subcategory_id
+            
+            cursor.execute('''
+            INSERT INTO daily_activities (user_id, date, category_id, subcategory_id, start_time, end_time)
+            VALUES (?, ?, ?, ?, ?, ?)
+            ''', (user_id, current_date.isoformat(), category_id, subcategory_id, _format_minutes(start_minute), _format_minutes(end_minute)))
         
         # Qualitative metrics
         cursor.execute('''
@@ -192,29 +1197,43 @@ def generate_placeholder_data(user_name):
     VALUES (?, ?, ?, ?, ?)
     ''', (user_id, default_wake_time.isoformat(), 1.0, 1.0, 1.0))
     
+    days = [start_date + timedelta(days=day) for day in range(31)]
+    for table in ("daily_activities", "qualitative_metrics", "quantitative_metrics"):
+        _log_changes(cursor, user_name, table, "insert", days)
+    _log_changes(cursor, user_name, "goals", "insert")
+    _log_changes(cursor, user_name, "user_settings", "replace")
+    _bump_data_version(cursor, user_name, days)
     conn.commit()
     conn.close()
+    invalidate_category_catalog(user_name)
+    invalidate_interval_index(user_name)
+    rebuild_metric_stats(user_name)
+
+ACTIVITIES_IN_RANGE_SQL = register_statement("activities_in_range", '''
+    SELECT date, category_id, subcategory_id, start_time, end_time
+    FROM daily_activities
+    WHERE user_id = (SELECT id FROM users WHERE name = ?) AND date BETWEEN ? AND ?
+    ORDER BY date, start_time
+    ''', ["idx_daily_activities_user_date"], ("plan-user-0000", "2025-03-01", "2025-03-31"))
 
 def get_weekly_data(user_name):
     conn = create_connection()
     end_date = datetime.now().date()
     start_date = end_date - timedelta(days=7)
     
-    query = '''
-    SELECT date, category, subcategory, start_time, end_time
-    FROM daily_activities
-    WHERE user_id = (SELECT id FROM users WHERE name = ?) AND date BETWEEN ? AND ?
-    ORDER BY date, start_time
-    '''
-    df = pd.read_sql_query(query, conn, params=(user_name, start_date, end_date))
+    df = pd.read_sql_query(ACTIVITIES_IN_RANGE_SQL, conn, params=(user_name, start_date, end_date))
     conn.close()
+    df = _attach_category_names(df, user_name)
     
     # Convert date column to datetime
     df['date'] = pd.to_datetime(df['date'])
     
     # Convert start_time and end_time to datetime
-    df['start_time'] = pd.to_datetime(df['date'].dt.strftime('%Y-%m-%d') + ' ' + df['start_time'])
-    df['end_time'] = pd.to_datetime(df['date'].dt.strftime('%Y-%m-%d') + ' ' + df['end_time'])
+    # Times are stored both as HH:MM and HH:MM:SS, so parse them as ISO 8601 rather than inferring one format
+    df['start_time'] = pd.to_datetime(df['date'].dt.strftime('%Y-%m-%d') + ' ' + df['start_time'], format='ISO8601')
+    df['end_time'] = pd.to_datetime(df['date'].dt.strftime('%Y-%m-%d') + ' ' + df['end_time'], format='ISO8601')
+    # An end time earlier than the start is on the next day
+    df['end_time'] = df['end_time'].where(df['end_time'] >= df['start_time'], df['end_time'] + pd.Timedelta(days=1))
     
     return df
 
@@ -227,21 +1246,19 @@ def get_monthly_data(user_name, year=None, month=None):
     conn = create_connection()
     start_date = f"{year}-{month:02d}-01"
     end_date = f"{year}-{month:02d}-{calendar.monthrange(year, month)[1]}"
-    query = '''
-    SELECT date, category, subcategory, start_time, end_time
-    FROM daily_activities
-    WHERE user_id = (SELECT id FROM users WHERE name = ?) AND date BETWEEN ? AND ?
-    ORDER BY date, start_time
-    '''
-    df = pd.read_sql_query(query, conn, params=(user_name, start_date, end_date))
+    df = pd.read_sql_query(ACTIVITIES_IN_RANGE_SQL, conn, params=(user_name, start_date, end_date))
     conn.close()
+    df = _attach_category_names(df, user_name)
     
     # Convert date column to datetime
     df['date'] = pd.to_datetime(df['date'])
     
     # Convert start_time and end_time to datetime
-    df['start_time'] = pd.to_datetime(df['date'].dt.strftime('%Y-%m-%d') + ' ' + df['start_time'])
-    df['end_time'] = pd.to_datetime(df['date'].dt.strftime('%Y-%m-%d') + ' ' + df['end_time'])
+    # Times are stored both as HH:MM and HH:MM:SS, so parse them as ISO 8601 rather than inferring one format
+    df['start_time'] = pd.to_datetime(df['date'].dt.strftime('%Y-%m-%d') + ' ' + df['start_time'], format='ISO8601')
+    df['end_time'] = pd.to_datetime(df['date'].dt.strftime('%Y-%m-%d') + ' ' + df['end_time'], format='ISO8601')
+    # An end time earlier than the start is on the next day
+    df['end_time'] = df['end_time'].where(df['end_time'] >= df['start_time'], df['end_time'] + pd.Timedelta(days=1))
     
     return df
 
@@ -260,106 +1277,614 @@ def format_monthly_data(df, year, month):
     
     return calendar_df
 
-def save_day_activities(user_name, date, work, life, health, sleep):
-    conn = create_connection()
-    cursor = conn.cursor()
-    
-    # Delete existing activities for the day
-    cursor.execute('''
-    DELETE FROM daily_activities
-    WHERE user_id = (SELECT id FROM users WHERE name = ?) AND date = ?
-    ''', (user_name, date))
-    
-    # Insert new activities
-    activities = [
-        ('Work', work),
-        ('Life', life),
-        ('Health', health),
-        ('Sleep', sleep)
-    ]
-    
-    for category, hours in activities:
-        if hours > 0:
-            start_time = '00:00'
-            end_time = f'{int(hours):02d}:{int((hours % 1) * 60):02d}'
-            cursor.execute('''
-            INSERT INTO daily_activities (user_id, date, category, subcategory, start_time, end_time)
-            VALUES ((SELECT id FROM users WHERE name = ?), ?, ?, 'Default', ?, ?)
-            ''', (user_name, date, category, start_time, end_time))
-    
-    conn.commit()
-    conn.close()
+def create_day_buttons(df):
+    dates = df['date'].dt.strftime('%Y-%m-%d')
+    return ('<button onclick="edit_day(\'' + dates + '\')">' + dates + '</button>').str.cat()
 
-def log_activity(user_name, date, category, subcategory, start_time, end_time):
-    conn = create_connection()
-    cursor = conn.cursor()
-    cursor.execute('''
-    INSERT INTO daily_activities (user_id, date, category, subcategory, start_time, end_time)
-    VALUES ((SELECT id FROM users WHERE name = ?), ?, ?, ?, ?, ?)
-    ''', (user_name, date, category, subcategory, start_time, end_time))
-    conn.commit()
-    conn.close()
+# Warm-start cache: payloads in a separate SQLite file, keyed by (user, kind, key) and tagged
+# with the user's data version. WAL mode lets requests read while the warm-up thread writes.
+_warm_cache_ready = False
+_warm_cache_lock = threading.Lock()
 
-def get_activities(user_name, date):
-    conn = create_connection()
-    categories, _ = get_custom_categories(user_name)
-    category_list = ', '.join([f"'{cat}'" for cat in categories])
-    
-    query = f'''
-    SELECT category, subcategory, start_time, end_time
+def _warm_cache_connection():
+    global _warm_cache_ready
+    conn = sqlite3.connect(WARM_CACHE_FILE, timeout=5)
+    with _warm_cache_lock:
+        if not _warm_cache_ready:
+            conn.execute("PRAGMA journal_mode = WAL")
+            if conn.execute("PRAGMA user_version").fetchone()[0] != WARM_CACHE_FORMAT:
+                conn.execute("DROP TABLE IF EXISTS cache_entries")
+                conn.execute(f"PRAGMA user_version = {WARM_CACHE_FORMAT}")
+            conn.execute('''
+            CREATE TABLE IF NOT EXISTS cache_entries (
+                user_name TEXT,
+                kind TEXT,
+                key TEXT,
+                data_version INTEGER NOT NULL,
+                created_at TEXT,
+                payload TEXT,
+                PRIMARY KEY (user_name, kind, key)
+            )
+            ''')
+            conn.commit()
+            _warm_cache_ready = True
+    return conn
+
+def warm_cache_get(user_name, kind, key, version):
+    # The cached payload, or None. An entry built from another data version is deleted.
+    try:
+        conn = _warm_cache_connection()
+        try:
+            row = conn.execute('''
+            SELECT data_version, payload FROM cache_entries WHERE user_name = ? AND kind = ? AND key = ?
+            ''', (user_name, kind, key)).fetchone()
+            if row is None:
+                return None
+            if row[0] != version:
+                conn.execute('''
+                DELETE FROM cache_entries WHERE user_name = ? AND kind = ? AND key = ? AND data_version = ?
+                ''', (user_name, kind, key, row[0]))
+                conn.commit()
+                return None
+            return json.loads(row[1])
+        finally:
+            conn.close()
+    except (sqlite3.Error, ValueError):
+        logger.exception("Warm-start cache read failed for %s %s %s", user_name, kind, key)
+        return None
+
+def warm_cache_put(user_name, kind, key, version, payload):
+    # Never replace an entry with one computed from older data
+    if _read_only_connections:
+        return
+    try:
+        conn = _warm_cache_connection()
+        try:
+            conn.execute('''
+            INSERT INTO cache_entries (user_name, kind, key, data_version, created_at, payload)
+            VALUES (?, ?, ?, ?, ?, ?)
+            ON CONFLICT (user_name, kind, key) DO UPDATE SET
+                data_version = excluded.data_version,
+                created_at = excluded.created_at,
+                payload = excluded.payload
+            WHERE excluded.data_version >= cache_entries.data_version
+            ''', (user_name, kind, key, version, datetime.now().isoformat(timespec='seconds'), json.dumps(payload)))
+            conn.commit()
+        finally:
+            conn.close()
+    except sqlite3.Error:
+        logger.exception("Warm-start cache write failed for %s %s %s", user_name, kind, key)
+
+def discard_warm_cache(user_name):
+    try:
+        conn = _warm_cache_connection()
+        conn.execute("DELETE FROM cache_entries WHERE user_name = ?", (user_name,))
+        conn.commit()
+        conn.close()
+    except sqlite3.Error:
+        logger.exception("Warm-start cache cleanup failed for %s", user_name)
+
+def prune_warm_cache():
+    # Drop entries of deleted users, entries behind their user's data version, and weekly
+    # summaries for earlier days
+    conn = create_connection()
+    versions = dict(conn.execute('''
+    SELECT u.name, COALESCE(v.version, 0) FROM users u LEFT JOIN data_versions v ON v.user_id = u.id
+    ''').fetchall())
+    conn.close()
+    
+    cache = _warm_cache_connection()
+    entries = cache.execute("SELECT DISTINCT user_name, data_version FROM cache_entries").fetchall()
+    stale = [(user_name, version) for user_name, version in entries if versions.get(user_name) != version]
+    cursor = cache.cursor()
+    cursor.executemany("DELETE FROM cache_entries WHERE user_name = ? AND data_version = ?", stale)
+    pruned = max(cursor.rowcount, 0)
+    cursor.execute("DELETE FROM cache_entries WHERE kind = 'weekly_summary' AND key < ?", (datetime.now().date().isoformat(),))
+    pruned += cursor.rowcount
+    cache.commit()
+    cache.close()
+    return pruned
+
+# Monthly calendar grids keyed by (user_name, year, month), least recently used first. A month
+# has a generation while a build of it is in flight, so a build that raced with an edit never
+# stores a stale grid.
+CALENDAR_CACHE_MAX_MONTHS = 512
+_calendar_cache = OrderedDict()
+_calendar_generations = {}
+_calendar_builds = {}
+_calendar_prefetching = set()
+_calendar_cache_lock = threading.Lock()
+_calendar_prefetch_pool = ThreadPoolExecutor(max_workers=2, thread_name_prefix="calendar-prefetch")
+
+def _build_calendar_month(user_name, year, month):
+    key = (user_name, year, month)
+    with _calendar_cache_lock:
+        generation = _calendar_generations.get(key, 0)
+        _calendar_builds[key] = _calendar_builds.get(key, 0) + 1
+    entry = None
+    try:
+        entry = _read_calendar_month(user_name, year, month)
+    finally:
+        with _calendar_cache_lock:
+            if _calendar_generations.get(key, 0) == generation and entry is not None:
+                _calendar_cache[key] = entry
+                _calendar_cache.move_to_end(key)
+                while len(_calendar_cache) > CALENDAR_CACHE_MAX_MONTHS:
+                    _calendar_cache.popitem(last=False)
+            _calendar_builds[key] -= 1
+            if not _calendar_builds[key]:
+                del _calendar_builds[key]
+                _calendar_generations.pop(key, None)
+    return entry
+
+def _read_calendar_month(user_name, year, month):
+    # Read the version first, so a grid that raced with a write is stored as already stale
+    version = get_data_version(user_name)
+    stored = warm_cache_get(user_name, "calendar", f"{year}-{month:02d}", version)
+    if stored is not None:
+        calendar_df = pd.DataFrame(stored["data"], columns=stored["columns"])
+        calendar_df['date'] = pd.to_datetime(calendar_df['date'])
+        entry = (calendar_df, stored["buttons"])
+    else:
+        calendar_df = format_monthly_data(get_monthly_data(user_name, year, month), year, month)
+        entry = (calendar_df, create_day_buttons(calendar_df))
+        warm_cache_put(user_name, "calendar", f"{year}-{month:02d}", version, {
+            "columns": list(calendar_df.columns),
+            "data": calendar_df.assign(date=calendar_df['date'].dt.strftime('%Y-%m-%d')).values.tolist(),
+            "buttons": entry[1],
+        })
+    return entry
+
+def _prefetch_calendar_month(user_name, year, month):
+    key = (user_name, year, month)
+    try:
+        _build_calendar_month(user_name, year, month)
+    except Exception:
+        logger.exception("Calendar prefetch failed for %s", key)
+    finally:
+        with _calendar_cache_lock:
+            _calendar_prefetching.discard(key)
+
+def get_calendar_month(user_name, year, month, prefetch=True):
+    with _calendar_cache_lock:
+        entry = _calendar_cache.get((user_name, year, month))
+        if entry is not None:
+            _calendar_cache.move_to_end((user_name, year, month))
+    if entry is None:
+        entry = _build_calendar_month(user_name, year, month)
+    
+    # Warm the previous and next months so paging does not wait on the database
+    if prefetch:
+        for offset in (-1, 1):
+            month_index = year * 12 + month - 1 + offset
+            key = (user_name, month_index // 12, month_index % 12 + 1)
+            with _calendar_cache_lock:
+                if key in _calendar_cache or key in _calendar_prefetching:
+                    continue
+                _calendar_prefetching.add(key)
+            _calendar_prefetch_pool.submit(_prefetch_calendar_month, *key)
+    
+    calendar_df, buttons_html = entry
+    return calendar_df.copy(), buttons_html
+
+def invalidate_calendar(user_name=None, date=None):
+    # Drop cached grids for one day's month, one user, or everything, and outdate the builds in flight
+    with _calendar_cache_lock:
+        for key in set(_calendar_cache) | set(_calendar_builds):
+            cached_user, year, month = key
+            if user_name is not None and cached_user != user_name:
+                continue
+            if date is not None and str(date)[:7] != f"{year}-{month:02d}":
+                continue
+            _calendar_cache.pop(key, None)
+            if key in _calendar_builds:
+                _calendar_generations[key] = _calendar_generations.get(key, 0) + 1
+
+# Per-user, per-day interval indexes that keep logged activities from overlapping. An index
+# covers one day and its neighbours in minutes from that day's midnight, so activities that
+# run past midnight are checked against the next day's entries. Writers hold the lock from
+# the overlap check until their commit. The same lock serializes every writer of metric_stats.
+OVERLAP_POLICIES = ("reject", "merge")
+INTERVAL_INDEX_MAX_DAYS = 4096
+_interval_indexes = {}
+_interval_lock = threading.RLock()
+
+INTERVALS_AROUND_DAY_SQL = register_statement("intervals_around_day", '''
+    SELECT id, category_id, subcategory_id, start_time, end_time,
+           CAST(julianday(date) - julianday(?) AS INTEGER) AS day_offset
     FROM daily_activities
-    WHERE user_id = (SELECT id FROM users WHERE name = ?) AND date = ? AND category IN ({category_list})
-    ORDER BY start_time
+    WHERE user_id = (SELECT id FROM users WHERE name = ?) AND date BETWEEN date(?, '-1 day') AND date(?, '+1 day')
+    ''', ["idx_daily_activities_user_date"], ("2025-03-01", "plan-user-0000", "2025-03-01", "2025-03-01"))
+
+def _time_minutes(value):
+    try:
+        hours, minutes = str(value).split(':')[:2]
+        hours, minutes = int(hours), int(minutes)
+    except ValueError:
+        raise ValueError(f"Invalid time {value!r}, expected HH:MM") from None
+    if not (0 <= hours < 24 and 0 <= minutes < 60):
+        raise ValueError(f"Invalid time {value!r}, expected HH:MM")
+    return hours * 60 + minutes
+
+def _format_minutes(minutes):
+    return f"{minutes // 60 % 24:02d}:{minutes % 60:02d}"
+
+def _interval_minutes(start_time, end_time):
+    # (start, end) in minutes from midnight; an end earlier than the start is on the next day
+    start, end = _time_minutes(start_time), _time_minutes(end_time)
+    return start, end + 24 * 60 if end < start else end
+
+class DayIntervals:
+    """Sorted (start, end, activity_id, category_id, subcategory_id) intervals around one day."""
+    
+    def __init__(self, intervals=()):
+        self.intervals = sorted(intervals)
+        self._reindex()
+    
+    def _reindex(self):
+        self.starts = [interval[0] for interval in self.intervals]
+        # Running maximum of the end times, so the first interval that can reach a point is a bisect away
+        self.max_ends = list(itertools.accumulate((interval[1] for interval in self.intervals), max))
+    
+    def overlapping(self, start, end):
+        # Intervals before `first` all end by `start`; those from `last` on start at or after `end`
+        first = bisect.bisect_right(self.max_ends, start)
+        last = bisect.bisect_left(self.starts, end)
+        return [interval for interval in self.intervals[first:last] if interval[1] > start]
+    
+    def add(self, interval):
+        bisect.insort(self.intervals, interval)
+        self._reindex()
+
+def _load_day_intervals(cursor, user_name, date):
+    cursor.execute(INTERVALS_AROUND_DAY_SQL, (date, user_name, date, date))
+    intervals = []
+    for activity_id, category_id, subcategory_id, start_time, end_time, day_offset in cursor.fetchall():
+        try:
+            start, end = _interval_minutes(start_time, end_time)
+        except ValueError:
+            continue
+        if end > start:
+            offset = day_offset * 24 * 60
+            intervals.append((start + offset, end + offset, activity_id, category_id, subcategory_id))
+    return DayIntervals(intervals)
+
+def get_day_intervals(cursor, user_name, date):
+    with _interval_lock:
+        index = _interval_indexes.get((user_name, date))
+        if index is None:
+            if len(_interval_indexes) >= INTERVAL_INDEX_MAX_DAYS:
+                _interval_indexes.clear()
+            index = _interval_indexes[(user_name, date)] = _load_day_intervals(cursor, user_name, date)
+        return index
+
+def _neighbour_days(date):
+    day = pd.Timestamp(date)
+    return [(offset, (day + pd.Timedelta(days=offset)).strftime('%Y-%m-%d')) for offset in (-1, 0, 1)]
+
+def _add_to_interval_indexes(user_name, date, interval):
+    # Record a new activity in every cached index that covers its day
+    start, end, *ids = interval
+    with _interval_lock:
+        for offset, day in _neighbour_days(date):
+            index = _interval_indexes.get((user_name, day))
+            if index is not None:
+                shift = offset * 24 * 60
+                index.add((start - shift, end - shift, *ids))
+
+def invalidate_interval_index(user_name=None, date=None):
+    # Drop the indexes covering one day, one user, or everything
+    with _interval_lock:
+        if user_name is None:
+            _interval_indexes.clear()
+        elif date is None:
+            for key in [key for key in _interval_indexes if key[0] == user_name]:
+                del _interval_indexes[key]
+        else:
+            for _, day in _neighbour_days(date):
+                _interval_indexes.pop((user_name, day), None)
+
+def _describe_interval(catalog, date, interval):
+    start, end, _, category_id, subcategory_id = interval
+    day = (pd.Timestamp(date) + pd.Timedelta(days=start // (24 * 60))).strftime('%Y-%m-%d')
+    name = catalog["category_names"].get(category_id, "Uncategorized")
+    if subcategory_id in catalog["subcategory_names"]:
+        name += f" / {catalog['subcategory_names'][subcategory_id]}"
+    return f"{name} {_format_minutes(start)}-{_format_minutes(end)} on {day}"
+
+def save_day_activities(user_name, date, work, life, health, sleep):
+    # Lay the day's blocks out back to back, sleep first, so they never overlap. They start at
+    # midnight, or where an activity carried over from the previous day ends.
+    blocks = [('Sleep', sleep), ('Work', work), ('Life', life), ('Health', health)]
+    minutes = [(category, int(round(float(hours or 0) * 60))) for category, hours in blocks]
+    if sum(length for _, length in minutes) > 24 * 60:
+        raise ValueError("The hours for one day add up to more than 24")
+    
+    with _interval_lock:
+        conn = create_connection()
+        cursor = conn.cursor()
+        cursor.execute("BEGIN IMMEDIATE")
+        cursor.execute("SELECT id FROM users WHERE name = ?", (user_name,))
+        row = cursor.fetchone()
+        user_id = row[0] if row else None
+        catalog = get_category_catalog(user_name)
+        catalog_changed = False
+        
+        carried_over = [interval for interval in get_day_intervals(cursor, user_name, date).overlapping(0, 24 * 60)
+                        if interval[0] < 0]
+        day_start = max((interval[1] for interval in carried_over), default=0)
+        if day_start + sum(length for _, length in minutes) > 24 * 60:
+            conn.close()
+            raise ValueError(f"Only {(24 * 60 - day_start) / 60:g} hours are left after "
+                             + "; ".join(_describe_interval(catalog, date, interval) for interval in carried_over))
+        
+        before = _daily_metric_values(cursor, user_name, date)
+        
+        # Delete existing activities for the day
+        cursor.execute('''
+        DELETE FROM daily_activities
+        WHERE user_id = ? AND date = ?
+        ''', (user_id, date))
+        
+        # Insert new activities
+        start = day_start
+        for category, length in minutes:
+            if length > 0:
+                start_time, end_time = _format_minutes(start), _format_minutes(start + length)
+                start += length
+                category_id, subcategory_id, created = _resolve_category_ids(cursor, user_id, catalog, category, 'Default')
+                catalog_changed = catalog_changed or created
+                cursor.execute('''
+                INSERT INTO daily_activities (user_id, date, category_id, subcategory_id, start_time, end_time)
+                VALUES (?, ?, ?, ?, ?, ?)
+                ''', (user_id, date, category_id, subcategory_id, start_time, end_time))
+        
+        _update_metric_stats(cursor, user_name, date, before, _daily_metric_values(cursor, user_name, date))
+        _record_change(cursor, user_name, "daily_activities", "replace", [date])
+        conn.commit()
+        conn.close()
+        invalidate_interval_index(user_name, date)
+    invalidate_calendar(user_name, date)
+    if catalog_changed:
+        invalidate_category_catalog(user_name)
+
+def log_activity(user_name, date, category, subcategory, start_time, end_time, on_overlap="reject"):
+    # Raises ValueError for malformed times and for overlaps with the user's other activities.
+    # With on_overlap="merge", overlapping activities of the same category and subcategory on
+    # the same day are combined into one instead.
+    if on_overlap not in OVERLAP_POLICIES:
+        raise ValueError(f"on_overlap must be one of {', '.join(OVERLAP_POLICIES)}")
+    start, end = _interval_minutes(start_time, end_time)
+    if end == start:
+        raise ValueError("An activity must end after it starts")
+    
+    with _interval_lock:
+        conn = create_connection()
+        cursor = conn.cursor()
+        cursor.execute("BEGIN IMMEDIATE")
+        catalog = get_category_catalog(user_name)
+        category_id, subcategory_id, created = _resolve_category_ids(cursor, catalog["user_id"], catalog, category, subcategory)
+        overlaps = get_day_intervals(cursor, user_name, date).overlapping(start, end)
+        mergeable = on_overlap == "merge" and all(
+            0 <= interval[0] < 24 * 60 and interval[3:] == (category_id, subcategory_id) for interval in overlaps
+        )
+        if overlaps and not mergeable:
+            conn.close()
+            raise ValueError("Overlaps " + "; ".join(_describe_interval(catalog, date, interval) for interval in overlaps))
+        if overlaps:
+            start = min(start, *(interval[0] for interval in overlaps))
+            end = max(end, *(interval[1] for interval in overlaps))
+            if end - start >= 24 * 60:
+                conn.close()
+                raise ValueError("Merged activity would last 24 hours or more")
+        
+        before = _daily_metric_values(cursor, user_name, date)
+        if overlaps:
+            cursor.executemany("DELETE FROM daily_activities WHERE id = ?", [(interval[2],) for interval in overlaps])
+        cursor.execute('''
+        INSERT INTO daily_activities (user_id, date, category_id, subcategory_id, start_time, end_time)
+        VALUES ((SELECT id FROM users WHERE name = ?), ?, ?, ?, ?, ?)
+        ''', (user_name, date, category_id, subcategory_id, _format_minutes(start), _format_minutes(end)))
+        activity_id = cursor.lastrowid
+        _update_metric_stats(cursor, user_name, date, before, _daily_metric_values(cursor, user_name, date))
+        _record_change(cursor, user_name, "daily_activities", "update" if overlaps else "insert", [date])
+        conn.commit()
+        conn.close()
+        if overlaps:
+            invalidate_interval_index(user_name, date)
+        else:
+            _add_to_interval_indexes(user_name, date, (start, end, activity_id, category_id, subcategory_id))
+    invalidate_calendar(user_name, date)
+    if created:
+        invalidate_category_catalog(user_name)
+
+def union_minutes(intervals, by=()):
+    # Minutes covered by the intervals of each `by` group, counting overlapping stretches once.
+    # `intervals` has the `by` columns plus numeric start and end; with no `by` returns one total.
+    by = list(by)
+    ordered = intervals.sort_values([*by, 'start'], kind='mergesort')
+    keys = [ordered[column] for column in by] or [np.zeros(len(ordered), dtype=int)]
+    reach = ordered.groupby(keys)['end'].cummax()
+    previous = reach.groupby(keys).shift()
+    # A new run of overlapping intervals starts wherever nothing earlier reaches this start
+    run = (previous.isna() | (ordered['start'] > previous)).cumsum()
+    runs = ordered.groupby(run.to_numpy()).agg(**{column: (column, 'first') for column in by},
+                                               start=('start', 'min'), end=('end', 'max'))
+    lengths = runs['end'] - runs['start']
+    return lengths.groupby([runs[column] for column in by]).sum() if by else float(lengths.sum())
+
+def _union_hours(df):
+    # Hours covered by a frame of activities with datetime start_time and end_time
+    origin = pd.Timestamp(0)
+    intervals = pd.DataFrame({
+        'start': (df['start_time'] - origin).dt.total_seconds() / 60,
+        'end': (df['end_time'] - origin).dt.total_seconds() / 60,
+    })
+    return union_minutes(intervals) / 60
+
+def _activity_conflicts_sql(conditions):
+    return f'''
+    SELECT a.id AS activity_id, u.name AS user_name, a.date, c.name AS category, a.start_time, a.end_time,
+           CAST(julianday(a.date) AS INTEGER) * 1440 AS day_start,
+           CAST(substr(a.start_time, 1, 2) AS INTEGER) * 60 + CAST(substr(a.start_time, 4, 2) AS INTEGER) AS start_minute,
+           CAST(substr(a.end_time, 1, 2) AS INTEGER) * 60 + CAST(substr(a.end_time, 4, 2) AS INTEGER) AS end_minute
+    FROM daily_activities a
+    JOIN users u ON u.id = a.user_id
+    LEFT JOIN categories c ON c.id = a.category_id
+    WHERE {' AND '.join(conditions)}
     '''
-    df = pd.read_sql_query(query, conn, params=(user_name, date))
-    conn.close()
-    return df
 
-def log_qualitative_metrics(user_name, date, life_score, work_score, health_score):
+register_statement("activity_conflicts", _activity_conflicts_sql(
+    ["a.user_id = (SELECT id FROM users WHERE name = ?)", "a.date >= ?", "a.date <= ?"]
+), ["idx_daily_activities_user_date"], ("plan-user-0000", "2025-03-01", "2025-03-31"))
+
+def find_activity_conflicts(user_name=None, start_date=None, end_date=None):
+    # Sweep the history for activities that start before an earlier activity of the same user
+    # has ended, including across midnight. Returns (conflicts, days): one row per conflicting
+    # activity with the activity it collides with, and the days whose logged hours exceed the
+    # time actually covered or add up to more than 24 hours.
+    conditions, params = ["a.user_id IN (SELECT id FROM users)"], []
+    if user_name is not None:
+        conditions = ["a.user_id = (SELECT id FROM users WHERE name = ?)"]
+        params.append(user_name)
+    if start_date is not None:
+        conditions.append("a.date >= ?")
+        params.append(str(start_date))
+    if end_date is not None:
+        conditions.append("a.date <= ?")
+        params.append(str(end_date))
+    
     conn = create_connection()
-    cursor = conn.cursor()
-    cursor.execute('''
-    INSERT INTO qualitative_metrics (user_id, date, life_score, work_score, health_score)
-    VALUES ((SELECT id FROM users WHERE name = ?), ?, ?, ?, ?)
-    ''', (user_name, date, life_score, work_score, health_score))
-    conn.commit()
+    df = pd.read_sql_query(_activity_conflicts_sql(conditions), conn, params=params)
     conn.close()
+    
+    # Absolute minutes, so an activity running past midnight collides with the next day's entries
+    wraps = df['end_minute'] < df['start_minute']
+    df['start'] = (df['day_start'] + df['start_minute']).astype('int64')
+    df['end'] = (df['day_start'] + df['end_minute'] + np.where(wraps, 24 * 60, 0)).astype('int64')
+    df = df[df['end'] > df['start']].sort_values(['user_name', 'start', 'end'], kind='mergesort')
+    
+    users = df['user_name']
+    reach = df.groupby(users)['end'].cummax()
+    holder = df['activity_id'].where(df['end'] == reach).groupby(users).ffill()
+    previous_end = reach.groupby(users).shift()
+    clash = previous_end > df['start']
+    conflicts = df.loc[clash, ['user_name', 'date', 'activity_id', 'category', 'start_time', 'end_time']].assign(
+        conflicts_with=holder.groupby(users).shift()[clash].astype(int),
+        overlap_minutes=(np.minimum(df['end'], previous_end) - df['start'])[clash].astype(int),
+    )
+    
+    days = df.assign(minutes=df['end'] - df['start']).groupby(['user_name', 'date'])['minutes'].sum().to_frame('logged_hours') / 60
+    days['union_hours'] = union_minutes(df, ['user_name', 'date']) / 60
+    days['overlap_hours'] = days['logged_hours'] - days['union_hours']
+    days = days[(days['overlap_hours'] > 0) | (days['logged_hours'] > 24)].reset_index()
+    return conflicts.reset_index(drop=True), days.round(2)
 
-def log_quantitative_metrics(user_name, date, wake_up_time, workouts, meditation_minutes, brain_training_minutes):
+# Only activities in the user's configured categories (those with a position)
+ACTIVITIES_FOR_DAY_SQL = register_statement("activities_for_day", '''
+    SELECT a.category_id, a.subcategory_id, a.start_time, a.end_time
+    FROM daily_activities a
+    JOIN categories c ON c.id = a.category_id AND c.position IS NOT NULL
+    WHERE a.user_id = (SELECT id FROM users WHERE name = ?) AND a.date = ?
+    ORDER BY a.start_time
+    ''', ["idx_daily_activities_user_date"], ("plan-user-0000", "2025-03-01"))
+
+def get_activities(user_name, date):
     conn = create_connection()
-    cursor = conn.cursor()
-    cursor.execute('''
-    INSERT INTO quantitative_metrics (user_id, date, wake_up_time, workouts, meditation_minutes, brain_training_minutes)
-    VALUES ((SELECT id FROM users WHERE name = ?), ?, ?, ?, ?, ?)
-    ''', (user_name, date, wake_up_time, workouts, meditation_minutes, brain_training_minutes))
-    conn.commit()
+    df = pd.read_sql_query(ACTIVITIES_FOR_DAY_SQL, conn, params=(user_name, date))
     conn.close()
+    return _attach_category_names(df, user_name)
 
-def get_metrics(user_name, date):
-    conn = create_connection()
-    qual_query = '''
+def log_qualitative_metrics(user_name, date, life_score, work_score, health_score):
+    with _interval_lock:
+        conn = create_connection()
+        cursor = conn.cursor()
+        # Read the day's values in the write transaction, so concurrent writers cannot fold the same change twice
+        cursor.execute("BEGIN IMMEDIATE")
+        before = _daily_metric_values(cursor, user_name, date)
+        cursor.execute('''
+        INSERT INTO qualitative_metrics (user_id, date, life_score, work_score, health_score)
+        VALUES ((SELECT id FROM users WHERE name = ?), ?, ?, ?, ?)
+        ON CONFLICT (user_id, date) DO UPDATE SET
+            life_score = excluded.life_score,
+            work_score = excluded.work_score,
+            health_score = excluded.health_score
+        ''', (user_name, date, life_score, work_score, health_score))
+        _update_metric_stats(cursor, user_name, date, before, _daily_metric_values(cursor, user_name, date))
+        _record_change(cursor, user_name, "qualitative_metrics", "upsert", [date])
+        conn.commit()
+        conn.close()
+
+def log_quantitative_metrics(user_name, date, wake_up_time, workouts, meditation_minutes, brain_training_minutes):
+    with _interval_lock:
+        conn = create_connection()
+        cursor = conn.cursor()
+        # Read the day's values in the write transaction, so concurrent writers cannot fold the same change twice
+        cursor.execute("BEGIN IMMEDIATE")
+        before = _daily_metric_values(cursor, user_name, date)
+        cursor.execute('''
+        INSERT INTO quantitative_metrics (user_id, date, wake_up_time, workouts, meditation_minutes, brain_training_minutes)
+        VALUES ((SELECT id FROM users WHERE name = ?), ?, ?, ?, ?, ?)
+        ON CONFLICT (user_id, date) DO UPDATE SET
+            wake_up_time = excluded.wake_up_time,
+            workouts = excluded.workouts,
+            meditation_minutes = excluded.meditation_minutes,
+            brain_training_minutes = excluded.brain_training_minutes
+        ''', (user_name, date, wake_up_time, workouts, meditation_minutes, brain_training_minutes))
+        _update_metric_stats(cursor, user_name, date, before, _daily_metric_values(cursor, user_name, date))
+        _record_change(cursor, user_name, "quantitative_metrics", "upsert", [date])
+        conn.commit()
+        conn.close()
+
+QUALITATIVE_FOR_DAY_SQL = register_statement("qualitative_for_day", '''
     SELECT life_score, work_score, health_score
     FROM qualitative_metrics
     WHERE user_id = (SELECT id FROM users WHERE name = ?) AND date = ?
-    '''
-    quant_query = '''
+    ''', ["idx_qualitative_metrics_user_date"], ("plan-user-0000", "2025-03-01"))
+
+QUANTITATIVE_FOR_DAY_SQL = register_statement("quantitative_for_day", '''
     SELECT wake_up_time, workouts, meditation_minutes, brain_training_minutes
     FROM quantitative_metrics
     WHERE user_id = (SELECT id FROM users WHERE name = ?) AND date = ?
-    '''
-    qual_df = pd.read_sql_query(qual_query, conn, params=(user_name, date))
-    quant_df = pd.read_sql_query(quant_query, conn, params=(user_name, date))
+    ''', ["idx_quantitative_metrics_user_date"], ("plan-user-0000", "2025-03-01"))
+
+CHECKLIST_FOR_DAY_SQL = register_statement("checklist_for_day", '''
+    SELECT checklist_data, notes FROM daily_checklist
+    WHERE user_id = (SELECT id FROM users WHERE name = ?) AND date = ?
+    ''', ["idx_daily_checklist_user_date"], ("plan-user-0000", "2025-03-01"))
+
+def get_metrics(user_name, date):
+    conn = create_connection()
+    qual_df = pd.read_sql_query(QUALITATIVE_FOR_DAY_SQL, conn, params=(user_name, date))
+    quant_df = pd.read_sql_query(QUANTITATIVE_FOR_DAY_SQL, conn, params=(user_name, date))
     conn.close()
     return pd.concat([qual_df, quant_df], axis=1)
 
 def analyze_weekly_data(user_name):
     df = get_weekly_data(user_name)
     df['duration'] = (df['end_time'] - df['start_time']).dt.total_seconds() / 3600
-    
+    return build_weekly_figures(df, get_weekly_scores(user_name), _union_hours(df))
+
+def get_weekly_summary(user_name):
+    # analyze_weekly_data() through the warm-start cache, for the week ending today
+    version = get_data_version(user_name)
+    today = datetime.now().date().isoformat()
+    stored = warm_cache_get(user_name, "weekly_summary", today, version)
+    if stored is not None:
+        return pio.from_json(stored["pie"]), pio.from_json(stored["line"]), stored["total_hours"]
+    pie_chart, line_chart, total_hours = analyze_weekly_data(user_name)
+    warm_cache_put(user_name, "weekly_summary", today, version, {
+        "pie": pie_chart.to_json(), "line": line_chart.to_json(), "total_hours": float(total_hours),
+    })
+    return pie_chart, line_chart, total_hours
+
+def build_weekly_figures(df, daily_scores, total_hours=None):
+    # total_hours defaults to the summed durations; callers pass the union time when they have it
     category_summary = df.groupby('category')['duration'].sum().sort_values(ascending=False)
-    total_hours = category_summary.sum()
+    if total_hours is None:
+        total_hours = category_summary.sum()
     
-    category_percentages = (category_summary / total_hours * 100).round(2)
+    category_percentages = (category_summary / category_summary.sum() * 100).round(2)
     
     # Create a more detailed pie chart
     pie_chart = go.Figure(data=[go.Pie(
@@ -371,8 +1896,6 @@ def analyze_weekly_data(user_name):
     )])
     pie_chart.update_layout(title="Weekly Activity Distribution")
     
-    daily_scores = get_weekly_scores(user_name)
-    
     # Create a more detailed line chart
     line_chart = go.Figure()
     for column in ['life_score', 'work_score', 'health_score']:
@@ -390,39 +1913,39 @@ def analyze_monthly_data(user_name):
     year, month = datetime.now().year, datetime.now().month
     df = get_monthly_data(user_name, year, month)
     df['duration'] = (df['end_time'] - df['start_time']).dt.total_seconds() / 3600
-    
+    return build_monthly_figures(df, get_monthly_scores(user_name), _union_hours(df))
+
+def build_monthly_figures(df, weekly_scores, total_hours=None):
     category_summary = df.groupby('category')['duration'].sum().sort_values(ascending=False)
-    total_hours = category_summary.sum()
+    if total_hours is None:
+        total_hours = category_summary.sum()
     
-    category_percentages = (category_summary / total_hours * 100).round(2)
+    category_percentages = (category_summary / category_summary.sum() * 100).round(2)
     
     pie_chart = px.pie(values=category_percentages.values, names=category_percentages.index, title="Monthly Activity Distribution")
     
-    weekly_scores = get_monthly_scores(user_name)
-    
     # Use 'date' instead of 'week' for the x-axis
     line_chart = px.line(weekly_scores, x='date', y=['life_score', 'work_score', 'health_score'], title="Monthly Score Trends")
     
     return pie_chart, line_chart, total_hours
 
-def get_monthly_scores(user_name):
-    conn = create_connection()
-    end_date = datetime.now().date()
-    start_date = end_date.replace(day=1)
-    
-    query = '''
+SCORES_IN_RANGE_SQL = register_statement("scores_in_range", '''
     SELECT 
         date,
-        AVG(life_score) as life_score,
-        AVG(work_score) as work_score,
-        AVG(health_score) as health_score
+        life_score,
+        work_score,
+        health_score
     FROM qualitative_metrics
     WHERE user_id = (SELECT id FROM users WHERE name = ?) AND date BETWEEN ? AND ?
-    GROUP BY date
     ORDER BY date
-    '''
+    ''', ["idx_qualitative_metrics_user_date"], ("plan-user-0000", "2025-03-01", "2025-03-31"))
+
+def get_monthly_scores(user_name):
+    conn = create_connection()
+    end_date = datetime.now().date()
+    start_date = end_date.replace(day=1)
     
-    df = pd.read_sql_query(query, conn, params=(user_name, start_date, end_date))
+    df = pd.read_sql_query(SCORES_IN_RANGE_SQL, conn, params=(user_name, start_date, end_date))
     conn.close()
     return df
 
@@ -431,18 +1954,7 @@ def get_weekly_scores(user_name):
     end_date = datetime.now().date()
     start_date = end_date - timedelta(days=7)
     
-    query = '''
-    SELECT 
-        date,
-        life_score,
-        work_score,
-        health_score
-    FROM qualitative_metrics
-    WHERE user_id = (SELECT id FROM users WHERE name = ?) AND date BETWEEN ? AND ?
-    ORDER BY date
-    '''
-    
-    df = pd.read_sql_query(query, conn, params=(user_name, start_date, end_date))
+    df = pd.read_sql_query(SCORES_IN_RANGE_SQL, conn, params=(user_name, start_date, end_date))
     conn.close()
     return df
 
@@ -453,17 +1965,19 @@ def set_goal(user_name, category, description, target_value, start_date, end_dat
     INSERT INTO goals (user_id, category, description, target_value, current_value, start_date, end_date)
     VALUES ((SELECT id FROM users WHERE name = ?), ?, ?, ?, 0, ?, ?)
     ''', (user_name, category, description, float(target_value), start_date, end_date))
+    _record_change(cursor, user_name, "goals", "insert")
     conn.commit()
     conn.close()
 
-def get_goals(user_name):
-    conn = create_connection()
-    query = '''
+GOALS_FOR_USER_SQL = register_statement("goals_for_user", '''
     SELECT category, description, target_value, current_value, start_date, end_date
     FROM goals
     WHERE user_id = (SELECT id FROM users WHERE name = ?)
-    '''
-    df = pd.read_sql_query(query, conn, params=(user_name,))
+    ''', ["idx_goals_user"], ("plan-user-0000",))
+
+def get_goals(user_name):
+    conn = create_connection()
+    df = pd.read_sql_query(GOALS_FOR_USER_SQL, conn, params=(user_name,))
     conn.close()
     return df
 
@@ -475,17 +1989,20 @@ def update_goal_progress(user_name, goal_id, current_value):
     SET current_value = ?
     WHERE id = ? AND user_id = (SELECT id FROM users WHERE name = ?)
     ''', (current_value, goal_id, user_name))
+    _record_change(cursor, user_name, "goals", "update")
     conn.commit()
     conn.close()
 
-def get_user_settings(user_name):
-    conn = create_connection()
-    cursor = conn.cursor()
-    cursor.execute('''
+USER_SETTINGS_SQL = register_statement("user_settings", '''
     SELECT default_wake_time, work_weight, life_weight, health_weight
     FROM user_settings
     WHERE user_id = (SELECT id FROM users WHERE name = ?)
-    ''', (user_name,))
+    ''', [], ("plan-user-0000",))
+
+def get_user_settings(user_name):
+    conn = create_connection()
+    cursor = conn.cursor()
+    cursor.execute(USER_SETTINGS_SQL, (user_name,))
     settings = cursor.fetchone()
     conn.close()
     return settings if settings else (None, 1.0, 1.0, 1.0)
@@ -497,6 +2014,7 @@ def update_user_settings(user_name, default_wake_time, work_weight, life_weight,
     INSERT OR REPLACE INTO user_settings (user_id, default_wake_time, work_weight, life_weight, health_weight)
     VALUES ((SELECT id FROM users WHERE name = ?), ?, ?, ?, ?)
     ''', (user_name, default_wake_time, work_weight, life_weight, health_weight))
+    _record_change(cursor, user_name, "user_settings", "replace")
     conn.commit()
     conn.close()
 
@@ -506,6 +2024,1539 @@ def parse_date(date_str):
     else:
         return datetime.strptime(date_str, "%Y-%m-%d").date()
 
+def _fts_query(text):
+    # Quote every term so user input is never parsed as FTS syntax, and match term prefixes
+    terms = [term.replace('"', '""') for term in text.split()]
+    return ' '.join(f'"{term}"*' for term in terms)
+
+SEARCH_MATCHES_SQL = '''
+    SELECT 'Note' AS source, d.date, NULL AS category,
+           snippet(daily_notes_fts, 0, '[', ']', '...', 12) AS snippet,
+           bm25(daily_notes_fts) AS rank
+    FROM daily_notes_fts
+    JOIN daily_checklist d ON d.id = daily_notes_fts.rowid
+    WHERE daily_notes_fts MATCH :match AND d.user_id = (SELECT id FROM users WHERE name = :user_name)
+    UNION ALL
+    SELECT 'Activity' AS source, a.date, c.name AS category,
+           snippet(subcategories_fts, 0, '[', ']', '...', 12) AS snippet,
+           bm25(subcategories_fts) AS rank
+    FROM subcategories_fts
+    JOIN subcategories s ON s.id = subcategories_fts.rowid
+    JOIN categories c ON c.id = s.category_id
+    JOIN daily_activities a ON a.subcategory_id = s.id
+    WHERE subcategories_fts MATCH :match AND s.user_id = (SELECT id FROM users WHERE name = :user_name)
+    '''
+
+SEARCH_PAGE_SQL = register_statement("search_entries", f'''
+    SELECT source, date, category, snippet FROM ({SEARCH_MATCHES_SQL})
+    ORDER BY rank, date DESC
+    LIMIT :limit OFFSET :offset
+    ''', ["idx_daily_activities_subcategory"], {"match": '"walk"*', "user_name": "plan-user-0000", "limit": 20, "offset": 0})
+
+SEARCH_COUNT_SQL = register_statement("search_count", f"SELECT COUNT(*) FROM ({SEARCH_MATCHES_SQL})",
+                                      ["idx_daily_activities_subcategory"], {"match": '"walk"*', "user_name": "plan-user-0000"})
+
+def search_entries(user_name, text, page=1, page_size=SEARCH_PAGE_SIZE):
+    # Ranked, snippeted matches from daily notes and activity subcategories, one page at a time
+    columns = ['source', 'date', 'category', 'snippet']
+    match = _fts_query(text or "")
+    if not match:
+        return pd.DataFrame(columns=columns), 0
+    params = {"match": match, "user_name": user_name}
+    
+    conn = create_connection()
+    cursor = conn.cursor()
+    cursor.execute(SEARCH_COUNT_SQL, params)
+    total = cursor.fetchone()[0]
+    page = max(1, int(page))
+    df = pd.read_sql_query(SEARCH_PAGE_SQL, conn, params={**params, "limit": page_size, "offset": (page - 1) * page_size})
+    conn.close()
+    return df, total
+
+_DURATION_HOURS = _duration_hours_sql("a.")
+
+# Tables shown in the UI, paged, sorted and filtered in SQL. "query" takes named parameters,
+# "filter" columns are matched with LIKE, and "order" breaks ties after the chosen sort column.
+TABLE_VIEWS = {
+    "activities": {
+        "query": '''
+        SELECT c.name AS category, s.name AS subcategory, a.start_time, a.end_time
+        FROM daily_activities a
+        JOIN categories c ON c.id = a.category_id AND c.position IS NOT NULL
+        LEFT JOIN subcategories s ON s.id = a.subcategory_id
+        WHERE a.user_id = (SELECT id FROM users WHERE name = :user_name) AND a.date = :date
+        ''',
+        "columns": ['category', 'subcategory', 'start_time', 'end_time'],
+        "filter": ['category', 'subcategory'],
+        "order": "start_time",
+    },
+    "breakdown": {
+        "query": f'''
+        SELECT c.name AS category, s.name AS subcategory, SUM({_DURATION_HOURS}) AS duration_hours
+        FROM daily_activities a
+        LEFT JOIN categories c ON c.id = a.category_id
+        LEFT JOIN subcategories s ON s.id = a.subcategory_id
+        WHERE a.user_id = (SELECT id FROM users WHERE name = :user_name) AND a.date BETWEEN :start_date AND :end_date
+        GROUP BY a.category_id, a.subcategory_id
+        ''',
+        "columns": ['category', 'subcategory', 'duration_hours'],
+        "filter": ['category', 'subcategory'],
+        "order": "duration_hours DESC",
+    },
+    "goals": {
+        "query": '''
+        SELECT id, category, description, target_value, current_value, start_date, end_date
+        FROM goals
+        WHERE user_id = (SELECT id FROM users WHERE name = :user_name)
+        ''',
+        "columns": ['category', 'description', 'target_value', 'current_value', 'start_date', 'end_date'],
+        "filter": ['category', 'description'],
+        "order": "id",
+    },
+}
+
+register_statement("view_activities", TABLE_VIEWS["activities"]["query"], ["idx_daily_activities_user_date"],
+                   {"user_name": "plan-user-0000", "date": "2025-03-01"})
+register_statement("view_breakdown", TABLE_VIEWS["breakdown"]["query"], ["idx_daily_activities_user_date"],
+                   {"user_name": "plan-user-0000", "start_date": "2025-03-01", "end_date": "2025-03-31"})
+register_statement("view_goals", TABLE_VIEWS["goals"]["query"], ["idx_goals_user"], {"user_name": "plan-user-0000"})
+
+# Row counts keyed by (view, user, parameters, filter), valid while the user's data version holds
+_table_count_cache = {}
+_table_count_lock = threading.Lock()
+
+def get_table_page(view, user_name, page=1, page_size=TABLE_PAGE_SIZE, sort_by=None, descending=False, filter_text="", **params):
+    # Returns (rows of the requested page, total matching rows); only the page leaves the database
+    spec = TABLE_VIEWS[view]
+    query, columns = spec["query"], spec["columns"]
+    params = {**params, "user_name": user_name}
+    
+    where = "1"
+    filter_text = (filter_text or "").strip()
+    if filter_text:
+        params["filter"] = '%' + filter_text.replace('\\', '\\\\').replace('%', '\\%').replace('_', '\\_') + '%'
+        where = ' OR '.join(f"CAST({column} AS TEXT) LIKE :filter ESCAPE '\\'" for column in spec["filter"])
+    order = spec["order"]
+    if sort_by in columns:
+        order = f'"{sort_by.replace(chr(34), chr(34) * 2)}" {"DESC" if descending else "ASC"}, {order}'
+    
+    conn = create_connection()
+    cursor = conn.cursor()
+    key = (view, user_name, tuple(sorted((k, str(v)) for k, v in params.items())))
+    version = get_data_version(user_name)
+    with _table_count_lock:
+        cached = _table_count_cache.get(key)
+    if cached is not None and cached[0] == version:
+        total = cached[1]
+    else:
+        cursor.execute(f"SELECT COUNT(*) FROM ({query}) WHERE {where}", params)
+        total = cursor.fetchone()[0]
+        with _table_count_lock:
+            if len(_table_count_cache) > 1024:
+                _table_count_cache.clear()
+            _table_count_cache[key] = (version, total)
+    
+    page = max(1, int(page or 1))
+    select = ', '.join(f'"{column.replace(chr(34), chr(34) * 2)}"' for column in columns)
+    df = pd.read_sql_query(f"""
+    SELECT {select} FROM ({query})
+    WHERE {where}
+    ORDER BY {order}
+    LIMIT :limit OFFSET :offset
+    """, conn, params={**params, "limit": page_size, "offset": (page - 1) * page_size})
+    conn.close()
+    return df, total
+
+def page_status(page, total, page_size=TABLE_PAGE_SIZE):
+    if total == 0:
+        return "No rows."
+    first = (max(1, int(page or 1)) - 1) * page_size + 1
+    if first > total:
+        return f"Page {int(page)} is past the last of {total} rows."
+    return f"Rows {first}-{min(first + page_size - 1, total)} of {total}."
+
+def page_frame(df, page=1, page_size=TABLE_PAGE_SIZE, sort_by=None, descending=False, filter_text="", filter_columns=None):
+    # get_table_page for a small DataFrame that is already in memory, such as a cached month grid
+    filter_text = (filter_text or "").strip()
+    if filter_text:
+        mask = np.zeros(len(df), dtype=bool)
+        for column in filter_columns or df.columns:
+            mask |= df[column].astype(str).str.contains(filter_text, case=False, regex=False).to_numpy()
+        df = df[mask]
+    if sort_by in df.columns:
+        df = df.sort_values(sort_by, ascending=not descending, kind='mergesort')
+    page = max(1, int(page or 1))
+    return df.iloc[(page - 1) * page_size:page * page_size].reset_index(drop=True), len(df)
+
+def _history_sql(conditions):
+    return f'''
+    SELECT a.user_id, a.date, a.category_id, a.subcategory_id,
+           CAST(substr(a.start_time, 1, 2) AS INTEGER) * 60 + CAST(substr(a.start_time, 4, 2) AS INTEGER) AS start_minute,
+           CAST(substr(a.end_time, 1, 2) AS INTEGER) * 60 + CAST(substr(a.end_time, 4, 2) AS INTEGER) AS end_minute,
+           {_duration_hours_sql('a.')} AS hours
+    FROM daily_activities a
+    WHERE {' AND '.join(conditions)}
+    '''
+
+register_statement("history", _history_sql(
+    ["a.user_id = (SELECT id FROM users WHERE name = ?)", "a.date >= ?", "a.date <= ?"]
+), ["idx_daily_activities_user_date"], ("plan-user-0000", "2025-03-01", "2025-03-31"))
+
+# Name lookups for one user's history; the whole history needs every row of these tables
+HISTORY_USER_NAMES_SQL = register_statement("history_user_names", '''
+    SELECT id, name FROM users WHERE name = ?
+    ''', ["sqlite_autoindex_users_1"], ("plan-user-0000",))
+
+HISTORY_CATEGORY_NAMES_SQL = register_statement("history_category_names", '''
+    SELECT id, name FROM categories WHERE user_id = (SELECT id FROM users WHERE name = ?)
+    ''', ["sqlite_autoindex_categories_1"], ("plan-user-0000",))
+
+HISTORY_SUBCATEGORY_NAMES_SQL = register_statement("history_subcategory_names", '''
+    SELECT id, name FROM subcategories WHERE user_id = (SELECT id FROM users WHERE name = ?)
+    ''', ["idx_subcategories_user"], ("plan-user-0000",))
+
+def iter_history(user_name=None, start_date=None, end_date=None, chunksize=HISTORY_CHUNK_SIZE):
+    # Stream raw activities as compact DataFrames of at most chunksize rows. Names are
+    # Categoricals with the same categories in every chunk, so chunks concatenate and group cleanly.
+    conditions, params = ["a.user_id IN (SELECT id FROM users)"], []
+    if user_name is not None:
+        conditions = ["a.user_id = (SELECT id FROM users WHERE name = ?)"]
+        params.append(user_name)
+    if start_date is not None:
+        conditions.append("a.date >= ?")
+        params.append(str(start_date))
+    if end_date is not None:
+        conditions.append("a.date <= ?")
+        params.append(str(end_date))
+    
+    conn = create_connection()
+    try:
+        cursor = conn.cursor()
+        if user_name is not None:
+            cursor.execute(HISTORY_USER_NAMES_SQL, (user_name,))
+            user_names = dict(cursor.fetchall())
+            cursor.execute(HISTORY_CATEGORY_NAMES_SQL, (user_name,))
+            category_names = dict(cursor.fetchall())
+            cursor.execute(HISTORY_SUBCATEGORY_NAMES_SQL, (user_name,))
+            subcategory_names = dict(cursor.fetchall())
+        else:
+            cursor.execute("SELECT id, name FROM users")
+            user_names = dict(cursor.fetchall())
+            cursor.execute("SELECT id, name FROM categories")
+            category_names = dict(cursor.fetchall())
+            cursor.execute("SELECT id, name FROM subcategories")
+            subcategory_names = dict(cursor.fetchall())
+        user_dtype = pd.CategoricalDtype(sorted(set(user_names.values())))
+        category_dtype = pd.CategoricalDtype(sorted(set(category_names.values())))
+        subcategory_dtype = pd.CategoricalDtype(sorted(set(subcategory_names.values())))
+        
+        for chunk in pd.read_sql_query(_history_sql(conditions), conn, params=params, chunksize=chunksize):
+            yield pd.DataFrame({
+                'user_name': pd.Categorical(chunk['user_id'].map(user_names), dtype=user_dtype),
+                'date': pd.to_datetime(chunk['date'], format='ISO8601', errors='coerce'),
+                'category': pd.Categorical(chunk['category_id'].map(category_names), dtype=category_dtype),
+                'subcategory': pd.Categorical(chunk['subcategory_id'].map(subcategory_names), dtype=subcategory_dtype),
+                'start_minute': pd.to_numeric(chunk['start_minute'], errors='coerce').astype('Int16'),
+                'end_minute': pd.to_numeric(chunk['end_minute'], errors='coerce').astype('Int16'),
+                'hours': pd.to_numeric(chunk['hours'], errors='coerce').astype('float32'),
+            })
+    finally:
+        conn.close()
+
+def fold_history(func, initial, **kwargs):
+    # Combine chunks into a running aggregate with func(aggregate, chunk)
+    result = initial
+    for chunk in iter_history(**kwargs):
+        result = func(result, chunk)
+    return result
+
+def get_history_totals(user_name=None, start_date=None, end_date=None):
+    # Hours per user, month and category over any range, folded chunk by chunk and
+    # combined with the compacted monthly summaries whose whole month is inside the range
+    def add_chunk(totals, chunk):
+        chunk_totals = chunk.groupby(
+            ['user_name', chunk['date'].dt.strftime('%Y-%m').rename('month'), 'category'], observed=True
+        )['hours'].sum().astype('float64')
+        return chunk_totals if totals is None else totals.add(chunk_totals, fill_value=0)
+    
+    totals = fold_history(add_chunk, None, user_name=user_name, start_date=start_date, end_date=end_date)
+    
+    conditions, params = ["s.user_id IN (SELECT id FROM users)"], []
+    if user_name is not None:
+        conditions.append("u.name = ?")
+        params.append(user_name)
+    if start_date is not None:
+        conditions.append("s.month || '-01' >= ?")
+        params.append(str(start_date))
+    if end_date is not None:
+        conditions.append("date(s.month || '-01', '+1 month', '-1 day') <= ?")
+        params.append(str(end_date))
+    conn = create_connection()
+    summaries = pd.read_sql_query(f'''
+    SELECT u.name AS user_name, s.month, c.name AS category, SUM(s.total_hours) AS hours
+    FROM activity_summaries s
+    JOIN users u ON u.id = s.user_id
+    JOIN categories c ON c.id = s.category_id
+    WHERE {' AND '.join(conditions)}
+    GROUP BY u.name, s.month, c.name
+    ''', conn, params=params).set_index(['user_name', 'month', 'category'])['hours']
+    conn.close()
+    
+    if totals is None:
+        totals = summaries
+    elif not summaries.empty:
+        totals.index = totals.index.set_levels([level.astype(str) for level in totals.index.levels])
+        totals = totals.add(summaries, fill_value=0)
+    return totals.rename('hours').reset_index().sort_values(['user_name', 'month', 'category'], ignore_index=True)
+
+# Aligned per-day matrices and driver results keyed by user (None for all users)
+_driver_cache = {}
+_driver_cache_lock = threading.Lock()
+
+def _daily_matrix_sql(user_filter):
+    # (category hours, scores, habits) per user and day for a user filter taking an {alias}
+    return (f'''
+    SELECT h.user_id, h.date, c.name AS category, SUM(h.hours) AS hours
+    FROM (
+        SELECT user_id, date, category_id, {_duration_hours_sql()} AS hours
+        FROM daily_activities
+        {user_filter.format(alias="")}
+        UNION ALL
+        SELECT user_id, date, category_id, total_hours
+        FROM activity_daily_summaries
+        {user_filter.format(alias="")}
+    ) h
+    JOIN categories c ON c.id = h.category_id
+    GROUP BY h.user_id, h.date, c.name
+    ''', f'''
+    SELECT user_id, date, life_score, work_score, health_score
+    FROM qualitative_metrics
+    {user_filter.format(alias="")}
+    ''', f'''
+    SELECT user_id, date, workouts, meditation_minutes, brain_training_minutes, wake_up_time
+    FROM quantitative_metrics
+    {user_filter.format(alias="")}
+    ''')
+
+_DAILY_MATRIX_USER_SQL = _daily_matrix_sql("WHERE {alias}user_id = (SELECT id FROM users WHERE name = ?)")
+_DAILY_MATRIX_ALL_SQL = _daily_matrix_sql("WHERE {alias}user_id IN (SELECT id FROM users)")
+register_statement("daily_matrix_hours", _DAILY_MATRIX_USER_SQL[0],
+                   ["idx_daily_activities_user_date", "sqlite_autoindex_activity_daily_summaries_1"], ("plan-user-0000", "plan-user-0000"))
+register_statement("daily_matrix_scores", _DAILY_MATRIX_USER_SQL[1], ["idx_qualitative_metrics_user_date"], ("plan-user-0000",))
+register_statement("daily_matrix_habits", _DAILY_MATRIX_USER_SQL[2], ["idx_quantitative_metrics_user_date"], ("plan-user-0000",))
+
+def get_daily_matrix(user_name=None):
+    # One row per (user_id, day) with category hours, habits and scores; missing days are NaN rows
+    hours_sql, scores_sql, habits_sql = _DAILY_MATRIX_USER_SQL if user_name is not None else _DAILY_MATRIX_ALL_SQL
+    params = (user_name,) if user_name is not None else ()
+    
+    conn = create_connection()
+    # The hours read raw activities and the per-day rollups of compacted ones
+    hours = pd.read_sql_query(hours_sql, conn, params=params * 2)
+    scores = pd.read_sql_query(scores_sql, conn, params=params)
+    habits = pd.read_sql_query(habits_sql, conn, params=params)
+    conn.close()
+    
+    wake = habits.pop('wake_up_time').fillna('').astype(str)
+    habits['wake_up_minutes'] = pd.to_numeric(wake.str.slice(0, 2), errors='coerce') * 60 + \
+        pd.to_numeric(wake.str.slice(3, 5), errors='coerce')
+    hours['category'] = hours['category'] + ' hours'
+    hours = hours.pivot_table(index=['user_id', 'date'], columns='category', values='hours', aggfunc='sum')
+    
+    matrix = pd.concat([
+        hours,
+        habits.set_index(['user_id', 'date']),
+        scores.set_index(['user_id', 'date']),
+    ], axis=1)
+    matrix = matrix.reset_index()
+    matrix['date'] = pd.to_datetime(matrix['date'], format='ISO8601', errors='coerce')
+    matrix = matrix.dropna(subset=['date']).set_index(['user_id', 'date']).sort_index().astype(float)
+    
+    # Reindex each user onto consecutive days so a shift of one row is one calendar day
+    frames = []
+    for user_id, group in matrix.groupby(level='user_id'):
+        days = pd.date_range(group.index.get_level_values('date').min(), group.index.get_level_values('date').max(), freq='D')
+        frames.append(group.droplevel('user_id').reindex(days).assign(user_id=user_id))
+    columns = sorted(set(matrix.columns) - set(SCORE_COLUMNS)) + SCORE_COLUMNS
+    if not frames:
+        empty_index = pd.MultiIndex.from_arrays([[], pd.DatetimeIndex([])], names=['user_id', 'date'])
+        return pd.DataFrame(index=empty_index, columns=columns, dtype=float)
+    matrix = pd.concat(frames).rename_axis('date').set_index('user_id', append=True).swaplevel()
+    return matrix.reindex(columns=columns)
+
+def _pairwise_regression(X, Y):
+    # Correlation and least-squares fit for every (feature, target) pair over pairwise-complete rows
+    x_valid = ~np.isnan(X)
+    y_valid = ~np.isnan(Y)
+    x = np.where(x_valid, X, 0.0)
+    y = np.where(y_valid, Y, 0.0)
+    x_valid = x_valid.astype(float)
+    y_valid = y_valid.astype(float)
+    
+    n = x_valid.T @ y_valid
+    sum_x = x.T @ y_valid
+    sum_y = x_valid.T @ y
+    with np.errstate(divide='ignore', invalid='ignore'):
+        cov = x.T @ y - sum_x * sum_y / n
+        var_x = (x * x).T @ y_valid - sum_x ** 2 / n
+        var_y = x_valid.T @ (y * y) - sum_y ** 2 / n
+        correlation = cov / np.sqrt(var_x * var_y)
+        slope = cov / var_x
+        intercept = (sum_y - slope * sum_x) / n
+    return n, correlation, slope, intercept
+
+def analyze_drivers(user_name=None, max_lag=DRIVER_MAX_LAG):
+    # Correlate each habit and category's hours with the scores 0..max_lag days later
+    key = (user_name, max_lag)
+    version = get_data_version(user_name)
+    with _driver_cache_lock:
+        cached = _driver_cache.get(key)
+    if cached is not None and cached[0] == version:
+        return cached[1]
+    
+    matrix = get_daily_matrix(user_name)
+    columns = ['feature', 'target', 'lag_days', 'days', 'correlation', 'slope', 'intercept', 'r_squared']
+    if matrix.empty:
+        drivers = pd.DataFrame(columns=columns)
+        with _driver_cache_lock:
+            _driver_cache[key] = (version, drivers)
+        return drivers
+    
+    features = [column for column in matrix.columns if column not in SCORE_COLUMNS]
+    X = matrix[features].to_numpy(dtype=float)
+    results = []
+    for lag in range(max_lag + 1):
+        # Shift within each user so one user's last day never lines up with the next user's first
+        Y = matrix[SCORE_COLUMNS].groupby(level='user_id').shift(-lag).to_numpy(dtype=float)
+        n, correlation, slope, intercept = _pairwise_regression(X, Y)
+        for i, feature in enumerate(features):
+            for j, target in enumerate(SCORE_COLUMNS):
+                results.append((feature, target, lag, int(n[i, j]), correlation[i, j], slope[i, j], intercept[i, j]))
+    
+    drivers = pd.DataFrame(results, columns=columns[:-1])
+    drivers = drivers[drivers['days'] >= DRIVER_MIN_DAYS].dropna(subset=['correlation'])
+    drivers['r_squared'] = drivers['correlation'] ** 2
+    drivers = drivers.sort_values(['lag_days', 'r_squared'], ascending=[True, False]).reset_index(drop=True)
+    
+    with _driver_cache_lock:
+        _driver_cache[key] = (version, drivers)
+    return drivers
+
+def rebuild_metric_stats(user_name=None):
+    # Recompute every running statistic from the full history in one vectorized pass
+    # Holds off the incremental writers, so none of their updates lands between the read and the replace
+    with _interval_lock:
+        matrix = get_daily_matrix(user_name)
+        if matrix.empty:
+            _replace_metric_stats(user_name, [])
+            return
+        long = matrix.reset_index().melt(id_vars=['user_id', 'date'], var_name='metric', value_name='value')
+        long = long.dropna(subset=['value']).sort_values(['user_id', 'metric', 'date'])
+        grouped = long.groupby(['user_id', 'metric'])['value']
+        long['ewm_mean'] = grouped.transform(lambda values: values.ewm(alpha=STATS_EWM_ALPHA, adjust=False).mean())
+        long['ewm_var'] = grouped.transform(lambda values: values.ewm(alpha=STATS_EWM_ALPHA, adjust=False).var(bias=True))
+    
+        keys = ['user_id', 'metric']
+        stats = grouped.agg(n='count', mean='mean', var='var').reset_index()
+        stats['m2'] = stats['var'].fillna(0) * (stats['n'] - 1)
+        last = long.groupby(keys).nth(-1)[keys + ['date', 'ewm_mean', 'ewm_var']]
+        previous = long.groupby(keys).nth(-2)[keys + ['ewm_mean', 'ewm_var']]
+        previous = previous.rename(columns={'ewm_mean': 'prev_ewm_mean', 'ewm_var': 'prev_ewm_var'})
+        stats = stats.merge(last, on=keys).merge(previous, on=keys, how='left')
+        stats['last_date'] = stats['date'].dt.strftime('%Y-%m-%d')
+        stats = stats.astype(object).where(stats.notna(), None)
+        _replace_metric_stats(user_name, stats[['user_id', 'metric', 'n', 'mean', 'm2', 'ewm_mean', 'ewm_var',
+                                                'prev_ewm_mean', 'prev_ewm_var', 'last_date']].itertuples(index=False, name=None))
+
+def _replace_metric_stats(user_name, rows):
+    conn = create_connection()
+    cursor = conn.cursor()
+    if user_name is None:
+        cursor.execute("DELETE FROM metric_stats")
+    else:
+        cursor.execute("DELETE FROM metric_stats WHERE user_id = (SELECT id FROM users WHERE name = ?)", (user_name,))
+    cursor.executemany('''
+    INSERT INTO metric_stats
+        (user_id, metric, n, mean, m2, ewm_mean, ewm_var, prev_ewm_mean, prev_ewm_var, last_date, stale)
+    VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, 0)
+    ''', rows)
+    conn.commit()
+    conn.close()
+
+STALE_METRIC_STATS_SQL = register_statement("stale_metric_stats", '''
+    SELECT 1 FROM metric_stats WHERE user_id = (SELECT id FROM users WHERE name = ?) AND stale = 1 LIMIT 1
+    ''', ["sqlite_autoindex_metric_stats_1"], ("plan-user-0000",))
+
+METRIC_STATS_FOR_USER_SQL = register_statement("metric_stats_for_user", '''
+    SELECT metric, n, mean, m2, ewm_mean, ewm_var, prev_ewm_mean, prev_ewm_var, last_date
+    FROM metric_stats WHERE user_id = (SELECT id FROM users WHERE name = ?)
+    ''', ["sqlite_autoindex_metric_stats_1"], ("plan-user-0000",))
+
+def get_anomalies(user_name, date):
+    # Metrics whose value on this day is far from the user's history (excluding the day itself)
+    columns = ['metric', 'value', 'typical', 'z_score', 'direction']
+    conn = create_connection()
+    cursor = conn.cursor()
+    cursor.execute(STALE_METRIC_STATS_SQL, (user_name,))
+    if cursor.fetchone():
+        conn.close()
+        rebuild_metric_stats(user_name)
+        conn = create_connection()
+        cursor = conn.cursor()
+    
+    values = _daily_metric_values(cursor, user_name, date)
+    cursor.execute(METRIC_STATS_FOR_USER_SQL, (user_name,))
+    stats = {row[0]: row[1:] for row in cursor.fetchall()}
+    conn.close()
+    
+    flagged = []
+    for metric, value in values.items():
+        if metric not in stats:
+            continue
+        n, mean, m2, ewm_mean, ewm_var, prev_ewm_mean, prev_ewm_var, last_date = stats[metric]
+        if n - 1 < ANOMALY_MIN_DAYS:
+            continue
+        # Take the day back out of the cumulative statistics
+        baseline_mean = (n * mean - value) / (n - 1)
+        baseline_var = max(0.0, m2 - (value - baseline_mean) * (value - mean)) / (n - 2)
+        z_scores = [(value - baseline_mean) / baseline_var ** 0.5] if baseline_var > 0 else []
+        # The weighted state already includes the day; compare against the state before it
+        if date == last_date:
+            ewm_mean, ewm_var = prev_ewm_mean, prev_ewm_var
+        elif last_date is None or date < last_date:
+            ewm_mean, ewm_var = None, None
+        if ewm_mean is not None and ewm_var:
+            z_scores.append((value - ewm_mean) / ewm_var ** 0.5)
+        if not z_scores:
+            continue
+        z_score = max(z_scores, key=abs)
+        if abs(z_score) >= ANOMALY_Z_THRESHOLD:
+            flagged.append((metric, value, round(ewm_mean if ewm_mean is not None else baseline_mean, 2),
+                            round(z_score, 2), "high" if z_score > 0 else "low"))
+    return pd.DataFrame(flagged, columns=columns)
+
+# Team-wide aggregates keyed by period, reused until any user's data changes
+_team_analytics_cache = {}
+_team_analytics_lock = threading.Lock()
+
+def get_period_range(period):
+    end_date = datetime.now().date()
+    if period == "Weekly":
+        return end_date - timedelta(days=7), end_date
+    return end_date.replace(day=1), end_date
+
+TEAM_CATEGORY_HOURS_SQL = register_statement("team_category_hours", f'''
+    WITH activity_hours AS (
+        SELECT user_id, category_id,
+               {_duration_hours_sql()} AS hours
+        FROM daily_activities
+        WHERE date BETWEEN ? AND ?
+        UNION ALL
+        SELECT user_id, category_id, total_hours
+        FROM activity_summaries
+        WHERE month BETWEEN ? AND ?
+    )
+    SELECT u.name AS user_name, c.name AS category,
+           SUM(h.hours) AS total_hours,
+           SUM(h.hours) / ? AS avg_daily_hours,
+           PERCENT_RANK() OVER (PARTITION BY c.name ORDER BY SUM(h.hours)) AS percentile
+    FROM activity_hours h
+    JOIN users u ON u.id = h.user_id
+    JOIN categories c ON c.id = h.category_id
+    GROUP BY h.user_id, h.category_id
+    ORDER BY u.name, c.name
+    ''', ["idx_daily_activities_date", "idx_activity_summaries_month"], ("2025-03-01", "2025-03-31", "2025-03", "2025-03", 31))
+
+TEAM_USER_SCORES_SQL = register_statement("team_user_scores", '''
+    WITH user_scores AS (
+        SELECT user_id,
+               AVG(life_score) AS life_score,
+               AVG(work_score) AS work_score,
+               AVG(health_score) AS health_score,
+               COUNT(*) AS days_logged
+        FROM qualitative_metrics
+        WHERE date BETWEEN ? AND ?
+        GROUP BY user_id
+    )
+    SELECT u.name AS user_name, s.life_score, s.work_score, s.health_score, s.days_logged,
+           PERCENT_RANK() OVER (ORDER BY s.life_score) AS life_score_percentile,
+           PERCENT_RANK() OVER (ORDER BY s.work_score) AS work_score_percentile,
+           PERCENT_RANK() OVER (ORDER BY s.health_score) AS health_score_percentile
+    FROM user_scores s
+    JOIN users u ON u.id = s.user_id
+    ORDER BY u.name
+    ''', ["idx_qualitative_metrics_date"], ("2025-03-01", "2025-03-31"))
+
+TEAM_SCORE_DISTRIBUTION_SQL = register_statement("team_score_distribution", '''
+    WITH metrics (metric) AS (VALUES ('life_score'), ('work_score'), ('health_score'))
+    SELECT m.metric,
+           CASE m.metric
+               WHEN 'life_score' THEN q.life_score
+               WHEN 'work_score' THEN q.work_score
+               ELSE q.health_score
+           END AS score,
+           COUNT(*) AS days
+    FROM qualitative_metrics q
+    JOIN users u ON u.id = q.user_id
+    CROSS JOIN metrics m
+    WHERE q.date BETWEEN ? AND ?
+    GROUP BY m.metric, score
+    ORDER BY m.metric, score
+    ''', ["idx_qualitative_metrics_date"], ("2025-03-01", "2025-03-31"))
+
+def get_team_analytics(start_date, end_date):
+    key = (str(start_date), str(end_date))
+    version = get_data_version()
+    with _team_analytics_lock:
+        cached = _team_analytics_cache.get(key)
+    if cached is not None and cached[0] == version:
+        return cached[1]
+    
+    start_date, end_date = pd.Timestamp(start_date), pd.Timestamp(end_date)
+    days = (end_date - start_date).days + 1
+    # Compacted months only count when the period covers them entirely
+    first_full_month = (start_date if start_date.day == 1 else start_date + pd.offsets.MonthBegin(1)).strftime('%Y-%m')
+    last_full_month = (end_date if end_date.is_month_end else end_date - pd.offsets.MonthEnd(1)).strftime('%Y-%m')
+    start_str, end_str = start_date.strftime('%Y-%m-%d'), end_date.strftime('%Y-%m-%d')
+    
+    conn = create_connection()
+    category_hours = pd.read_sql_query(TEAM_CATEGORY_HOURS_SQL, conn,
+                                       params=(start_str, end_str, first_full_month, last_full_month, days))
+    user_scores = pd.read_sql_query(TEAM_USER_SCORES_SQL, conn, params=(start_str, end_str))
+    score_distribution = pd.read_sql_query(TEAM_SCORE_DISTRIBUTION_SQL, conn, params=(start_str, end_str))
+    conn.close()
+    
+    result = {
+        "category_hours": category_hours,
+        "user_scores": user_scores,
+        "score_distribution": score_distribution,
+    }
+    with _team_analytics_lock:
+        _team_analytics_cache[key] = (version, result)
+    return result
+
+def get_team_position(team, user_name):
+    # One row per metric: the user's value, the team quartiles and the user's percentile rank
+    hours = team["category_hours"]
+    scores = team["user_scores"]
+    rows = []
+    for category_name, group in hours.groupby('category'):
+        user_row = group[group['user_name'] == user_name]
+        rows.append((f"{category_name} hours/day", group['avg_daily_hours'],
+                     user_row['avg_daily_hours'], user_row['percentile']))
+    for column in ['life_score', 'work_score', 'health_score']:
+        user_row = scores[scores['user_name'] == user_name]
+        rows.append((column.replace('_', ' ').title(), scores[column],
+                     user_row[column], user_row[f"{column}_percentile"]))
+    
+    return pd.DataFrame([{
+        "metric": metric,
+        "value": user_value.iloc[0] if not user_value.empty else None,
+        "team_p25": values.quantile(0.25),
+        "team_median": values.quantile(0.5),
+        "team_p75": values.quantile(0.75),
+        "percentile": round(percentile.iloc[0] * 100, 1) if not percentile.empty else None,
+    } for metric, values, user_value, percentile in rows])
+
+_last_interaction = datetime.now()
+
+def note_interaction():
+    global _last_interaction
+    _last_interaction = datetime.now()
+
+def _report_days_sql(day_filter):
+    # (hours per day, category and subcategory; scores per day; raw intervals) for a day filter
+    # on date that takes its parameters after the user name
+    return (f'''
+    SELECT a.date, c.name, s.name,
+           SUM({_duration_hours_sql('a.')})
+    FROM daily_activities a
+    LEFT JOIN categories c ON c.id = a.category_id
+    LEFT JOIN subcategories s ON s.id = a.subcategory_id
+    WHERE a.user_id = (SELECT id FROM users WHERE name = ?) AND a.{day_filter}
+    GROUP BY a.date, a.category_id, a.subcategory_id
+    ''', f'''
+    SELECT date, life_score, work_score, health_score
+    FROM qualitative_metrics
+    WHERE user_id = (SELECT id FROM users WHERE name = ?) AND {day_filter}
+    ''', f'''
+    SELECT date, start_time, end_time FROM daily_activities
+    WHERE user_id = (SELECT id FROM users WHERE name = ?) AND {day_filter}
+    ''')
+
+_REPORT_RANGE_SQL = _report_days_sql("date BETWEEN ? AND ?")
+register_statement("report_days_hours", _REPORT_RANGE_SQL[0], ["idx_daily_activities_user_date"],
+                   ("plan-user-0000", "2025-03-01", "2025-03-07"))
+register_statement("report_days_scores", _REPORT_RANGE_SQL[1], ["idx_qualitative_metrics_user_date"],
+                   ("plan-user-0000", "2025-03-01", "2025-03-07"))
+register_statement("report_days_intervals", _REPORT_RANGE_SQL[2], ["idx_daily_activities_user_date"],
+                   ("plan-user-0000", "2025-03-01", "2025-03-07"))
+register_statement("report_changed_days_hours", _report_days_sql("date IN (?, ?)")[0], ["idx_daily_activities_user_date"],
+                   ("plan-user-0000", "2025-03-01", "2025-03-05"))
+
+def _report_days(user_name, start_date, end_date, dates=None):
+    # Per-day category/subcategory hours and scores for a range, or for specific days in it
+    day_filter = "date BETWEEN ? AND ?"
+    params = [str(start_date), str(end_date)]
+    if dates is not None:
+        day_filter = f"date IN ({', '.join('?' * len(dates))})"
+        params = [str(day) for day in dates]
+    hours_sql, scores_sql, intervals_sql = _report_days_sql(day_filter)
+    
+    conn = create_connection()
+    cursor = conn.cursor()
+    cursor.execute(hours_sql, [user_name, *params])
+    days = {}
+    for day, category_name, subcategory_name, hours in cursor.fetchall():
+        days.setdefault(day, {"breakdown": [], "scores": None})["breakdown"].append([category_name, subcategory_name, hours])
+    cursor.execute(scores_sql, [user_name, *params])
+    for day, *scores in cursor.fetchall():
+        days.setdefault(day, {"breakdown": [], "scores": None})["scores"] = scores
+    intervals = pd.read_sql_query(intervals_sql, conn, params=[user_name, *params])
+    conn.close()
+    
+    # Time covered per day, so overlapping activities are not counted twice in the totals
+    intervals['start'] = _minutes_of_day(intervals['start_time'])
+    intervals['end'] = _minutes_of_day(intervals['end_time'])
+    intervals = intervals.dropna(subset=['start', 'end'])
+    intervals['end'] = intervals['end'].where(intervals['end'] >= intervals['start'], intervals['end'] + 24 * 60)
+    for day, minutes in union_minutes(intervals, ['date']).items():
+        days[day]["union_hours"] = minutes / 60
+    return days
+
+def _report_total_hours(days):
+    # Days stored before union hours were recorded fall back to their summed breakdown
+    return sum(data.get("union_hours", sum(row[2] or 0 for row in data["breakdown"])) for data in days.values())
+
+CHANGED_DAYS_SQL = register_statement("changed_days", '''
+    SELECT date FROM day_versions
+    WHERE user_id = (SELECT id FROM users WHERE name = ?) AND version > ? AND date BETWEEN ? AND ?
+    ''', ["sqlite_autoindex_day_versions_1"], ("plan-user-0000", 100, "2025-03-01", "2025-03-31"))
+
+def _changed_days(user_name, since_version, start_date, end_date):
+    conn = create_connection()
+    cursor = conn.cursor()
+    cursor.execute(CHANGED_DAYS_SQL, (user_name, since_version, str(start_date), str(end_date)))
+    changed = {row[0] for row in cursor.fetchall()}
+    conn.close()
+    return changed
+
+def _report_frames(days):
+    # Activity hours and daily scores as frames, from _report_days output
+    rows = [(day, category_name, subcategory_name, hours)
+            for day, data in days.items() for category_name, subcategory_name, hours in data["breakdown"]]
+    df = pd.DataFrame(rows, columns=['date', 'category', 'subcategory', 'duration'])
+    scores = pd.DataFrame([(day, *days[day]["scores"]) for day in sorted(days) if days[day]["scores"]],
+                          columns=['date'] + SCORE_COLUMNS)
+    return df, scores
+
+def compute_period_report(user_name, period, previous=None):
+    # Build a report from scratch, or refresh a previous one by recomputing only the days
+    # that changed or entered the period since it was computed
+    start_date, end_date = (day.isoformat() for day in get_period_range(period))
+    version = get_data_version(user_name)
+    if previous is None or previous["period_start"] > start_date:
+        days = _report_days(user_name, start_date, end_date)
+    else:
+        days = {day: data for day, data in previous["days"].items() if start_date <= day <= end_date}
+        changed = _changed_days(user_name, previous["data_version"], start_date, end_date)
+        if previous["period_end"] < end_date:
+            new_start = max(start_date, (pd.Timestamp(previous["period_end"]) + pd.Timedelta(days=1)).strftime('%Y-%m-%d'))
+            changed.update(pd.date_range(new_start, end_date).strftime('%Y-%m-%d'))
+        if changed:
+            for day in changed:
+                days.pop(day, None)
+            days.update(_report_days(user_name, start_date, end_date, sorted(changed)))
+    
+    df, scores = _report_frames(days)
+    build_figures = build_weekly_figures if period == "Weekly" else build_monthly_figures
+    pie_chart, line_chart, total_hours = build_figures(df, scores, _report_total_hours(days))
+    breakdown = df.groupby(['category', 'subcategory'])['duration'].sum().reset_index()
+    breakdown = breakdown.sort_values('duration', ascending=False)
+    
+    return {
+        "user_name": user_name,
+        "period": period,
+        "period_start": start_date,
+        "period_end": end_date,
+        "data_version": version,
+        "computed_at": datetime.now().isoformat(timespec='seconds'),
+        "days": days,
+        "total_hours": float(total_hours),
+        "breakdown": breakdown.to_dict('records'),
+        "figures": {"pie": pie_chart.to_json(), "line": line_chart.to_json()},
+    }
+
+LOAD_REPORT_SQL = register_statement("load_report", '''
+    SELECT payload FROM report_store
+    WHERE user_id = (SELECT id FROM users WHERE name = ?) AND period = ?
+    ''', ["sqlite_autoindex_report_store_1"], ("plan-user-0000", "Weekly"))
+
+def load_report(user_name, period):
+    conn = create_connection()
+    cursor = conn.cursor()
+    cursor.execute(LOAD_REPORT_SQL, (user_name, period))
+    row = cursor.fetchone()
+    conn.close()
+    return json.loads(row[0]) if row else None
+
+def save_report(report):
+    # Never replace a stored report with one computed from older data
+    conn = create_connection()
+    cursor = conn.cursor()
+    cursor.execute('''
+    INSERT INTO report_store (user_id, period, data_version, computed_at, payload)
+    VALUES ((SELECT id FROM users WHERE name = ?), ?, ?, ?, ?)
+    ON CONFLICT (user_id, period) DO UPDATE SET
+        data_version = excluded.data_version,
+        computed_at = excluded.computed_at,
+        payload = excluded.payload
+    WHERE excluded.data_version >= report_store.data_version
+    ''', (report["user_name"], report["period"], report["data_version"], report["computed_at"], json.dumps(report)))
+    conn.commit()
+    conn.close()
+
+def _report_is_current(report, user_name, period):
+    start_date, end_date = (day.isoformat() for day in get_period_range(period))
+    return (report["period_start"] == start_date and report["period_end"] == end_date
+            and report["data_version"] == get_data_version(user_name))
+
+def get_period_report(user_name, period):
+    # Serve the stored report, refreshing only its changed days when it is out of date
+    note_interaction()
+    return refresh_period_report(user_name, period)
+
+def refresh_period_report(user_name, period):
+    report = load_report(user_name, period)
+    if report is None or not _report_is_current(report, user_name, period):
+        report = compute_period_report(user_name, period, report)
+        save_report(report)
+    return report
+
+def compute_month_report(user_name, year, month):
+    # Figures and summary frames for one user and calendar month
+    month_start = datetime(year, month, 1).date()
+    month_end = month_start.replace(day=calendar.monthrange(year, month)[1])
+    days = _report_days(user_name, month_start, month_end)
+    df, scores = _report_frames(days)
+    pie_chart, line_chart, total_hours = build_monthly_figures(df, scores, _report_total_hours(days))
+    category_hours = df.groupby('category')['duration'].sum().reset_index(name='hours').sort_values('category')
+    return {
+        "user_name": user_name,
+        "month": month_start.strftime('%Y-%m'),
+        "total_hours": float(total_hours),
+        "figures": {"pie": pie_chart.to_json(), "line": line_chart.to_json()},
+        "category_hours": category_hours.reset_index(drop=True),
+        "calendar": format_monthly_data(get_monthly_data(user_name, year, month), year, month),
+    }
+
+def _init_report_worker():
+    global _read_only_connections
+    _read_only_connections = True
+    invalidate_category_catalog()
+
+def _run_report_job(job):
+    # job is ("period", user_name, period) or ("month", user_name, year, month)
+    kind, user_name, *args = job
+    if kind == "period":
+        period, = args
+        return compute_period_report(user_name, period, load_report(user_name, period))
+    return compute_month_report(user_name, *args)
+
+# One report pool shared by every run, started on first use. Starting forkserver workers
+# costs seconds, so the pool is only replaced when it breaks, stalls or is resized.
+_report_pool = None
+_report_pool_workers = 0
+_report_pool_lock = threading.Lock()
+
+def _get_report_pool(workers):
+    global _report_pool, _report_pool_workers
+    with _report_pool_lock:
+        if _report_pool is not None and _report_pool_workers != workers:
+            _report_pool.shutdown(wait=False, cancel_futures=True)
+            _report_pool = None
+        if _report_pool is None:
+            _report_pool = ProcessPoolExecutor(max_workers=workers, initializer=_init_report_worker,
+                                               mp_context=multiprocessing.get_context(REPORT_START_METHOD))
+            _report_pool_workers = workers
+        return _report_pool
+
+def _discard_report_pool(pool):
+    # Without waiting: a stalled worker exits once its current job returns
+    global _report_pool
+    with _report_pool_lock:
+        if _report_pool is pool:
+            _report_pool = None
+    pool.shutdown(wait=False, cancel_futures=True)
+
+def run_report_jobs(jobs, workers=REPORT_WORKERS, timeout=REPORT_TIMEOUT_SECONDS):
+    # Results come back in the order of jobs. Work is spread over a process pool whose
+    # workers read through their own read-only connections; when a pool cannot be used,
+    # or does not finish within timeout seconds, the jobs run in this process instead.
+    # A pool that broke since the last run is replaced once before giving up on it.
+    jobs = list(jobs)
+    if workers > 1 and len(jobs) > 1:
+        for attempt in range(2):
+            pool = None
+            try:
+                pool = _get_report_pool(workers)
+                deadline = perf_counter() + timeout
+                futures = [pool.submit(_run_report_job, job) for job in jobs]
+                return [future.result(timeout=max(0, deadline - perf_counter())) for future in futures]
+            except TimeoutError:
+                logger.error("Report pool did not finish %d jobs in %ss, running them sequentially", len(jobs), timeout)
+                _discard_report_pool(pool)
+                break
+            except BrokenProcessPool:
+                if attempt:
+                    logger.exception("Report pool broke again, running %d jobs sequentially", len(jobs))
+                else:
+                    logger.warning("Report pool broke, starting a new one")
+                if pool is not None:
+                    _discard_report_pool(pool)
+            except (OSError, pickle.PicklingError):
+                logger.exception("Report pool unavailable, running %d jobs sequentially", len(jobs))
+                if pool is not None:
+                    _discard_report_pool(pool)
+                break
+    return [_run_report_job(job) for job in jobs]
+
+def _user_names(user_names=None):
+    if user_names is not None:
+        return sorted(user_names)
+    conn = create_connection()
+    cursor = conn.cursor()
+    cursor.execute("SELECT name FROM users ORDER BY name")
+    names = [row[0] for row in cursor.fetchall()]
+    conn.close()
+    return names
+
+def generate_month_reports(start_month, end_month, user_names=None, workers=REPORT_WORKERS):
+    # Reports for every user and month in start_month..end_month (YYYY-MM), ordered by user then
+    # month, plus one frame of category hours across all of them
+    months = pd.period_range(start_month, end_month, freq='M')
+    jobs = [("month", name, period.year, period.month) for name in _user_names(user_names) for period in months]
+    reports = run_report_jobs(jobs, workers)
+    frames = [report["category_hours"].assign(user_name=report["user_name"], month=report["month"]) for report in reports]
+    columns = ['user_name', 'month', 'category', 'hours']
+    summary = pd.concat(frames, ignore_index=True)[columns] if frames else pd.DataFrame(columns=columns)
+    return reports, summary.astype({'hours': float})
+
+def run_report_precompute(workers=REPORT_WORKERS):
+    # Refresh every user's weekly and monthly reports; workers compute and this process writes
+    jobs = [("period", name, period) for name in _user_names() for period in REPORT_PERIODS]
+    reports = run_report_jobs(jobs, workers)
+    for report in reports:
+        save_report(report)
+    return len(reports)
+
+def start_report_scheduler(schedule_times=REPORT_SCHEDULE_TIMES, idle_minutes=REPORT_IDLE_MINUTES, workers=REPORT_WORKERS):
+    # Precompute reports at the scheduled times of day, and after the app has been idle
+    # for idle_minutes with new data since the last run
+    stop_event = threading.Event()
+    
+    def scheduler_loop():
+        last_run = datetime.now()
+        last_version = None
+        while not stop_event.wait(60):
+            now = datetime.now()
+            scheduled = [datetime.combine(now.date(), datetime.strptime(at, "%H:%M").time()) for at in schedule_times]
+            due = any(last_run < at <= now for at in scheduled)
+            version = get_data_version()
+            idle = now - _last_interaction >= timedelta(minutes=idle_minutes) and version != last_version
+            if not (due or idle):
+                continue
+            try:
+                count = run_report_precompute(workers)
+                logger.info("Precomputed %d reports", count)
+            except Exception:
+                logger.exception("Report precompute failed")
+            last_run, last_version = now, version
+    
+    threading.Thread(target=scheduler_loop, name="report-scheduler", daemon=True).start()
+    return stop_event
+
+RECENT_USERS_SQL = register_statement("recent_users", '''
+    SELECT u.name FROM change_log c
+    JOIN users u ON u.id = c.user_id
+    GROUP BY c.user_id
+    ORDER BY MAX(c.seq) DESC
+    LIMIT ?
+    ''', ["idx_change_log_user_seq"], (20,))
+
+def warm_start(max_users=WARM_START_USERS, time_budget=WARM_START_SECONDS):
+    # Load the most recently active users' catalogs, reports, dashboard summaries and current
+    # calendar months, reading the on-disk cache where it is still current
+    deadline = perf_counter() + time_budget
+    pruned = prune_warm_cache()
+    conn = create_connection()
+    user_names = [row[0] for row in conn.execute(RECENT_USERS_SQL, (max_users,)).fetchall()]
+    conn.close()
+    
+    today = datetime.now()
+    warmed = 0
+    for user_name in user_names:
+        if perf_counter() > deadline:
+            break
+        try:
+            get_category_catalog(user_name)
+            for period in REPORT_PERIODS:
+                refresh_period_report(user_name, period)
+            get_weekly_summary(user_name)
+            get_calendar_month(user_name, today.year, today.month, prefetch=False)
+            warmed += 1
+        except Exception:
+            logger.exception("Warm-up failed for %s", user_name)
+    logger.info("Warm start: %d of %d recent users loaded, %d stale cache entries dropped", warmed, len(user_names), pruned)
+    return warmed
+
+def start_warm_start(max_users=WARM_START_USERS, time_budget=WARM_START_SECONDS):
+    def warm_start_task():
+        try:
+            warm_start(max_users, time_budget)
+        except Exception:
+            logger.exception("Warm start failed")
+    
+    thread = threading.Thread(target=warm_start_task, name="warm-start", daemon=True)
+    thread.start()
+    return thread
+
+# Category lookups for a user whose categories are not loaded yet; _resolve_category_ids
+# finds or creates each one inside the caller's transaction
+_NEW_USER_CATALOG = {"category_ids": {}, "subcategory_ids": {}}
+
+def _write_routine_template(cursor, user_id, catalog, name, blocks):
+    # Store blocks as the user's active template in the caller's transaction; returns whether
+    # any categories had to be created
+    cursor.execute("INSERT OR IGNORE INTO routine_templates (user_id, name) VALUES (?, ?)", (user_id, name))
+    cursor.execute("SELECT id FROM routine_templates WHERE user_id = ? AND name = ?", (user_id, name))
+    template_id = cursor.fetchone()[0]
+    cursor.execute("UPDATE routine_templates SET active = (id = ?) WHERE user_id = ?", (template_id, user_id))
+    cursor.execute("DELETE FROM routine_blocks WHERE template_id = ?", (template_id,))
+    
+    created_any = False
+    rows = []
+    for position, (label, category, start_time, duration) in enumerate(blocks):
+        start_time = datetime.strptime(str(start_time).strip(), "%H:%M").strftime("%H:%M")
+        category_id, _, created = _resolve_category_ids(cursor, user_id, catalog, category, None)
+        created_any = created_any or created
+        rows.append((user_id, template_id, position, label, category_id, start_time, int(duration)))
+    cursor.executemany('''
+    INSERT INTO routine_blocks (user_id, template_id, position, label, category_id, start_time, duration_minutes)
+    VALUES (?, ?, ?, ?, ?, ?, ?)
+    ''', rows)
+    return created_any
+
+def save_routine_template(user_name, name, blocks):
+    # blocks: rows of (label, category, start_time, duration_minutes); the saved template becomes the active one
+    catalog = get_category_catalog(user_name)
+    user_id = catalog["user_id"]
+    conn = create_connection()
+    cursor = conn.cursor()
+    created_any = _write_routine_template(cursor, user_id, catalog, name, blocks)
+    
+    # Cached results refer to the previous plan's blocks
+    cursor.execute("DELETE FROM routine_adherence WHERE user_id = ?", (user_id,))
+    _record_change(cursor, user_name, "routine_blocks", "replace")
+    conn.commit()
+    conn.close()
+    if created_any:
+        invalidate_category_catalog(user_name)
+
+ROUTINE_BLOCKS_SQL = register_statement("routine_blocks", '''
+    SELECT b.id AS block_id, b.label, c.name AS category, b.category_id, b.start_time, b.duration_minutes
+    FROM routine_blocks b
+    JOIN routine_templates t ON t.id = b.template_id AND t.active = 1
+    LEFT JOIN categories c ON c.id = b.category_id
+    WHERE t.user_id = (SELECT id FROM users WHERE name = ?)
+    ORDER BY b.position
+    ''', ["sqlite_autoindex_routine_templates_1", "idx_routine_blocks_template"], ("plan-user-0000",))
+
+def get_routine_blocks(user_name):
+    conn = create_connection()
+    blocks = pd.read_sql_query(ROUTINE_BLOCKS_SQL, conn, params=(user_name,))
+    conn.close()
+    return blocks
+
+def _minutes_of_day(times):
+    # NaN for anything that is not a valid HH:MM time, so callers can drop those rows
+    times = times.astype(str)
+    hours = pd.to_numeric(times.str.slice(0, 2), errors='coerce')
+    minutes = pd.to_numeric(times.str.slice(3, 5), errors='coerce')
+    valid = (times.str.slice(2, 3) == ':') & hours.between(0, 23) & minutes.between(0, 59)
+    return (hours * 60 + minutes).where(valid)
+
+def match_routine(plan, actual):
+    # plan: one row per (date, block) with category_id, planned_start and planned_end in minutes.
+    # actual: one row per logged interval with date, category_id, start and end in minutes.
+    # Each planned block is credited with the minutes covered by same-category activities;
+    # drift is the start offset of the activity covering it most.
+    pairs = plan.merge(actual, on=['date', 'category_id'], how='left')
+    overlap = np.minimum(pairs['planned_end'], pairs['end']) - np.maximum(pairs['planned_start'], pairs['start'])
+    pairs['overlap'] = overlap.clip(lower=0).fillna(0)
+    pairs['drift_minutes'] = pairs['start'] - pairs['planned_start']
+    
+    keys = ['date', 'block_id']
+    result = plan.set_index(keys)
+    result['planned_minutes'] = result['planned_end'] - result['planned_start']
+    covered = pairs.groupby(keys)['overlap'].sum()
+    result['covered_minutes'] = np.minimum(covered.reindex(result.index).fillna(0), result['planned_minutes'])
+    best = pairs[pairs['overlap'] > 0].sort_values('overlap').drop_duplicates(keys, keep='last').set_index(keys)
+    result['drift_minutes'] = best['drift_minutes'].reindex(result.index)
+    result['missed'] = result['covered_minutes'] == 0
+    return result.reset_index()[['date', 'block_id', 'planned_minutes', 'covered_minutes', 'drift_minutes', 'missed']]
+
+def _actual_intervals(user_name, start_date, end_date):
+    # Logged intervals in minutes from their day's midnight. An activity that runs past midnight
+    # also counts on the next day, from a negative start, like the previous night in the day editor.
+    first_day = (pd.Timestamp(start_date) - pd.Timedelta(days=1)).strftime('%Y-%m-%d')
+    conn = create_connection()
+    actual = pd.read_sql_query(ACTIVITIES_IN_RANGE_SQL, conn, params=(user_name, first_day, str(end_date)))
+    conn.close()
+    actual['start'] = _minutes_of_day(actual['start_time'])
+    actual['end'] = _minutes_of_day(actual['end_time'])
+    actual = actual.dropna(subset=['start', 'end'])
+    # Activities ending past midnight are logged with an end time earlier than their start
+    actual['end'] = actual['end'].where(actual['end'] >= actual['start'], actual['end'] + 24 * 60)
+    spill = actual[actual['end'] > 24 * 60]
+    spill = spill.assign(date=(pd.to_datetime(spill['date']) + pd.Timedelta(days=1)).dt.strftime('%Y-%m-%d'),
+                         start=spill['start'] - 24 * 60, end=spill['end'] - 24 * 60)
+    actual = pd.concat([actual, spill], ignore_index=True)
+    actual = actual[actual['date'].between(str(start_date), str(end_date))]
+    return actual[['date', 'category_id', 'start', 'end']]
+
+DAY_VERSIONS_IN_RANGE_SQL = register_statement("day_versions_in_range", '''
+    SELECT date, version FROM day_versions
+    WHERE user_id = (SELECT id FROM users WHERE name = ?) AND date BETWEEN ? AND ?
+    ''', ["sqlite_autoindex_day_versions_1"], ("plan-user-0000", "2025-03-01", "2025-03-31"))
+
+# day_version is the newer of the versions of that day and the day before, whose
+# activities can run past midnight into it
+CACHED_ROUTINE_ADHERENCE_SQL = register_statement("cached_routine_adherence", '''
+    SELECT r.date, r.block_id, r.planned_minutes, r.covered_minutes, r.drift_minutes, r.missed
+    FROM routine_adherence r
+    LEFT JOIN day_versions d ON d.user_id = r.user_id AND d.date = r.date
+    LEFT JOIN day_versions p ON p.user_id = r.user_id AND p.date = date(r.date, '-1 day')
+    WHERE r.user_id = (SELECT id FROM users WHERE name = ?) AND r.date BETWEEN ? AND ?
+      AND r.day_version = MAX(COALESCE(d.version, 0), COALESCE(p.version, 0))
+    ''', ["sqlite_autoindex_routine_adherence_1", "sqlite_autoindex_day_versions_1"],
+    ("plan-user-0000", "2025-03-01", "2025-03-31"))
+
+def get_routine_adherence(user_name, start_date, end_date):
+    # Returns (per-block, per-day) plan-vs-actual frames for a date range. Days before today
+    # are final and their results are cached until a write touches that day again.
+    blocks = get_routine_blocks(user_name)
+    start_date, end_date = str(start_date), str(min(str(end_date), datetime.now().date().isoformat()))
+    today = datetime.now().date().isoformat()
+    dates = pd.date_range(start_date, end_date).strftime('%Y-%m-%d')
+    
+    conn = create_connection()
+    cached = pd.read_sql_query(CACHED_ROUTINE_ADHERENCE_SQL, conn, params=(user_name, start_date, end_date))
+    cached['missed'] = cached['missed'].astype(bool)
+    missing = dates[~dates.isin(cached['date'])]
+    
+    results = [cached]
+    if len(missing) and not blocks.empty:
+        plan = pd.DataFrame({'date': missing}).merge(blocks[['block_id', 'category_id', 'start_time', 'duration_minutes']], how='cross')
+        plan['planned_start'] = _minutes_of_day(plan['start_time'])
+        plan['planned_end'] = plan['planned_start'] + plan['duration_minutes']
+        plan = plan.dropna(subset=['planned_start'])
+        actual = _actual_intervals(user_name, missing.min(), missing.max())
+        computed = match_routine(plan[['date', 'block_id', 'category_id', 'planned_start', 'planned_end']],
+                                 actual[actual['date'].isin(missing)])
+        results.append(computed)
+        
+        final = computed[computed['date'] < today]
+        if not final.empty:
+            cursor = conn.cursor()
+            previous = (pd.to_datetime(final['date']) - pd.Timedelta(days=1)).dt.strftime('%Y-%m-%d')
+            cursor.execute(DAY_VERSIONS_IN_RANGE_SQL, (user_name, previous.min(), final['date'].max()))
+            day_versions = dict(cursor.fetchall())
+            day_version = np.maximum(final['date'].map(day_versions).fillna(0), previous.map(day_versions).fillna(0)).astype(int)
+            cursor.executemany('''
+            INSERT OR REPLACE INTO routine_adherence
+                (user_id, date, block_id, planned_minutes, covered_minutes, drift_minutes, missed, day_version)
+            VALUES ((SELECT id FROM users WHERE name = ?), ?, ?, ?, ?, ?, ?, ?)
+            ''', [(user_name, row.date, int(row.block_id), float(row.planned_minutes), float(row.covered_minutes),
+                   None if pd.isna(row.drift_minutes) else float(row.drift_minutes), int(row.missed), int(version))
+                  for row, version in zip(final.itertuples(index=False), day_version)])
+            conn.commit()
+    conn.close()
+    
+    per_block = pd.concat(results, ignore_index=True).astype({
+        'date': str, 'block_id': int, 'planned_minutes': float, 'covered_minutes': float, 'drift_minutes': float, 'missed': bool,
+    })
+    per_block = per_block[per_block['block_id'].isin(blocks['block_id'])]
+    per_block = per_block.merge(blocks[['block_id', 'label', 'category', 'start_time']], on='block_id')
+    per_block = per_block.sort_values(['date', 'start_time']).reset_index(drop=True)
+    
+    per_day = per_block.groupby('date').agg(
+        planned_minutes=('planned_minutes', 'sum'),
+        covered_minutes=('covered_minutes', 'sum'),
+        mean_abs_drift=('drift_minutes', lambda drift: drift.abs().mean()),
+        missed_blocks=('missed', 'sum'),
+    ).reset_index()
+    per_day['adherence'] = (per_day['covered_minutes'] / per_day['planned_minutes']).round(3)
+    return per_block, per_day
+
+SLEEP_INTERVALS_SQL = register_statement("sleep_intervals", '''
+    SELECT a.date, a.start_time, a.end_time
+    FROM daily_activities a
+    JOIN categories c ON c.id = a.category_id
+    WHERE a.user_id = (SELECT id FROM users WHERE name = ?) AND a.date BETWEEN ? AND ? AND c.name = ?
+    ''', ["idx_daily_activities_user_date"], ("plan-user-0000", "2025-03-01", "2025-03-31", "Sleep"))
+
+SLEEP_NIGHT_COLUMNS = ['night', 'sleep_start', 'sleep_end', 'asleep_minutes', 'in_bed_minutes', 'midpoint_minutes',
+                       'nap_minutes', 'wake_up_minutes', 'wake_diff_minutes']
+
+def _epoch_minutes(times):
+    return (pd.to_datetime(times) - pd.Timestamp(0)) // pd.Timedelta(minutes=1)
+
+def _sleep_intervals(user_name, start_date, end_date):
+    # Logged sleep as absolute minutes since 1970-01-01, so intervals can be joined across days
+    conn = create_connection()
+    df = pd.read_sql_query(SLEEP_INTERVALS_SQL, conn, params=(user_name, str(start_date), str(end_date), SLEEP_CATEGORY))
+    conn.close()
+    day_start = _epoch_minutes(df['date'])
+    start, end = _minutes_of_day(df['start_time']), _minutes_of_day(df['end_time'])
+    end = end.where(end >= start, end + 24 * 60)
+    intervals = pd.DataFrame({'start': day_start + start, 'end': day_start + end}).dropna().astype('int64')
+    return intervals[intervals['end'] > intervals['start']]
+
+def compute_sleep_nights(user_name, nights):
+    # One row per night, named by the date the user woke up. Sleep activities are stitched into
+    # episodes across midnight; the longest episode ending on a day is that night's sleep and
+    # any others ending that day count as naps.
+    nights = pd.DatetimeIndex(pd.to_datetime(nights))
+    intervals = _sleep_intervals(user_name, (nights.min() - pd.Timedelta(days=1)).strftime('%Y-%m-%d'),
+                                 nights.max().strftime('%Y-%m-%d'))
+    intervals = intervals.sort_values('start', kind='mergesort')
+    intervals['episode'] = (intervals['start'] > intervals['end'].cummax().shift() + SLEEP_EPISODE_GAP_MINUTES).cumsum()
+    episodes = intervals.groupby('episode').agg(start=('start', 'min'), end=('end', 'max'))
+    episodes['asleep'] = union_minutes(intervals, ['episode'])
+    episodes['night_start'] = episodes['end'] // (24 * 60) * (24 * 60)
+    episodes = episodes.sort_values(['night_start', 'asleep'], ascending=[True, False], kind='mergesort')
+    main = episodes.drop_duplicates('night_start').set_index('night_start')
+    naps = episodes.groupby('night_start')['asleep'].sum() - main['asleep']
+    
+    rows = pd.DataFrame({'night': nights.strftime('%Y-%m-%d'), 'night_start': _epoch_minutes(nights)})
+    rows = rows.join(main, on='night_start')
+    rows['nap_minutes'] = rows['night_start'].map(naps).fillna(0)
+    rows['asleep_minutes'] = rows.pop('asleep')
+    rows['in_bed_minutes'] = rows['end'] - rows['start']
+    # Minutes from the wake day's midnight, negative when the middle of the night falls before it
+    rows['midpoint_minutes'] = (rows['start'] + rows['end']) / 2 - rows['night_start']
+    rows['sleep_start'] = pd.to_datetime(rows['start'], unit='m').dt.strftime('%Y-%m-%d %H:%M')
+    rows['sleep_end'] = pd.to_datetime(rows['end'], unit='m').dt.strftime('%Y-%m-%d %H:%M')
+    
+    conn = create_connection()
+    wake = pd.read_sql_query('''
+    SELECT date, wake_up_time FROM quantitative_metrics
+    WHERE user_id = (SELECT id FROM users WHERE name = ?) AND date BETWEEN ? AND ?
+    ''', conn, params=(user_name, rows['night'].min(), rows['night'].max()))
+    conn.close()
+    rows['wake_up_minutes'] = rows['night'].map(dict(zip(wake['date'], wake['wake_up_time'].map(_wake_up_minutes))))
+    rows['wake_diff_minutes'] = rows['end'] - rows['night_start'] - rows['wake_up_minutes']
+    return rows[SLEEP_NIGHT_COLUMNS].astype({column: float for column in SLEEP_NIGHT_COLUMNS[3:]})
+
+CACHED_SLEEP_NIGHTS_SQL = register_statement("cached_sleep_nights", f'''
+    SELECT {', '.join(SLEEP_NIGHT_COLUMNS)}, day_version FROM sleep_nights
+    WHERE user_id = (SELECT id FROM users WHERE name = ?) AND night BETWEEN ? AND ?
+    ''', ["sqlite_autoindex_sleep_nights_1"], ("plan-user-0000", "2025-03-01", "2025-03-31"))
+
+def get_sleep_nights(user_name, start_date, end_date):
+    # Per-night sleep table for a date range. Nights before today are final and are cached
+    # until a write touches the wake-up day or the day before it.
+    today = datetime.now().date().isoformat()
+    start_date, end_date = str(start_date), str(min(str(end_date), today))
+    nights = pd.Series(pd.date_range(start_date, end_date).strftime('%Y-%m-%d'))
+    if nights.empty:
+        return pd.DataFrame(columns=SLEEP_NIGHT_COLUMNS)
+    
+    conn = create_connection()
+    cursor = conn.cursor()
+    previous = pd.Series((pd.to_datetime(nights) - pd.Timedelta(days=1)).dt.strftime('%Y-%m-%d'))
+    cursor.execute(DAY_VERSIONS_IN_RANGE_SQL, (user_name, previous.iloc[0], end_date))
+    day_versions = dict(cursor.fetchall())
+    versions = np.maximum(nights.map(day_versions).fillna(0), previous.map(day_versions).fillna(0)).astype(int)
+    versions.index = nights
+    
+    cached = pd.read_sql_query(CACHED_SLEEP_NIGHTS_SQL, conn, params=(user_name, start_date, end_date))
+    cached = cached[cached['day_version'] == cached['night'].map(versions)].drop(columns='day_version')
+    missing = nights[~nights.isin(cached['night'])]
+    
+    results = [cached]
+    if len(missing):
+        computed = compute_sleep_nights(user_name, missing)
+        results.append(computed)
+        final = computed[computed['night'] < today]
+        if not final.empty and get_category_catalog(user_name)["user_id"] is not None:
+            cursor.executemany(f'''
+            INSERT OR REPLACE INTO sleep_nights (user_id, {', '.join(SLEEP_NIGHT_COLUMNS)}, day_version)
+            VALUES ((SELECT id FROM users WHERE name = ?), {', '.join('?' * len(SLEEP_NIGHT_COLUMNS))}, ?)
+            ''', [(user_name, *(None if pd.isna(value) else value for value in row), int(versions[row[0]]))
+                  for row in final.itertuples(index=False, name=None)])
+            conn.commit()
+    conn.close()
+    
+    nights_df = pd.concat([frame for frame in results if not frame.empty] or [results[0]], ignore_index=True)
+    nights_df = nights_df.astype({column: float for column in SLEEP_NIGHT_COLUMNS[3:]})
+    return nights_df.sort_values('night').reset_index(drop=True)
+
+def sleep_regularity(nights, epoch_minutes=SLEEP_SRI_EPOCH_MINUTES):
+    # Share of epoch slots with the same asleep/awake state as 24 hours earlier, for each
+    # night's wake-up day against the day before. NaN unless both nights have sleep logged.
+    slots_per_day = 24 * 60 // epoch_minutes
+    origin = _epoch_minutes(pd.Index([nights['night'].iloc[0]]))[0] - 24 * 60
+    logged = nights.dropna(subset=['sleep_start'])
+    grid_slots = (len(nights) + 1) * slots_per_day
+    starts = ((_epoch_minutes(logged['sleep_start']) - origin) // epoch_minutes).clip(0, grid_slots)
+    ends = ((_epoch_minutes(logged['sleep_end']) - origin) // epoch_minutes).clip(0, grid_slots)
+    marks = np.zeros(grid_slots + 1, dtype=int)
+    np.add.at(marks, starts.to_numpy(dtype=int), 1)
+    np.add.at(marks, ends.to_numpy(dtype=int), -1)
+    asleep = (np.cumsum(marks)[:-1] > 0).reshape(len(nights) + 1, slots_per_day)
+    agreement = pd.Series((asleep[1:] == asleep[:-1]).mean(axis=1), index=nights.index)
+    has_sleep = nights['asleep_minutes'].notna()
+    return agreement.where(has_sleep & has_sleep.shift(1, fill_value=False))
+
+def get_sleep_analytics(user_name, start_date, end_date):
+    # Returns (nights, summary): the per-night table with rolling sleep debt and Sleep
+    # Regularity Index (SRI, -100 to 100) added, and a one-row-per-measure summary
+    start_date = str(start_date)
+    lead_in = (pd.Timestamp(start_date) - pd.Timedelta(days=SLEEP_WINDOW_NIGHTS)).strftime('%Y-%m-%d')
+    nights = get_sleep_nights(user_name, lead_in, end_date)
+    if nights.empty:
+        return nights, pd.DataFrame(columns=['measure', 'value'])
+    
+    slept = nights['asleep_minutes'] + nights['nap_minutes']
+    nights['sleep_hours'] = (slept / 60).round(2)
+    nights['sleep_debt_hours'] = ((SLEEP_TARGET_HOURS * 60 - slept).rolling(SLEEP_WINDOW_NIGHTS, min_periods=1).sum() / 60).round(2)
+    agreement = sleep_regularity(nights)
+    nights['sri'] = (agreement.rolling(SLEEP_WINDOW_NIGHTS, min_periods=1).mean() * 200 - 100).round(1)
+    in_range = nights['night'] >= start_date
+    nights, agreement = nights[in_range].reset_index(drop=True), agreement[in_range]
+    
+    logged = nights.dropna(subset=['sleep_start'])
+    midpoint = logged['midpoint_minutes'].mean()
+    wake_checked = logged['wake_diff_minutes'].dropna()
+    summary = pd.DataFrame([
+        ("Nights logged", f"{len(logged)} of {len(nights)}"),
+        ("Average sleep (hours)", round(logged['sleep_hours'].mean(), 2) if len(logged) else None),
+        ("Average midpoint", _format_minutes(int(round(midpoint)) % (24 * 60)) if len(logged) else None),
+        (f"Sleep debt, last {SLEEP_WINDOW_NIGHTS} nights (hours)", nights['sleep_debt_hours'].iloc[-1]),
+        ("Sleep regularity index", round(agreement.mean() * 200 - 100, 1) if agreement.notna().any() else None),
+        ("Wake-ups matching logged wake time", f"{(wake_checked.abs() <= SLEEP_WAKE_TOLERANCE_MINUTES).sum()} of {len(wake_checked)}"),
+    ], columns=['measure', 'value'])
+    return nights, summary
+
+def sleep_chart(nights):
+    chart = make_subplots(specs=[[{"secondary_y": True}]])
+    chart.add_trace(go.Bar(x=nights['night'], y=nights['sleep_hours'], name="Sleep (hours)"))
+    chart.add_trace(go.Scatter(x=nights['night'], y=nights['sri'], mode='lines+markers', name="Regularity (SRI)"), secondary_y=True)
+    chart.add_hline(y=SLEEP_TARGET_HOURS, line_dash="dash", annotation_text="Target")
+    chart.update_layout(title="Sleep by Night", xaxis_title="Night (wake-up date)")
+    chart.update_yaxes(title_text="Hours", secondary_y=False)
+    chart.update_yaxes(title_text="SRI", range=[-100, 100], secondary_y=True)
+    return chart
+
+def _seed_plan_check_database(users=QUERY_PLAN_USERS, days=QUERY_PLAN_DAYS):
+    # Bulk-load a synthetic history sized like a busy deployment, so plans reflect large tables
+    rng = random.Random(0)
+    first_day = datetime(2025, 1, 1)
+    dates = [(first_day + timedelta(days=day)).strftime('%Y-%m-%d') for day in range(days)]
+    conn = create_connection()
+    cursor = conn.cursor()
+    for index in range(users):
+        cursor.execute("INSERT INTO users (name) VALUES (?)", (f"plan-user-{index:04d}",))
+        user_id = cursor.lastrowid
+        category_ids = []
+        for position, name in enumerate(["Work", "Life", "Health", "Sleep"]):
+            cursor.execute("INSERT INTO categories (user_id, name, position) VALUES (?, ?, ?)", (user_id, name, position))
+            category_id = cursor.lastrowid
+            cursor.execute("INSERT INTO subcategories (user_id, category_id, name, position) VALUES (?, ?, 'Default', 0)", (user_id, category_id))
+            category_ids.append((category_id, cursor.lastrowid))
+        
+        cursor.executemany('''
+        INSERT INTO daily_activities (user_id, date, category_id, subcategory_id, start_time, end_time)
+        VALUES (?, ?, ?, ?, ?, ?)
+        ''', [(user_id, day, *category_ids[slot % 4], f"{slot * 3:02d}:00", f"{slot * 3 + 2:02d}:30")
+              for day in dates for slot in range(8)])
+        cursor.executemany('''
+        INSERT INTO qualitative_metrics (user_id, date, life_score, work_score, health_score) VALUES (?, ?, ?, ?, ?)
+        ''', [(user_id, day, rng.randint(1, 10), rng.randint(1, 10), rng.randint(1, 10)) for day in dates])
+        cursor.executemany('''
+        INSERT INTO quantitative_metrics (user_id, date, wake_up_time, workouts, meditation_minutes, brain_training_minutes)
+        VALUES (?, ?, '06:00', ?, ?, ?)
+        ''', [(user_id, day, rng.randint(0, 2), rng.randint(0, 30), rng.randint(0, 30)) for day in dates])
+        cursor.executemany("INSERT INTO daily_checklist (user_id, date, checklist_data, notes) VALUES (?, ?, '{}', '')",
+                           [(user_id, day) for day in dates])
+        cursor.executemany("INSERT INTO day_versions (user_id, date, version) VALUES (?, ?, ?)",
+                           [(user_id, day, version) for version, day in enumerate(dates, 1)])
+        cursor.executemany('''
+        INSERT INTO goals (user_id, category, description, target_value, current_value, start_date, end_date)
+        VALUES (?, 'Work', ?, 100, 0, ?, ?)
+        ''', [(user_id, f"Goal {goal}", dates[0], dates[-1]) for goal in range(20)])
+        cursor.execute("INSERT INTO user_settings (user_id, default_wake_time, work_weight, life_weight, health_weight) VALUES (?, '06:00', 1, 1, 1)",
+                       (user_id,))
+    conn.commit()
+    conn.close()
+
+def explain_statements(names=None):
+    conn = create_connection()
+    plans = {}
+    for name in names or SQL_STATEMENTS:
+        spec = SQL_STATEMENTS[name]
+        plans[name] = _render_plan(conn.execute("EXPLAIN QUERY PLAN " + spec["sql"], spec["params"]).fetchall())
+    conn.close()
+    return plans
+
+def _plan_problems(spec, plan):
+    problems = [f"expected index {index} is not used" for index in spec["indexes"]
+                if not any(f"INDEX {index} " in line + ' ' for line in plan)]
+    # Scans of subqueries, CTEs (under their own name or an alias), constant rows and full-text
+    # MATCH lookups read intermediate results, not tables
+    derived = {line.split()[1] for line in plan if line.split()[0] in ("MATERIALIZE", "CO-ROUTINE")}
+    for name in list(derived):
+        derived.update(re.findall(rf"\b{re.escape(name)}\s+(?:AS\s+)?(\w+)", spec["sql"]))
+    for line in plan:
+        words = line.split()
+        if words[0] != "SCAN" or " USING " in line or words[1] in derived or words[1] == "CONSTANT" or "CONSTANT ROWS" in line:
+            continue
+        if " VIRTUAL TABLE INDEX " in line and "M" in words[-1].split(":")[-1]:
+            continue
+        problems.append(f"full table scan: {line.strip()}")
+    return problems
+
+def _read_plan_baseline(path=QUERY_PLAN_BASELINE):
+    baseline = {}
+    if os.path.exists(path):
+        name = None
+        with open(path) as f:
+            for line in f.read().splitlines():
+                if line.startswith("== "):
+                    name = line[3:]
+                    baseline[name] = []
+                elif name is not None and line:
+                    baseline[name].append(line)
+    return baseline
+
+def check_query_plans(update=False, users=QUERY_PLAN_USERS, days=QUERY_PLAN_DAYS, baseline_path=QUERY_PLAN_BASELINE):
+    # EXPLAIN every registered statement against a freshly seeded database. A statement fails
+    # when it stops using one of its expected indexes or falls back to a full scan; failing and
+    # changed plans are shown as a diff against the recorded baseline. Returns an exit code.
+    global DB_FILE
+    saved_db_file = DB_FILE
+    with tempfile.TemporaryDirectory() as directory:
+        DB_FILE = os.path.join(directory, "query_plans.db")
+        try:
+            create_tables()
+            _seed_plan_check_database(users, days)
+            plans = explain_statements()
+        finally:
+            DB_FILE = saved_db_file
+    
+    baseline = _read_plan_baseline(baseline_path)
+    failures = 0
+    for name, plan in plans.items():
+        problems = _plan_problems(SQL_STATEMENTS[name], plan)
+        expected = baseline.get(name)
+        if not problems and expected in (None, plan):
+            print(f"ok       {name}")
+            continue
+        failures += bool(problems)
+        print(f"{'FAIL' if problems else 'changed'}  {name}")
+        for problem in problems:
+            print(f"    {problem}")
+        for line in difflib.unified_diff(expected or [], plan, f"{name} (baseline)", f"{name} (current)", lineterm=''):
+            print(f"    {line}")
+    
+    if update:
+        with open(baseline_path, "w") as f:
+            f.write(''.join(f"== {name}\n" + ''.join(f"{line}\n" for line in plan) + "\n" for name, plan in plans.items()))
+        print(f"Wrote {len(plans)} plans to {baseline_path}")
+    print(f"{len(plans) - failures} of {len(plans)} statements use their expected plans")
+    return 1 if failures else 0
+
+METRIC_STATS_CHECK_THREADS = 8
+METRIC_STATS_CHECK_DAYS = 60
+
+def check_metric_stats(threads=METRIC_STATS_CHECK_THREADS, days=METRIC_STATS_CHECK_DAYS):
+    # Log metrics and activities from several threads at once against a fresh database, then
+    # compare the incrementally maintained metric_stats with a full rebuild. Returns an exit code.
+    global DB_FILE
+    user_name = "metric-check-user"
+    first_day = date(2025, 1, 1)
+    saved_db_file = DB_FILE
+    errors = []
+    
+    def writer(worker):
+        rng = random.Random(worker)
+        start = f"{worker * 2 % 24:02d}:00"
+        end = f"{worker * 2 % 24 + 1:02d}:00"
+        try:
+            for offset in rng.sample(range(days), days):
+                day = (first_day + timedelta(days=offset)).strftime('%Y-%m-%d')
+                log_qualitative_metrics(user_name, day, rng.randint(1, 10), rng.randint(1, 10), rng.randint(1, 10))
+                log_quantitative_metrics(user_name, day, "07:00", rng.randint(0, 2), rng.randint(0, 30), rng.randint(0, 30))
+                log_activity(user_name, day, "Work", "Default", start, end, on_overlap="merge")
+        except Exception as e:
+            errors.append(f"worker {worker}: {e!r}")
+    
+    with tempfile.TemporaryDirectory() as directory:
+        DB_FILE = os.path.join(directory, "metric_stats.db")
+        try:
+            create_tables()
+            add_user_profile(user_name)
+            workers = [threading.Thread(target=writer, args=(worker,)) for worker in range(threads)]
+            for worker in workers:
+                worker.start()
+            for worker in workers:
+                worker.join()
+            conn = create_connection()
+            incremental = pd.read_sql_query("SELECT * FROM metric_stats", conn).set_index('metric')
+            conn.close()
+            rebuild_metric_stats(user_name)
+            conn = create_connection()
+            rebuilt = pd.read_sql_query("SELECT * FROM metric_stats", conn).set_index('metric')
+            conn.close()
+        finally:
+            DB_FILE = saved_db_file
+            invalidate_category_catalog(user_name)
+            invalidate_interval_index(user_name)
+            invalidate_calendar(user_name)
+    
+    failures = len(errors)
+    for error in errors:
+        print(f"FAIL     {error}")
+    for metric in sorted(set(incremental.index) | set(rebuilt.index)):
+        if metric not in incremental.index or metric not in rebuilt.index:
+            failures += 1
+            print(f"FAIL     {metric}: missing from the {'incremental' if metric not in incremental.index else 'rebuilt'} stats")
+            continue
+        # A back-dated edit leaves the EWM to the next rebuild, so only the moments must always agree
+        columns = ['n', 'mean', 'm2']
+        if not incremental.at[metric, 'stale']:
+            columns += ['ewm_mean', 'ewm_var', 'prev_ewm_mean', 'prev_ewm_var', 'last_date']
+        mismatched = [column for column in columns
+                      if not _same_stat(incremental.at[metric, column], rebuilt.at[metric, column])]
+        if mismatched:
+            failures += 1
+            print(f"FAIL     {metric}")
+            for column in mismatched:
+                print(f"    {column}: incremental {incremental.at[metric, column]!r}, rebuilt {rebuilt.at[metric, column]!r}")
+        else:
+            print(f"ok       {metric}")
+    print(f"{threads} writers over {days} days, {failures} failure(s)")
+    return 1 if failures else 0
+
+def _same_stat(left, right):
+    if isinstance(left, str) or isinstance(right, str):
+        return left == right
+    if pd.isna(left) or pd.isna(right):
+        return pd.isna(left) and pd.isna(right)
+    return bool(np.isclose(left, right, rtol=1e-6, atol=1e-6))
+
 # Define a custom theme with a more modern look
 custom_theme = gr.themes.Soft(
     primary_hue="blue",
@@ -599,522 +3650,666 @@ function edit_day(date) {
 </script>
 """
 
-# Create the main Gradio interface with the custom theme and CSS
-with gr.Blocks(theme=custom_theme, css=custom_css) as demo:
-    create_tables() 
-    with gr.Row(equal_height=True):
-        # Left sidebar
-        with gr.Column(scale=1, min_width=200):
-            gr.Markdown("## Life Tracking System")
-            user_name = gr.Dropdown(label="User Name", choices=["John Doe"], value="John Doe")
-            date = gr.Textbox(label="Date", value="today", placeholder="YYYY-MM-DD")
+def table_controls(columns):
+    # Page, sort and filter inputs for a table served by get_table_page or page_frame
+    with gr.Row():
+        page = gr.Number(label="Page", value=1, minimum=1, step=1, precision=0)
+        sort_by = gr.Dropdown(label="Sort By", choices=columns, value=None, allow_custom_value=True)
+        descending = gr.Checkbox(label="Descending")
+        filter_text = gr.Textbox(label="Filter")
+    return [page, sort_by, descending, filter_text], gr.Markdown()
+
+def control_events(controls):
+    page, sort_by, descending, filter_text = controls
+    return [page.change, sort_by.change, descending.change, filter_text.submit]
+
+def load_table(view, user_name, page, sort_by, descending, filter_text, **params):
+    df, total = get_table_page(view, user_name, page, sort_by=sort_by, descending=descending, filter_text=filter_text, **params)
+    return df, total, page_status(page, total)
+
+def build_interface():
+    # Create the main Gradio interface with the custom theme and CSS
+    with gr.Blocks(theme=custom_theme, css=custom_css) as demo:
+        with gr.Row(equal_height=True):
+            # Left sidebar
+            with gr.Column(scale=1, min_width=200):
+                gr.Markdown("## Life Tracking System")
+                user_name = gr.Dropdown(label="User Name", choices=["John Doe"], value="John Doe")
+                date = gr.Textbox(label="Date", value="today", placeholder="YYYY-MM-DD")
             
-            with gr.Group():
-                gr.Markdown("### Quick Glance")
-                today_life_score = gr.Number(label="Today's Life Score", value=0)
-                today_work_score = gr.Number(label="Today's Work Score", value=0)
-                today_health_score = gr.Number(label="Today's Health Score", value=0)
-                wake_up_time = gr.Textbox(label="Wake-up Time", value="")
-                total_activities = gr.Number(label="Total Activities", value=0)
+                with gr.Group():
+                    gr.Markdown("### Quick Glance")
+                    today_life_score = gr.Number(label="Today's Life Score", value=0)
+                    today_work_score = gr.Number(label="Today's Work Score", value=0)
+                    today_health_score = gr.Number(label="Today's Health Score", value=0)
+                    wake_up_time = gr.Textbox(label="Wake-up Time", value="")
+                    total_activities = gr.Number(label="Total Activities", value=0)
             
-            quick_log_btn = gr.Button("Quick Log")
+                quick_log_btn = gr.Button("Quick Log")
             
-            # Add buttons for adding and deleting user profiles
-            new_user_name = gr.Textbox(label="New User Name")
-            add_user_btn = gr.Button("Add User")
-            delete_user_btn = gr.Button("Delete User")
+                # Add buttons for adding and deleting user profiles
+                new_user_name = gr.Textbox(label="New User Name")
+                add_user_btn = gr.Button("Add User")
+                delete_user_btn = gr.Button("Delete User")
         
-        # Main content area
-        with gr.Column(scale=4):
-            with gr.Tabs() as tabs:
-                # Dashboard Tab
-                with gr.TabItem("Dashboard"):
-                    with gr.Row():
-                        with gr.Column(scale=2):
-                            gr.Markdown("### Log Daily Metrics")
-                            life_score = gr.Slider(label="Life Score", minimum=1, maximum=10, step=1)
-                            work_score = gr.Slider(label="Work Score", minimum=1, maximum=10, step=1)
-                            health_score = gr.Slider(label="Health Score", minimum=1, maximum=10, step=1)
-                            workouts = gr.Number(label="Workouts", minimum=0, step=1)
-                            meditation_minutes = gr.Number(label="Meditation (minutes)", minimum=0)
-                            brain_training_minutes = gr.Number(label="Brain Training (minutes)", minimum=0)
-                            log_metrics_btn = gr.Button("Log Metrics")
+            # Main content area
+            with gr.Column(scale=4):
+                with gr.Tabs() as tabs:
+                    # Dashboard Tab
+                    with gr.TabItem("Dashboard"):
+                        with gr.Row():
+                            with gr.Column(scale=2):
+                                gr.Markdown("### Log Daily Metrics")
+                                life_score = gr.Slider(label="Life Score", minimum=1, maximum=10, step=1)
+                                work_score = gr.Slider(label="Work Score", minimum=1, maximum=10, step=1)
+                                health_score = gr.Slider(label="Health Score", minimum=1, maximum=10, step=1)
+                                workouts = gr.Number(label="Workouts", minimum=0, step=1)
+                                meditation_minutes = gr.Number(label="Meditation (minutes)", minimum=0)
+                                brain_training_minutes = gr.Number(label="Brain Training (minutes)", minimum=0)
+                                log_metrics_btn = gr.Button("Log Metrics")
                         
-                        with gr.Column(scale=2):
-                            gr.Markdown("### Log Activity")
-                            category = gr.Dropdown(label="Category", choices=["Work", "Life", "Health", "Sleep"])
-                            subcategory = gr.Textbox(label="Subcategory")
-                            start_time = gr.Textbox(label="Start Time (HH:MM)")
-                            end_time = gr.Textbox(label="End Time (HH:MM)")
-                            log_activity_btn = gr.Button("Log Activity")
+                            with gr.Column(scale=2):
+                                gr.Markdown("### Log Activity")
+                                category = gr.Dropdown(label="Category", choices=["Work", "Life", "Health", "Sleep"])
+                                subcategory = gr.Textbox(label="Subcategory")
+                                start_time = gr.Textbox(label="Start Time (HH:MM)")
+                                end_time = gr.Textbox(label="End Time (HH:MM)")
+                                log_activity_btn = gr.Button("Log Activity")
+                    
+                        gr.Markdown("### Today's Overview")
+                        with gr.Row():
+                            with gr.Column():
+                                today_activities = gr.DataFrame(label="Today's Activities")
+                                activities_controls, activities_status = table_controls(TABLE_VIEWS["activities"]["columns"])
+                            today_metrics = gr.DataFrame(label="Today's Metrics")
+                        today_anomalies = gr.DataFrame(label="Unusual Today")
                     
-                    gr.Markdown("### Today's Overview")
-                    with gr.Row():
-                        today_activities = gr.DataFrame(label="Today's Activities")
-                        today_metrics = gr.DataFrame(label="Today's Metrics")
+                        gr.Markdown("### Weekly Summary")
+                        with gr.Row():
+                            weekly_pie_chart = gr.Plot(label="Activity Distribution")
+                            weekly_line_chart = gr.Plot(label="Score Trends")
                     
-                    gr.Markdown("### Weekly Summary")
-                    with gr.Row():
-                        weekly_pie_chart = gr.Plot(label="Activity Distribution")
-                        weekly_line_chart = gr.Plot(label="Score Trends")
+                        gr.Markdown("### Sleep")
+                        with gr.Row():
+                            with gr.Column(scale=3):
+                                sleep_plot = gr.Plot(label="Sleep by Night")
+                            with gr.Column(scale=1):
+                                sleep_summary = gr.DataFrame(label=f"Last {SLEEP_PANEL_NIGHTS} Nights")
                     
-                    update_dashboard_btn = gr.Button("Refresh Dashboard")
-
-                # Analysis Tab
-                with gr.TabItem("Analysis"):
-                    analysis_period = gr.Radio(["Weekly", "Monthly"], label="Analysis Period", value="Weekly")
-                    update_analysis_btn = gr.Button("Update Analysis")
-                    with gr.Row():
-                        analysis_pie_chart = gr.Plot(label="Activity Distribution")
-                        analysis_line_chart = gr.Plot(label="Score Trends")
-                    analysis_total_hours = gr.Number(label="Total Hours", precision=2)
+                        update_dashboard_btn = gr.Button("Refresh Dashboard")
+
+                    # Analysis Tab
+                    with gr.TabItem("Analysis"):
+                        analysis_period = gr.Radio(["Weekly", "Monthly"], label="Analysis Period", value="Weekly")
+                        update_analysis_btn = gr.Button("Update Analysis")
+                        with gr.Row():
+                            analysis_pie_chart = gr.Plot(label="Activity Distribution")
+                            analysis_line_chart = gr.Plot(label="Score Trends")
+                        analysis_total_hours = gr.Number(label="Total Hours", precision=2)
                     
-                    # Add a detailed breakdown table
-                    analysis_breakdown = gr.DataFrame(label="Detailed Breakdown")
+                        # Add a detailed breakdown table
+                        analysis_breakdown = gr.DataFrame(label="Detailed Breakdown")
+                        breakdown_controls, breakdown_status = table_controls(TABLE_VIEWS["breakdown"]["columns"])
                     
-                    def update_analysis(user_name, period):
-                        if period == "Weekly":
-                            pie_chart, line_chart, total_hours = analyze_weekly_data(user_name)
-                            breakdown_data = get_weekly_data(user_name)
-                        else:
-                            pie_chart, line_chart, total_hours = analyze_monthly_data(user_name)
-                            breakdown_data = get_monthly_data(user_name)
-                        
-                        breakdown_data['duration'] = breakdown_data['end_time'] - breakdown_data['start_time']
-                        breakdown_data['duration_hours'] = breakdown_data['duration'].dt.total_seconds() / 3600
-                        breakdown_summary = breakdown_data.groupby(['category', 'subcategory'])['duration_hours'].sum().reset_index()
-                        breakdown_summary = breakdown_summary.sort_values('duration_hours', ascending=False)
+                        def show_breakdown(user_name, period, *controls):
+                            start_date, end_date = get_period_range(period)
+                            breakdown, _, status = load_table("breakdown", user_name, *controls,
+                                                              start_date=start_date.isoformat(), end_date=end_date.isoformat())
+                            return breakdown, status
+                    
+                        def update_analysis(user_name, period, *controls):
+                            report = get_period_report(user_name, period)
+                            pie_chart = pio.from_json(report["figures"]["pie"])
+                            line_chart = pio.from_json(report["figures"]["line"])
                         
-                        return pie_chart, line_chart, total_hours, breakdown_summary
+                            return (pie_chart, line_chart, report["total_hours"]) + show_breakdown(user_name, period, *controls)
+                    
+                        update_analysis_btn.click(update_analysis, inputs=[user_name, analysis_period] + breakdown_controls, outputs=[analysis_pie_chart, analysis_line_chart, analysis_total_hours, analysis_breakdown, breakdown_status], api_name="update_analysis")
+                        gr.on(control_events(breakdown_controls), show_breakdown, inputs=[user_name, analysis_period] + breakdown_controls, outputs=[analysis_breakdown, breakdown_status])
+
+                    # Goals Tab
+                    with gr.TabItem("Goals"):
+                        with gr.Row():
+                            goal_category = gr.Dropdown(label="Category", choices=["Work", "Life", "Health"])
+                            goal_description = gr.Textbox(label="Goal Description")
+                            goal_target = gr.Number(label="Target Value")
+                        with gr.Row():
+                            goal_start_date = gr.Textbox(label="Start Date", placeholder="YYYY-MM-DD")
+                            goal_end_date = gr.Textbox(label="End Date", placeholder="YYYY-MM-DD")
+                        set_goal_btn = gr.Button("Set Goal")
+                        goals_table = gr.DataFrame(label="Current Goals")
+                        goals_controls, goals_status = table_controls(TABLE_VIEWS["goals"]["columns"])
                     
-                    update_analysis_btn.click(update_analysis, inputs=[user_name, analysis_period], outputs=[analysis_pie_chart, analysis_line_chart, analysis_total_hours, analysis_breakdown])
-
-                # Goals Tab
-                with gr.TabItem("Goals"):
-                    with gr.Row():
-                        goal_category = gr.Dropdown(label="Category", choices=["Work", "Life", "Health"])
-                        goal_description = gr.Textbox(label="Goal Description")
-                        goal_target = gr.Number(label="Target Value")
-                    with gr.Row():
-                        goal_start_date = gr.Textbox(label="Start Date", placeholder="YYYY-MM-DD")
-                        goal_end_date = gr.Textbox(label="End Date", placeholder="YYYY-MM-DD")
-                    set_goal_btn = gr.Button("Set Goal")
-                    goals_table = gr.DataFrame(label="Current Goals")
-
-                # Settings Tab
-                with gr.TabItem("Settings"):
-                    preset_dropdown = gr.Dropdown(label="Preset Templates", choices=["Custom", "Rob Dyrdek", "Student"])
-                    default_wake_time = gr.Textbox(label="Default Wake-up Time (HH:MM)")
-                    with gr.Row():
-                        work_weight = gr.Slider(label="Work Weight", minimum=0, maximum=2, step=0.1, value=1.0)
-                        life_weight = gr.Slider(label="Life Weight", minimum=0, maximum=2, step=0.1, value=1.0)
-                        health_weight = gr.Slider(label="Health Weight", minimum=0, maximum=2, step=0.1, value=1.0)
-                    update_settings_btn = gr.Button("Update Settings")
-
-                # New: Documentation Tab
-                with gr.TabItem("Documentation"):
-                    gr.Markdown("""
-                    # Life Tracking System Documentation
-
-                    Welcome to the Life Tracking System, inspired by Rob Dyrdek's philosophy of maintaining a "Rhythm of Existence". This system is designed to help you monitor and optimize various aspects of your life, including work, health, personal life, and sleep.
-
-                    ## Getting Started
-
-                    1. Use the Setup tab to configure your profile and preferences.
-                    2. Choose a preset template or customize your own categories and subcategories.
-                    3. Set your default wake-up time and adjust weights for work, life, and health.
-                    4. Use the Dashboard to log your daily activities and metrics.
-                    5. Review your progress in the Analysis tab.
-                    6. Set and track your goals in the Goals tab.
-
-                    ## Key Features
-
-                    - Guided setup process
-                    - Daily activity tracking
-                    - Qualitative and quantitative metric logging
-                    - Weekly and monthly analysis
-                    - Visualization and reporting
-                    - Goal setting and progress monitoring
-                    - Customizable categories and subcategories
-
-                    ## Tips for Success
-
-                    - Be consistent in logging your activities and metrics.
-                    - Review your weekly and monthly analyses regularly.
-                    - Adjust your goals as needed based on your progress.
-                    - Use the preset templates to get started quickly.
-                    - Customize your categories and subcategories to fit your lifestyle.
-
-                    ## Rob Dyrdek's Philosophy
-
-                    Rob Dyrdek's approach to life and success emphasizes:
-                    1. Passion-driven productivity
-                    2. Taking calculated risks
-                    3. Setting big goals
-                    4. Hard work and perseverance
-                    5. Innovation and creativity
-                    6. Authenticity in decision-making
-                    7. Learning from failures
-
-                    Incorporate these principles into your daily routine to maximize your potential and achieve your goals.
-
-                    For more detailed information on how to use specific features, please refer to the respective tabs in the application.
-                    """)
-
-                # New: Daily Checklist Tab
-                with gr.TabItem("Daily Checklist"):
-                    gr.Markdown("## Daily Checklist and Notes")
-                    checklist_date = gr.Textbox(label="Date", value=datetime.now().strftime("%Y-%m-%d"), placeholder="YYYY-MM-DD")
+                        def show_goals(user_name, *controls):
+                            goals, _, status = load_table("goals", user_name, *controls)
+                            return goals, status
                     
-                    with gr.Row():
-                        with gr.Column(scale=2):
-                            checklist_items = [
-                                gr.Checkbox(label="Wake up & Mindfulness (30 minutes)"),
-                                gr.Checkbox(label="Exercise (30-45 minutes)"),
-                                gr.Checkbox(label="Meditation (20 minutes)"),
-                                gr.Checkbox(label="Morning Walk with Nala (1 hour 15 minutes)"),
-                                gr.Checkbox(label="Active Learning with Breakfast (1 hour)"),
-                                gr.Checkbox(label="Work (3 hours 30 minutes)"),
-                                gr.Checkbox(label="Lunch Break (30 minutes)"),
-                                gr.Checkbox(label="Work (4 hours)"),
-                                gr.Checkbox(label="Active Learning (20 mins - 1 hour, 3x a week)"),
-                                gr.Checkbox(label="Brain Training"),
-                                gr.Checkbox(label="Reading"),
-                                gr.Checkbox(label="Journaling"),
-                                gr.Checkbox(label="Evening Reflection"),
-                                gr.Checkbox(label="Plan for Tomorrow"),
-                            ]
-                        
-                        with gr.Column(scale=1):
-                            notes = gr.TextArea(label="Daily Notes")
+                        gr.on(control_events(goals_controls), show_goals, inputs=[user_name] + goals_controls, outputs=[goals_table, goals_status])
+
+                    # Team Tab
+                    with gr.TabItem("Team"):
+                        team_period = gr.Radio(["Weekly", "Monthly"], label="Team Period", value="Weekly")
+                        update_team_btn = gr.Button("Update Team View")
+                        with gr.Row():
+                            team_hours_chart = gr.Plot(label="Average Daily Hours per User")
+                            team_scores_chart = gr.Plot(label="Team Score Distribution")
+                        team_position = gr.DataFrame(label="Your Position in the Team")
                     
-                    save_checklist_btn = gr.Button("Save Daily Checklist")
-                    load_checklist_btn = gr.Button("Load Checklist for Selected Date")
-
-                    def get_daily_checklist(user_name, date):
-                        conn = create_connection()
-                        cursor = conn.cursor()
-                        cursor.execute('''
-                        SELECT checklist_data, notes FROM daily_checklist
-                        WHERE user_id = (SELECT id FROM users WHERE name = ?) AND date = ?
-                        ''', (user_name, date))
-                        result = cursor.fetchone()
-                        conn.close()
-                        if result:
-                            return json.loads(result[0]), result[1]
-                        return {}, ""
-
-                    def save_daily_checklist(user_name, date, checklist_data, notes):
-                        conn = create_connection()
-                        cursor = conn.cursor()
-                        cursor.execute('''
-                        INSERT OR REPLACE INTO daily_checklist (user_id, date, checklist_data, notes)
-                        VALUES ((SELECT id FROM users WHERE name = ?), ?, ?, ?)
-                        ''', (user_name, date, json.dumps(checklist_data), notes))
-                        conn.commit()
-                        conn.close()
+                        def update_team_view(user_name, period):
+                            team = get_team_analytics(*get_period_range(period))
+                            if team["category_hours"].empty:
+                                hours_chart = px.bar(title=f"{period} Average Daily Hours per User")
+                            else:
+                                hours_chart = px.bar(team["category_hours"], x='user_name', y='avg_daily_hours', color='category',
+                                                     barmode='group', title=f"{period} Average Daily Hours per User")
+                            scores_chart = px.bar(team["score_distribution"], x='score', y='days', color='metric',
+                                                  barmode='group', title=f"{period} Team Score Distribution")
+                            return hours_chart, scores_chart, get_team_position(team, user_name)
                     
-                    def save_checklist(user_name, date_str, notes, *checklist_values):
-                        try:
-                            date_obj = datetime.strptime(date_str, "%Y-%m-%d").date()
-                            checklist_data = {item.label: value for item, value in zip(checklist_items, checklist_values)}
-                            save_daily_checklist(user_name, date_obj, checklist_data, notes)
-                            return "Checklist saved successfully!"
-                        except ValueError:
-                            return "Invalid date format. Please use YYYY-MM-DD."
-
-
-                    def load_checklist(user_name, date_str):
-                        try:
-                            date_obj = datetime.strptime(date_str, "%Y-%m-%d").date()
-                            checklist_data, notes_text = get_daily_checklist(user_name, date_obj)
-                            checkbox_values = [checklist_data.get(item.label, False) for item in checklist_items]
-                            return checkbox_values + [notes_text, "Checklist loaded successfully!"]
-                        except ValueError:
-                            return [False] * len(checklist_items) + ["", "Invalid date format. Please use YYYY-MM-DD."]
-
-                    save_checklist_btn.click(
-                        save_checklist,
-                        inputs=[user_name, checklist_date, notes] + checklist_items,
-                        outputs=[gr.Text(label="Save Status")]
-                    )
-
-                    load_checklist_btn.click(
-                        load_checklist,
-                        inputs=[user_name, checklist_date],
-                        outputs=checklist_items + [notes, gr.Text(label="Load Status")]
-                    )
-
-                # Monthly Calendar Tab
-                with gr.TabItem("Monthly Calendar"):
-                    gr.Markdown("## Monthly Time Allocation")
-                    with gr.Row():
-                        calendar_date = gr.Textbox(label="Select Month (YYYY-MM)", value=datetime.now().strftime("%Y-%m"))
-                        update_calendar_btn = gr.Button("Update Calendar")
-                    monthly_calendar = gr.DataFrame(label="Monthly Time Allocation")
+                        update_team_btn.click(update_team_view, inputs=[user_name, team_period], outputs=[team_hours_chart, team_scores_chart, team_position])
+
+                    # Drivers Tab
+                    with gr.TabItem("Drivers"):
+                        with gr.Row():
+                            drivers_scope = gr.Radio(["Me", "All Users"], label="Scope", value="Me")
+                            drivers_lag = gr.Slider(label="Score Lag (days)", minimum=0, maximum=DRIVER_MAX_LAG, step=1, value=1)
+                        update_drivers_btn = gr.Button("Update Drivers")
+                        drivers_heatmap = gr.Plot(label="Correlation with Scores")
+                        drivers_table = gr.DataFrame(label="Drivers")
                     
-                    day_edit_form = gr.Group(visible=False)
-                    with day_edit_form:
-                        selected_date = gr.Textbox(label="Date")
-                        work_hours = gr.Number(label="Work Hours", minimum=0, maximum=24)
-                        life_hours = gr.Number(label="Life Hours", minimum=0, maximum=24)
-                        health_hours = gr.Number(label="Health Hours", minimum=0, maximum=24)
-                        sleep_hours = gr.Number(label="Sleep Hours", minimum=0, maximum=24)
-                        save_day_btn = gr.Button("Save")
+                        def update_drivers(user_name, scope, lag):
+                            drivers = analyze_drivers(user_name if scope == "Me" else None)
+                            lagged = drivers[drivers['lag_days'] == int(lag)]
+                            heatmap = lagged.pivot(index='feature', columns='target', values='correlation')
+                            figure = px.imshow(heatmap, zmin=-1, zmax=1, color_continuous_scale='RdBu', text_auto='.2f',
+                                               title=f"Correlation with Scores {int(lag)} Day(s) Later")
+                            return figure, lagged.round(3)
                     
-                    edit_buttons = gr.HTML()  # This will hold our edit buttons
+                        update_drivers_btn.click(update_drivers, inputs=[user_name, drivers_scope, drivers_lag], outputs=[drivers_heatmap, drivers_table])
 
-                    def open_day_edit_form(date):
-                        return gr.update(visible=True), gr.update(value=date)
+                    # Search Tab
+                    with gr.TabItem("Search"):
+                        with gr.Row():
+                            search_text = gr.Textbox(label="Search Notes and Activities", scale=4)
+                            search_page = gr.Number(label="Page", value=1, minimum=1, step=1, precision=0, scale=1)
+                        search_btn = gr.Button("Search")
+                        search_status = gr.Markdown()
+                        search_results = gr.DataFrame(label="Results")
                     
-                    def save_day_data(user_name, date, work, life, health, sleep):
-                        save_day_activities(user_name, date, work, life, health, sleep)
-                        return gr.update(visible=False), update_monthly_calendar(user_name, calendar_date.value)
+                        def run_search(user_name, text, page):
+                            page = max(1, int(page or 1))
+                            results, total = search_entries(user_name, text, page)
+                            if total == 0:
+                                return results, "No matches found."
+                            first = (page - 1) * SEARCH_PAGE_SIZE + 1
+                            last = first + len(results) - 1
+                            return results, f"Showing {first}-{last} of {total} matches."
                     
-                    save_day_btn.click(
-                        save_day_data,
-                        inputs=[user_name, selected_date, work_hours, life_hours, health_hours, sleep_hours],
-                        outputs=[day_edit_form, monthly_calendar]
-                    )
+                        search_btn.click(run_search, inputs=[user_name, search_text, search_page], outputs=[search_results, search_status])
+                        search_text.submit(lambda user, text: run_search(user, text, 1), inputs=[user_name, search_text], outputs=[search_results, search_status])
+
+                    # Settings Tab
+                    with gr.TabItem("Settings"):
+                        preset_dropdown = gr.Dropdown(label="Preset Templates", choices=["Custom", "Rob Dyrdek", "Student"])
+                        default_wake_time = gr.Textbox(label="Default Wake-up Time (HH:MM)")
+                        with gr.Row():
+                            work_weight = gr.Slider(label="Work Weight", minimum=0, maximum=2, step=0.1, value=1.0)
+                            life_weight = gr.Slider(label="Life Weight", minimum=0, maximum=2, step=0.1, value=1.0)
+                            health_weight = gr.Slider(label="Health Weight", minimum=0, maximum=2, step=0.1, value=1.0)
+                        update_settings_btn = gr.Button("Update Settings")
+
+                    # New: Documentation Tab
+                    with gr.TabItem("Documentation"):
+                        gr.Markdown("""
+                        # Life Tracking System Documentation
+
+                        Welcome to the Life Tracking System, inspired by Rob Dyrdek's philosophy of maintaining a "Rhythm of Existence". This system is designed to help you monitor and optimize various aspects of your life, including work, health, personal life, and sleep.
+
+                        ## Getting Started
+
+                        1. Use the Setup tab to configure your profile and preferences.
+                        2. Choose a preset template or customize your own categories and subcategories.
+                        3. Set your default wake-up time and adjust weights for work, life, and health.
+                        4. Use the Dashboard to log your daily activities and metrics.
+                        5. Review your progress in the Analysis tab.
+                        6. Set and track your goals in the Goals tab.
+
+                        ## Key Features
+
+                        - Guided setup process
+                        - Daily activity tracking
+                        - Qualitative and quantitative metric logging
+                        - Weekly and monthly analysis
+                        - Visualization and reporting
+                        - Goal setting and progress monitoring
+                        - Customizable categories and subcategories
+
+                        ## Tips for Success
+
+                        - Be consistent in logging your activities and metrics.
+                        - Review your weekly and monthly analyses regularly.
+                        - Adjust your goals as needed based on your progress.
+                        - Use the preset templates to get started quickly.
+                        - Customize your categories and subcategories to fit your lifestyle.
+
+                        ## Rob Dyrdek's Philosophy
+
+                        Rob Dyrdek's approach to life and success emphasizes:
+                        1. Passion-driven productivity
+                        2. Taking calculated risks
+                        3. Setting big goals
+                        4. Hard work and perseverance
+                        5. Innovation and creativity
+                        6. Authenticity in decision-making
+                        7. Learning from failures
+
+                        Incorporate these principles into your daily routine to maximize your potential and achieve your goals.
+
+                        For more detailed information on how to use specific features, please refer to the respective tabs in the application.
+                        """)
+
+                    # New: Daily Checklist Tab
+                    with gr.TabItem("Daily Checklist"):
+                        gr.Markdown("## Daily Checklist and Notes")
+                        checklist_date = gr.Textbox(label="Date", value=datetime.now().strftime("%Y-%m-%d"), placeholder="YYYY-MM-DD")
                     
-                    def update_monthly_calendar(user_name, date):
-                        try:
-                            year, month = map(int, date.split('-'))
-                        except ValueError:
-                            year, month = datetime.now().year, datetime.now().month
+                        with gr.Row():
+                            with gr.Column(scale=2):
+                                checklist_items = [
+                                    gr.Checkbox(label="Wake up & Mindfulness (30 minutes)"),
+                                    gr.Checkbox(label="Exercise (30-45 minutes)"),
+                                    gr.Checkbox(label="Meditation (20 minutes)"),
+                                    gr.Checkbox(label="Morning Walk with Nala (1 hour 15 minutes)"),
+                                    gr.Checkbox(label="Active Learning with Breakfast (1 hour)"),
+                                    gr.Checkbox(label="Work (3 hours 30 minutes)"),
+                                    gr.Checkbox(label="Lunch Break (30 minutes)"),
+                                    gr.Checkbox(label="Work (4 hours)"),
+                                    gr.Checkbox(label="Active Learning (20 mins - 1 hour, 3x a week)"),
+                                    gr.Checkbox(label="Brain Training"),
+                                    gr.Checkbox(label="Reading"),
+                                    gr.Checkbox(label="Journaling"),
+                                    gr.Checkbox(label="Evening Reflection"),
+                                    gr.Checkbox(label="Plan for Tomorrow"),
+                                ]
                         
-                        df = get_monthly_data(user_name, year, month)
-                        calendar_df = format_monthly_data(df, year, month)
-                        return calendar_df
+                            with gr.Column(scale=1):
+                                notes = gr.TextArea(label="Daily Notes")
                     
-                    def create_day_buttons(df):
-                        buttons_html = ""
-                        for _, row in df.iterrows():
-                            date = row['date']
-                            buttons_html += f'<button onclick="edit_day(\'{date}\')">{date}</button>'
-                        return buttons_html
+                        save_checklist_btn = gr.Button("Save Daily Checklist")
+                        load_checklist_btn = gr.Button("Load Checklist for Selected Date")
+
+                        def get_daily_checklist(user_name, date):
+                            conn = create_connection()
+                            cursor = conn.cursor()
+                            cursor.execute(CHECKLIST_FOR_DAY_SQL, (user_name, date))
+                            result = cursor.fetchone()
+                            conn.close()
+                            if result:
+                                return json.loads(result[0]), result[1]
+                            return {}, ""
+
+                        def save_daily_checklist(user_name, date, checklist_data, notes):
+                            conn = create_connection()
+                            cursor = conn.cursor()
+                            cursor.execute('''
+                            INSERT INTO daily_checklist (user_id, date, checklist_data, notes)
+                            VALUES ((SELECT id FROM users WHERE name = ?), ?, ?, ?)
+                            ON CONFLICT (user_id, date) DO UPDATE SET
+                                checklist_data = excluded.checklist_data,
+                                notes = excluded.notes
+                            ''', (user_name, date, json.dumps(checklist_data), notes))
+                            _record_change(cursor, user_name, "daily_checklist", "upsert", [date])
+                            conn.commit()
+                            conn.close()
                     
-                    update_calendar_btn.click(
-                        lambda user, date: (update_monthly_calendar(user, date), create_day_buttons(update_monthly_calendar(user, date))),
-                        inputs=[user_name, calendar_date],
-                        outputs=[monthly_calendar, edit_buttons]
-                    )
-
-    # Event handlers and function definitions
-    def log_and_display(user_name, date, category, subcategory, start_time, end_time):
-        log_activity(user_name, date, category, subcategory, start_time, end_time)
-        activities = get_activities(user_name, date)
-        return activities, len(activities)
-
-    def log_and_display_metrics(user_name, date, life_score, work_score, health_score, wake_up_time, workouts, meditation_minutes, brain_training_minutes):
-        log_qualitative_metrics(user_name, date, life_score, work_score, health_score)
-        log_quantitative_metrics(user_name, date, wake_up_time, workouts, meditation_minutes, brain_training_minutes)
-        metrics = get_metrics(user_name, date)
-        return metrics, life_score, work_score, health_score, wake_up_time
-
-    def update_dashboard(user_name, date):
-        today_activities_data = get_activities(user_name, date)
-        today_metrics_data = get_metrics(user_name, date)
-        weekly_pie_chart_data, weekly_line_chart_data, total_hours = analyze_weekly_data(user_name)
-        
-        # Calculate quick glance metrics
-        life_score = today_metrics_data['life_score'].values[0] if not today_metrics_data.empty else 0
-        work_score = today_metrics_data['work_score'].values[0] if not today_metrics_data.empty else 0
-        health_score = today_metrics_data['health_score'].values[0] if not today_metrics_data.empty else 0
-        wake_up = today_metrics_data['wake_up_time'].values[0] if not today_metrics_data.empty else ""
-        total_acts = len(today_activities_data)
-        
-        return (today_activities_data, today_metrics_data, weekly_pie_chart_data, weekly_line_chart_data,
-                life_score, work_score, health_score, wake_up, total_acts)
+                        def save_checklist(user_name, date_str, notes, *checklist_values):
+                            try:
+                                date_obj = datetime.strptime(date_str, "%Y-%m-%d").date()
+                                checklist_data = {item.label: value for item, value in zip(checklist_items, checklist_values)}
+                                save_daily_checklist(user_name, date_obj, checklist_data, notes)
+                                return "Checklist saved successfully!"
+                            except ValueError:
+                                return "Invalid date format. Please use YYYY-MM-DD."
 
-    def update_analysis(user_name, period):
-        current_date = datetime.now()
-        year, month = current_date.year, current_date.month
 
-        if period == "Weekly":
-            df = get_weekly_data(user_name)
-            scores = get_weekly_scores(user_name)
-        else:  # Monthly
-            df = get_monthly_data(user_name, year, month)
-            scores = get_monthly_scores(user_name)
+                        def load_checklist(user_name, date_str):
+                            try:
+                                date_obj = datetime.strptime(date_str, "%Y-%m-%d").date()
+                                checklist_data, notes_text = get_daily_checklist(user_name, date_obj)
+                                checkbox_values = [checklist_data.get(item.label, False) for item in checklist_items]
+                                return checkbox_values + [notes_text, "Checklist loaded successfully!"]
+                            except ValueError:
+                                return [False] * len(checklist_items) + ["", "Invalid date format. Please use YYYY-MM-DD."]
 
-        # Ensure df is not empty
-        if df.empty:
-            return px.pie(), px.line(), 0, pd.DataFrame()
+                        save_checklist_btn.click(
+                            save_checklist,
+                            inputs=[user_name, checklist_date, notes] + checklist_items,
+                            outputs=[gr.Text(label="Save Status")]
+                        )
 
-        # Calculate duration in hours
-        df['duration'] = (df['end_time'] - df['start_time']).dt.total_seconds() / 3600
-        
-        breakdown_data = df.groupby(['category', 'subcategory'])['duration'].sum().reset_index()
-        breakdown_data = breakdown_data.sort_values('duration', ascending=False)
-        
-        total_hours = breakdown_data['duration'].sum()
-        
-        pie_chart = px.pie(breakdown_data, values='duration', names='category', title=f"{period} Activity Distribution")
-        
-        # Ensure 'date' column exists in scores DataFrame
-        if 'date' not in scores.columns:
-            scores['date'] = scores.index if isinstance(scores.index, pd.DatetimeIndex) else pd.to_datetime(scores.index)
+                        load_checklist_btn.click(
+                            load_checklist,
+                            inputs=[user_name, checklist_date],
+                            outputs=checklist_items + [notes, gr.Text(label="Load Status")]
+                        )
+
+                    # Routine Tab
+                    with gr.TabItem("Routine"):
+                        gr.Markdown("## Planned Routine vs. Actual Day")
+                        routine_table = gr.DataFrame(
+                            headers=["label", "category", "start_time", "duration_minutes"],
+                            label="Routine Blocks (HH:MM start, minutes)",
+                            interactive=True,
+                        )
+                        with gr.Row():
+                            load_routine_btn = gr.Button("Load Routine")
+                            save_routine_btn = gr.Button("Save Routine")
+                        routine_status = gr.Markdown()
+                        with gr.Row():
+                            routine_start = gr.Textbox(label="From", value=(datetime.now() - timedelta(days=6)).strftime("%Y-%m-%d"))
+                            routine_end = gr.Textbox(label="To", value=datetime.now().strftime("%Y-%m-%d"))
+                        check_routine_btn = gr.Button("Check Adherence")
+                        routine_chart = gr.Plot(label="Daily Adherence")
+                        routine_days = gr.DataFrame(label="Adherence by Day")
+                        routine_blocks_table = gr.DataFrame(label="Adherence by Block")
+                    
+                        def load_routine(user_name):
+                            return get_routine_blocks(user_name)[["label", "category", "start_time", "duration_minutes"]]
+                    
+                        def save_routine(user_name, table):
+                            rows = table.dropna(how='all').values.tolist()
+                            try:
+                                save_routine_template(user_name, "Default", rows)
+                            except (ValueError, TypeError):
+                                return table, "Each block needs a label, a category, an HH:MM start and whole minutes."
+                            return load_routine(user_name), "Routine saved."
+                    
+                        def check_routine(user_name, start_str, end_str):
+                            per_block, per_day = get_routine_adherence(user_name, parse_date(start_str), parse_date(end_str))
+                            chart = px.bar(per_day, x='date', y='adherence', range_y=[0, 1], title="Share of Planned Minutes Followed")
+                            per_block = per_block[['date', 'start_time', 'label', 'category', 'planned_minutes', 'covered_minutes', 'drift_minutes', 'missed']]
+                            return chart, per_day.round(2), per_block.round(1)
+                    
+                        load_routine_btn.click(load_routine, inputs=[user_name], outputs=[routine_table])
+                        save_routine_btn.click(save_routine, inputs=[user_name, routine_table], outputs=[routine_table, routine_status])
+                        check_routine_btn.click(check_routine, inputs=[user_name, routine_start, routine_end], outputs=[routine_chart, routine_days, routine_blocks_table])
+
+                    # Monthly Calendar Tab
+                    with gr.TabItem("Monthly Calendar"):
+                        gr.Markdown("## Monthly Time Allocation")
+                        with gr.Row():
+                            calendar_date = gr.Textbox(label="Select Month (YYYY-MM)", value=datetime.now().strftime("%Y-%m"))
+                            update_calendar_btn = gr.Button("Update Calendar")
+                        monthly_calendar = gr.DataFrame(label="Monthly Time Allocation")
+                        calendar_controls, calendar_status = table_controls(['date'])
+                    
+                        day_edit_form = gr.Group(visible=False)
+                        with day_edit_form:
+                            selected_date = gr.Textbox(label="Date")
+                            work_hours = gr.Number(label="Work Hours", minimum=0, maximum=24)
+                            life_hours = gr.Number(label="Life Hours", minimum=0, maximum=24)
+                            health_hours = gr.Number(label="Health Hours", minimum=0, maximum=24)
+                            sleep_hours = gr.Number(label="Sleep Hours", minimum=0, maximum=24)
+                            save_day_btn = gr.Button("Save")
+                    
+                        edit_buttons = gr.HTML()  # This will hold our edit buttons
+
+                        def open_day_edit_form(date):
+                            return gr.update(visible=True), gr.update(value=date)
+                    
+                        def save_day_data(user_name, date, work, life, health, sleep, month, *controls):
+                            try:
+                                save_day_activities(user_name, date, work, life, health, sleep)
+                            except ValueError as e:
+                                raise gr.Error(str(e))
+                            calendar_df, _, status, _ = update_monthly_calendar(user_name, month, *controls)
+                            return gr.update(visible=False), calendar_df, status
+                    
+                        save_day_btn.click(
+                            save_day_data,
+                            inputs=[user_name, selected_date, work_hours, life_hours, health_hours, sleep_hours, calendar_date] + calendar_controls,
+                            outputs=[day_edit_form, monthly_calendar, calendar_status]
+                        )
+                    
+                        def update_monthly_calendar(user_name, date, *controls):
+                            try:
+                                year, month = map(int, date.split('-'))
+                                if not 1 <= month <= 12:
+                                    raise ValueError(date)
+                            except ValueError:
+                                year, month = datetime.now().year, datetime.now().month
+                        
+                            # A month is at most 31 rows, so the cached grid is sorted, filtered and paged in memory
+                            calendar_df, buttons_html = get_calendar_month(user_name, year, month)
+                            calendar_df['date'] = calendar_df['date'].dt.strftime('%Y-%m-%d')
+                            page, sort_by, descending, filter_text = controls
+                            calendar_page, total = page_frame(calendar_df, page, sort_by=sort_by, descending=descending,
+                                                              filter_text=filter_text, filter_columns=['date'])
+                            return calendar_page, buttons_html, page_status(page, total), gr.update(choices=list(calendar_df.columns))
+                    
+                        update_calendar_btn.click(
+                            update_monthly_calendar,
+                            inputs=[user_name, calendar_date] + calendar_controls,
+                            outputs=[monthly_calendar, edit_buttons, calendar_status, calendar_controls[1]],
+                            api_name="update_calendar"
+                        )
+                        gr.on(
+                            control_events(calendar_controls),
+                            update_monthly_calendar,
+                            inputs=[user_name, calendar_date] + calendar_controls,
+                            outputs=[monthly_calendar, edit_buttons, calendar_status, calendar_controls[1]]
+                        )
+
+        # Event handlers and function definitions
+        # The date box defaults to "today"; store real dates so days sort and compare correctly
+        def show_activities(user_name, date, *controls):
+            return load_table("activities", user_name, *controls, date=parse_date(date).isoformat())
+
+        def log_and_display(user_name, date, category, subcategory, start_time, end_time, *controls):
+            try:
+                log_activity(user_name, parse_date(date).isoformat(), category, subcategory, start_time, end_time)
+            except ValueError as e:
+                raise gr.Error(str(e))
+            return show_activities(user_name, date, *controls)
+
+        def log_and_display_metrics(user_name, date, life_score, work_score, health_score, wake_up_time, workouts, meditation_minutes, brain_training_minutes):
+            date = parse_date(date).isoformat()
+            log_qualitative_metrics(user_name, date, life_score, work_score, health_score)
+            log_quantitative_metrics(user_name, date, wake_up_time, workouts, meditation_minutes, brain_training_minutes)
+            metrics = get_metrics(user_name, date)
+            return metrics, life_score, work_score, health_score, wake_up_time
+
+        def update_dashboard(user_name, date, *controls):
+            today_activities_data, total_acts, activities_page_status = show_activities(user_name, date, *controls)
+            date = parse_date(date).isoformat()
+            today_metrics_data = get_metrics(user_name, date)
+            weekly_pie_chart_data, weekly_line_chart_data, total_hours = get_weekly_summary(user_name)
         
-        line_chart = px.line(scores, x='date', y=['life_score', 'work_score', 'health_score'], title=f"{period} Score Trends")
+            # Calculate quick glance metrics
+            life_score = today_metrics_data['life_score'].values[0] if not today_metrics_data.empty else 0
+            work_score = today_metrics_data['work_score'].values[0] if not today_metrics_data.empty else 0
+            health_score = today_metrics_data['health_score'].values[0] if not today_metrics_data.empty else 0
+            wake_up = today_metrics_data['wake_up_time'].values[0] if not today_metrics_data.empty else ""
+            anomalies = get_anomalies(user_name, date)
+            first_night = (parse_date(date) - timedelta(days=SLEEP_PANEL_NIGHTS - 1)).isoformat()
+            nights, sleep_measures = get_sleep_analytics(user_name, first_night, date)
         
-        return pie_chart, line_chart, total_hours, breakdown_data
-
-
-    def set_new_goal(user_name, category, description, target, start_date, end_date):
-        set_goal(user_name, category, description, target, start_date, end_date)
-        return get_goals(user_name)
-
-    def load_user_settings(user_name):
-        settings = get_user_settings(user_name)
-        return settings[0], settings[1], settings[2], settings[3]
-
-    def save_user_settings(user_name, wake_time, w_weight, l_weight, h_weight):
-        update_user_settings(user_name, wake_time, w_weight, l_weight, h_weight)
-        return "Settings updated successfully"
-
-    def create_preset_template(preset_name):
-        if preset_name == "Rob Dyrdek":
-            return {
-                "default_wake_time": "05:00",
-                "work_weight": 1.0,
-                "life_weight": 1.0,
-                "health_weight": 1.0,
-                "categories": ["Work", "Life", "Health", "Sleep"],
-                "subcategories": {
-                    "Work": ["Drydek Machine", "Television", "Other"],
-                    "Life": ["Rob & Bre", "Kids", "Friends & Social", "Other"],
-                    "Health": ["Gym", "Meditation", "Personal Care", "Other"],
-                    "Sleep": []
+            return (today_activities_data, today_metrics_data, weekly_pie_chart_data, weekly_line_chart_data,
+                    life_score, work_score, health_score, wake_up, total_acts, anomalies, activities_page_status,
+                    sleep_chart(nights), sleep_measures)
+
+        def set_new_goal(user_name, category, description, target, start_date, end_date, *controls):
+            set_goal(user_name, category, description, target, start_date, end_date)
+            return show_goals(user_name, *controls)
+
+        def load_user_settings(user_name):
+            settings = get_user_settings(user_name)
+            return settings[0], settings[1], settings[2], settings[3]
+
+        def save_user_settings(user_name, wake_time, w_weight, l_weight, h_weight):
+            update_user_settings(user_name, wake_time, w_weight, l_weight, h_weight)
+            return "Settings updated successfully"
+
+        def create_preset_template(preset_name):
+            if preset_name == "Rob Dyrdek":
+                return {
+                    "default_wake_time": "05:00",
+                    "work_weight": 1.0,
+                    "life_weight": 1.0,
+                    "health_weight": 1.0,
+                    "categories": ["Work", "Life", "Health", "Sleep"],
+                    "subcategories": {
+                        "Work": ["Drydek Machine", "Television", "Other"],
+                        "Life": ["Rob & Bre", "Kids", "Friends & Social", "Other"],
+                        "Health": ["Gym", "Meditation", "Personal Care", "Other"],
+                        "Sleep": []
+                    }
                 }
-            }
-        elif preset_name == "Student":
-            return {
-                "default_wake_time": "07:00",
-                "work_weight": 1.2,
-                "life_weight": 0.8,
-                "health_weight": 1.0,
-                "categories": ["Study", "Life", "Health", "Sleep"],
-                "subcategories": {
-                    "Study": ["Classes", "Homework", "Research", "Other"],
-                    "Life": ["Family", "Friends", "Hobbies", "Other"],
-                    "Health": ["Exercise", "Meditation", "Personal Care", "Other"],
-                    "Sleep": []
+            elif preset_name == "Student":
+                return {
+                    "default_wake_time": "07:00",
+                    "work_weight": 1.2,
+                    "life_weight": 0.8,
+                    "health_weight": 1.0,
+                    "categories": ["Study", "Life", "Health", "Sleep"],
+                    "subcategories": {
+                        "Study": ["Classes", "Homework", "Research", "Other"],
+                        "Life": ["Family", "Friends", "Hobbies", "Other"],
+                        "Health": ["Exercise", "Meditation", "Personal Care", "Other"],
+                        "Sleep": []
+                    }
                 }
-            }
-        else:
-            # Return None or a default preset if the preset name is not recognized
-            return None
+            else:
+                # Return None or a default preset if the preset name is not recognized
+                return None
 
-    def update_settings_from_preset(preset_name):
-        if preset_name == "Custom":
-            return gr.update(), gr.update(), gr.update(), gr.update()
+        def update_settings_from_preset(preset_name):
+            if preset_name == "Custom":
+                return gr.update(), gr.update(), gr.update(), gr.update()
         
-        preset = create_preset_template(preset_name)
-        if preset is None:
-            return gr.update(), gr.update(), gr.update(), gr.update()
+            preset = create_preset_template(preset_name)
+            if preset is None:
+                return gr.update(), gr.update(), gr.update(), gr.update()
         
-        return (
-            gr.update(value=preset.get("default_wake_time", "")),
-            gr.update(value=preset.get("work_weight", 1.0)),
-            gr.update(value=preset.get("life_weight", 1.0)),
-            gr.update(value=preset.get("health_weight", 1.0))
-        )
+            return (
+                gr.update(value=preset.get("default_wake_time", "")),
+                gr.update(value=preset.get("work_weight", 1.0)),
+                gr.update(value=preset.get("life_weight", 1.0)),
+                gr.update(value=preset.get("health_weight", 1.0))
+            )
 
-    def finish_guided_setup(user_name, preset, wake_time, w_weight, l_weight, h_weight, categories, subcategories, initial_goal):
-        # Save user settings
-        update_user_settings(user_name, wake_time, w_weight, l_weight, h_weight)
+        def finish_guided_setup(user_name, preset, wake_time, w_weight, l_weight, h_weight, categories, subcategories, initial_goal):
+            # Save user settings
+            update_user_settings(user_name, wake_time, w_weight, l_weight, h_weight)
         
-        # Save categories and subcategories
-        save_custom_categories(user_name, categories, subcategories)
+            # Save categories and subcategories
+            save_custom_categories(user_name, categories, subcategories)
         
-        # Set initial goal
-        set_goal(user_name, "General", initial_goal, 100, datetime.now().date(), datetime.now().date() + timedelta(days=30))
+            # Set initial goal
+            set_goal(user_name, "General", initial_goal, 100, datetime.now().date(), datetime.now().date() + timedelta(days=30))
         
-        return "Setup completed successfully!"
+            return "Setup completed successfully!"
 
-    # Connect event handlers to UI components
-    log_activity_btn.click(log_and_display, inputs=[user_name, date, category, subcategory, start_time, end_time], outputs=[today_activities, total_activities])
-    log_metrics_btn.click(log_and_display_metrics, inputs=[user_name, date, life_score, work_score, health_score, wake_up_time, workouts, meditation_minutes, brain_training_minutes], outputs=[today_metrics, today_life_score, today_work_score, today_health_score, wake_up_time])
-    update_dashboard_btn.click(update_dashboard, inputs=[user_name, date], outputs=[today_activities, today_metrics, weekly_pie_chart, weekly_line_chart, today_life_score, today_work_score, today_health_score, wake_up_time, total_activities])
-    update_analysis_btn.click(update_analysis, inputs=[user_name, analysis_period], outputs=[analysis_pie_chart, analysis_line_chart, analysis_total_hours])
-    set_goal_btn.click(set_new_goal, inputs=[user_name, goal_category, goal_description, goal_target, goal_start_date, goal_end_date], outputs=[goals_table])
-    update_settings_btn.click(save_user_settings, inputs=[user_name, default_wake_time, work_weight, life_weight, health_weight], outputs=[gr.Textbox(label="Settings Status")])
-    preset_dropdown.change(update_settings_from_preset, inputs=[preset_dropdown], outputs=[default_wake_time, work_weight, life_weight, health_weight])
+        # Connect event handlers to UI components
+        log_activity_btn.click(log_and_display, inputs=[user_name, date, category, subcategory, start_time, end_time] + activities_controls, outputs=[today_activities, total_activities, activities_status], api_name="log_activity")
+        gr.on(control_events(activities_controls), show_activities, inputs=[user_name, date] + activities_controls, outputs=[today_activities, total_activities, activities_status])
+        log_metrics_btn.click(log_and_display_metrics, inputs=[user_name, date, life_score, work_score, health_score, wake_up_time, workouts, meditation_minutes, brain_training_minutes], outputs=[today_metrics, today_life_score, today_work_score, today_health_score, wake_up_time])
+        update_dashboard_btn.click(update_dashboard, inputs=[user_name, date] + activities_controls, outputs=[today_activities, today_metrics, weekly_pie_chart, weekly_line_chart, today_life_score, today_work_score, today_health_score, wake_up_time, total_activities, today_anomalies, activities_status, sleep_plot, sleep_summary], api_name="refresh_dashboard")
+        set_goal_btn.click(set_new_goal, inputs=[user_name, goal_category, goal_description, goal_target, goal_start_date, goal_end_date] + goals_controls, outputs=[goals_table, goals_status])
+        update_settings_btn.click(save_user_settings, inputs=[user_name, default_wake_time, work_weight, life_weight, health_weight], outputs=[gr.Textbox(label="Settings Status")])
+        preset_dropdown.change(update_settings_from_preset, inputs=[preset_dropdown], outputs=[default_wake_time, work_weight, life_weight, health_weight])
 
-    # Additional functions that might be needed
+        # Additional functions that might be needed
 
-    def save_custom_categories(user_name, categories, subcategories):
-        conn = create_connection()
-        cursor = conn.cursor()
+        def save_custom_categories(user_name, categories, subcategories):
+            conn = create_connection()
+            cursor = conn.cursor()
+            cursor.execute("SELECT id FROM users WHERE name = ?", (user_name,))
+            user_id = cursor.fetchone()[0]
         
-        # First, delete existing custom categories for the user
-        cursor.execute("DELETE FROM custom_categories WHERE user_id = (SELECT id FROM users WHERE name = ?)", (user_name,))
+            # First, clear the user's current selection. Rows stay, since logged activities reference them
+            cursor.execute("UPDATE categories SET position = NULL WHERE user_id = ?", (user_id,))
+            cursor.execute("UPDATE subcategories SET position = NULL WHERE user_id = ?", (user_id,))
         
-        # Insert new custom categories
-        for category in categories:
-            cursor.execute("""
-            INSERT INTO custom_categories (user_id, category_name, subcategories)
-            VALUES ((SELECT id FROM users WHERE name = ?), ?, ?)
-            """, (user_name, category, ','.join(subcategories.get(category, []))))
+            # Insert or reorder the selected categories and subcategories
+            for position, category in enumerate(categories):
+                cursor.execute("""
+                INSERT INTO categories (user_id, name, position) VALUES (?, ?, ?)
+                ON CONFLICT (user_id, name) DO UPDATE SET position = excluded.position
+                """, (user_id, category, position))
+                cursor.execute("SELECT id FROM categories WHERE user_id = ? AND name = ?", (user_id, category))
+                category_id = cursor.fetchone()[0]
+                for sub_position, subcategory in enumerate(subcategories.get(category, [])):
+                    cursor.execute("""
+                    INSERT INTO subcategories (user_id, category_id, name, position) VALUES (?, ?, ?, ?)
+                    ON CONFLICT (category_id, name) DO UPDATE SET position = excluded.position
+                    """, (user_id, category_id, subcategory, sub_position))
         
-        conn.commit()
-        conn.close()
+            _log_changes(cursor, user_name, "subcategories", "upsert")
+            _record_change(cursor, user_name, "categories", "upsert")
+            conn.commit()
+            conn.close()
+            invalidate_category_catalog(user_name)
 
-    def get_custom_categories(user_name):
-        conn = create_connection()
-        cursor = conn.cursor()
-        
-        cursor.execute("""
-        SELECT category_name, subcategories
-        FROM custom_categories
-        WHERE user_id = (SELECT id FROM users WHERE name = ?)
-        """, (user_name,))
-        
-        results = cursor.fetchall()
-        conn.close()
-        
-        categories = [row[0] for row in results]
-        subcategories = {row[0]: row[1].split(',') for row in results}
-        
-        return categories, subcategories
+        def get_custom_categories(user_name):
+            catalog = get_category_catalog(user_name)
+            return list(catalog["custom_categories"]), {
+                name: list(names) for name, names in catalog["custom_subcategories"].items()
+            }
 
-    # Add this function to update the category dropdown in the UI
-    def update_category_dropdown(user_name):
-        categories, _ = get_custom_categories(user_name)
-        return gr.update(choices=categories)
+        # Add this function to update the category dropdown in the UI
+        def update_category_dropdown(user_name):
+            categories, _ = get_custom_categories(user_name)
+            return gr.update(choices=categories)
 
-    # Connect the update_category_dropdown function to the user_name input
-    user_name.change(update_category_dropdown, inputs=[user_name], outputs=[category])
+        # Connect the update_category_dropdown function to the user_name input
+        user_name.change(update_category_dropdown, inputs=[user_name], outputs=[category])
 
-    # Add event handlers for adding and deleting user profiles
-    def add_user(new_name):
-        add_user_profile(new_name)
-        generate_placeholder_data(new_name)
-        return gr.update(choices=get_user_list(), value=new_name)
+        # Add event handlers for adding and deleting user profiles
+        def add_user(new_name):
+            add_user_profile(new_name)
+            generate_placeholder_data(new_name)
+            return gr.update(choices=get_user_list(), value=new_name)
 
-    def delete_user(name):
-        delete_user_profile(name)
-        return gr.update(choices=get_user_list(), value=get_user_list()[0] if get_user_list() else None)
+        def delete_user(name):
+            delete_user_profile(name)
+            return gr.update(choices=get_user_list(), value=get_user_list()[0] if get_user_list() else None)
 
-    add_user_btn.click(add_user, inputs=[new_user_name], outputs=[user_name])
-    delete_user_btn.click(delete_user, inputs=[user_name], outputs=[user_name])
+        add_user_btn.click(add_user, inputs=[new_user_name], outputs=[user_name])
+        delete_user_btn.click(delete_user, inputs=[user_name], outputs=[user_name])
 
-    # Function to get the list of users
-    def get_user_list():
-        conn = create_connection()
-        cursor = conn.cursor()
-        cursor.execute("SELECT name FROM users")
-        users = [row[0] for row in cursor.fetchall()]
-        if not users:
-            cursor.execute("INSERT INTO users (name) VALUES (?)", ("John Doe",))
-            conn.commit()
-            users = ["John Doe"]
-        conn.close()
-        return users
+        # Function to get the list of users
+        def get_user_list():
+            conn = create_connection()
+            cursor = conn.cursor()
+            cursor.execute("SELECT name FROM users")
+            users = [row[0] for row in cursor.fetchall()]
+            conn.close()
+            if not users:
+                try:
+                    add_user_profile("John Doe")
+                except sqlite3.IntegrityError:
+                    pass  # another session created it first
+                users = ["John Doe"]
+            return users
+
+        # Update the user_name dropdown when the interface loads
+        demo.load(lambda: gr.update(choices=get_user_list()), outputs=[user_name], api_name="load_users")
+    return demo
 
-    # Update the user_name dropdown when the interface loads
-    demo.load(lambda: gr.update(choices=get_user_list()), outputs=[user_name])
+def init():
+    # Create or migrate the database, then build the interface. Importing the module only
+    # defines the data layer, so report workers and scripts can use it without side effects.
+    create_tables()
+    return build_interface()
 
-    # Launch the application
+if __name__ == "__main__":
+    if {"--check-query-plans", "--update-query-plans"} & set(sys.argv[1:]):
+        sys.exit(check_query_plans(update="--update-query-plans" in sys.argv[1:]))
+    if "--check-metric-stats" in sys.argv[1:]:
+        sys.exit(check_metric_stats())
+    demo = init()
+    start_maintenance_thread()
+    start_report_scheduler()
+    start_warm_start()
     demo.launch()
\ No newline at end of file
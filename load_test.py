@@ -0,0 +1,226 @@
+"""Load test for the Life Tracking System.
+
+Launches app.py in a scratch directory (or targets a running app with --url) and drives the
+"Log Activity", "Refresh Dashboard", "Update Analysis" and "Update Calendar" events through
+gradio_client from many virtual users. Reports throughput, p50/p99 latency, queue wait and
+SQLite busy errors for each event type.
+
+    python load_test.py --users 200 --duration 60 --mix log_activity=4,refresh_dashboard=3,update_analysis=2,update_calendar=1
+"""
+import argparse
+import itertools
+import os
+import random
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+from datetime import datetime, timedelta
+
+import numpy as np
+from gradio_client import Client
+from gradio_client.utils import Status
+
+REPO_DIR = os.path.dirname(os.path.abspath(__file__))
+DEFAULT_MIX = "log_activity=4,refresh_dashboard=3,update_analysis=2,update_calendar=1"
+PROFILE_PREFIX = "loadtest"
+TABLE_CONTROLS = [1, None, False, ""]  # page, sort column, descending, filter
+BUSY_MESSAGES = ("database is locked", "database is busy")
+REJECTED_MESSAGES = ("overlaps",)  # log_activity refuses activities that overlap the user's existing ones
+SEEDED_DAYS = 31  # generate_placeholder_data fills today and the 30 days before it
+SLOT_MINUTES = 30  # each logged activity fits in its own slot and never crosses midnight
+
+SERVER_SCRIPT = """
+import sys
+sys.path.insert(0, {repo!r})
+import app
+demo = app.init()
+for index in range({profiles}):
+    name = f"{prefix}-{{index:03d}}"
+    if app.get_category_catalog(name)["user_id"] is None:
+        app.add_user_profile(name)
+        app.generate_placeholder_data(name)
+demo.queue(default_concurrency_limit={concurrency})
+demo.launch(server_name="127.0.0.1", server_port={port}, show_error=True)
+"""
+
+
+def free_slots(index, users, last_day):
+    # Virtual user i fills last_day - i, then last_day - i - users, and so on, so its activities
+    # overlap neither the seeded history nor another virtual user's
+    for step in itertools.count():
+        day, slot = divmod(step, 24 * 60 // SLOT_MINUTES)
+        yield last_day - timedelta(days=index + day * users), slot * SLOT_MINUTES
+
+
+def _log_activity_args(rng, user, slots):
+    day, start = next(slots)
+    end = start + rng.randrange(5, SLOT_MINUTES)
+    return (user, day.isoformat(), rng.choice(["Work", "Life", "Health", "Sleep"]), "Load Test",
+            f"{start // 60:02d}:{start % 60:02d}", f"{end // 60:02d}:{end % 60:02d}", *TABLE_CONTROLS)
+
+
+def _refresh_dashboard_args(rng, user, slots):
+    return (user, "today", *TABLE_CONTROLS)
+
+
+def _update_analysis_args(rng, user, slots):
+    return (user, rng.choice(["Weekly", "Monthly"]), *TABLE_CONTROLS)
+
+
+def _update_calendar_args(rng, user, slots):
+    month = datetime.now().year * 12 + datetime.now().month - 1 - rng.randrange(0, 3)
+    return (user, f"{month // 12}-{month % 12 + 1:02d}", *TABLE_CONTROLS)
+
+
+# api_name -> builder of the event's inputs, in the order the app declares them
+EVENTS = {
+    "log_activity": _log_activity_args,
+    "refresh_dashboard": _refresh_dashboard_args,
+    "update_analysis": _update_analysis_args,
+    "update_calendar": _update_calendar_args,
+}
+
+
+def parse_mix(mix):
+    weights = {}
+    for part in mix.split(','):
+        name, _, weight = part.partition('=')
+        name = name.strip()
+        if name not in EVENTS:
+            raise ValueError(f"Unknown event {name!r}; choose from {', '.join(EVENTS)}")
+        weights[name] = float(weight or 1)
+    return weights
+
+
+def launch_app(workdir, port, profiles, concurrency, timeout=120):
+    # Start the app in its own process so client threads do not compete with it for the GIL
+    os.makedirs(workdir, exist_ok=True)
+    script = SERVER_SCRIPT.format(repo=REPO_DIR, profiles=profiles, prefix=PROFILE_PREFIX, concurrency=concurrency, port=port)
+    server = subprocess.Popen([sys.executable, "-c", script], cwd=workdir,
+                              stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+    url = f"http://127.0.0.1:{port}/"
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        if server.poll() is not None:
+            raise RuntimeError(f"App exited with code {server.returncode} before accepting connections")
+        try:
+            Client(url, verbose=False)
+            return server, url
+        except Exception:
+            time.sleep(1)
+    server.terminate()
+    raise RuntimeError(f"App did not start within {timeout} seconds")
+
+
+def _queue_wait(job, submitted_at):
+    # Seconds from submission until the server reported the event as processing
+    updates = getattr(job.communicator, "updates", None)
+    while updates is not None and not updates.empty():
+        update = updates.get_nowait()
+        if getattr(update, "code", None) == Status.PROCESSING and update.time is not None:
+            return (update.time - submitted_at).total_seconds()
+    return None
+
+
+def virtual_user(index, url, profiles, weights, deadline, think_time, results, lock, seed, slots):
+    rng = random.Random(seed + index)
+    user = f"{PROFILE_PREFIX}-{index % profiles:03d}"
+    client = Client(url, verbose=False)
+    # Like a browser session, load the user list so the profile is a valid dropdown choice
+    client.predict(api_name="/load_users")
+    names, cumulative = list(weights), np.cumsum(list(weights.values()))
+
+    while time.monotonic() < deadline:
+        event = names[int(np.searchsorted(cumulative, rng.random() * cumulative[-1], side='right'))]
+        submitted_at = datetime.now()
+        started = time.perf_counter()
+        error = None
+        job = client.submit(*EVENTS[event](rng, user, slots), api_name=f"/{event}")
+        try:
+            job.result()
+        except Exception as e:
+            message = str(e).lower()
+            if any(busy in message for busy in BUSY_MESSAGES):
+                error = "busy"
+            elif any(rejected in message for rejected in REJECTED_MESSAGES):
+                error = "rejected"
+            else:
+                error = "error"
+        latency = time.perf_counter() - started
+        with lock:
+            results.append((event, latency, _queue_wait(job, submitted_at), error))
+        if think_time:
+            time.sleep(rng.expovariate(1 / think_time))
+
+
+def summarize(results, elapsed):
+    header = f"{'event':<18}{'requests':>9}{'ok':>7}{'req/s':>8}{'p50 ms':>9}{'p99 ms':>9}{'queue p50':>11}{'queue p99':>11}{'busy':>6}{'rejected':>10}{'errors':>8}"
+    lines = [header, '-' * len(header)]
+    for event in list(EVENTS) + ["all"]:
+        rows = [row for row in results if event == "all" or row[0] == event]
+        if not rows:
+            continue
+        latency = np.array([row[1] for row in rows]) * 1000
+        waits = np.array([row[2] for row in rows if row[2] is not None]) * 1000
+        queue = np.percentile(waits, [50, 99]) if len(waits) else [np.nan, np.nan]
+        ok = sum(row[3] is None for row in rows)
+        busy = sum(row[3] == "busy" for row in rows)
+        rejected = sum(row[3] == "rejected" for row in rows)
+        errors = sum(row[3] == "error" for row in rows)
+        p50, p99 = np.percentile(latency, [50, 99])
+        lines.append(f"{event:<18}{len(rows):>9}{ok:>7}{len(rows) / elapsed:>8.1f}{p50:>9.0f}{p99:>9.0f}"
+                     f"{queue[0]:>11.0f}{queue[1]:>11.0f}{busy:>6}{rejected:>10}{errors:>8}")
+    return '\n'.join(lines)
+
+
+def run_load_test(url, users, duration, weights, profiles, think_time=0.5, seed=0):
+    results = []
+    lock = threading.Lock()
+    deadline = time.monotonic() + duration
+    last_free_day = datetime.now().date() - timedelta(days=SEEDED_DAYS)
+    threads = [threading.Thread(target=virtual_user, args=(index, url, profiles, weights, deadline, think_time, results, lock, seed,
+                                                           free_slots(index, users, last_free_day)),
+                                name=f"virtual-user-{index}", daemon=True)
+               for index in range(users)]
+    started = time.monotonic()
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    return results, time.monotonic() - started
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Drive the Life Tracking System with concurrent virtual users.")
+    parser.add_argument("--url", help="Target a running app instead of launching one (profiles must already exist)")
+    parser.add_argument("--users", type=int, default=100, help="Number of virtual users")
+    parser.add_argument("--duration", type=float, default=60, help="Seconds to run")
+    parser.add_argument("--mix", default=DEFAULT_MIX, help="Comma-separated event=weight pairs")
+    parser.add_argument("--profiles", type=int, default=20, help="User profiles shared by the virtual users")
+    parser.add_argument("--think-time", type=float, default=0.5, help="Mean pause between a user's events, in seconds")
+    parser.add_argument("--concurrency", type=int, default=1, help="Queue concurrency limit per event for the launched app")
+    parser.add_argument("--port", type=int, default=7861)
+    parser.add_argument("--workdir", help="Directory for the launched app's database (default: a temporary directory)")
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args(argv)
+
+    weights = parse_mix(args.mix)
+    server = None
+    url = args.url
+    if url is None:
+        workdir = args.workdir or tempfile.mkdtemp(prefix="life_tracker_load_")
+        server, url = launch_app(workdir, args.port, args.profiles, args.concurrency)
+    try:
+        results, elapsed = run_load_test(url, args.users, args.duration, weights, args.profiles, args.think_time, args.seed)
+    finally:
+        if server is not None:
+            server.terminate()
+            server.wait()
+    print(f"{args.users} virtual users, {elapsed:.1f}s, {len(results)} requests")
+    print(summarize(results, elapsed))
+
+
+if __name__ == "__main__":
+    main()